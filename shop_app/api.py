@@ -0,0 +1,233 @@
+# Batch product JSON API: many ids (or a filter) per call, column projection, streamed output
+import json
+from itertools import islice
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import load_only
+
+from extensions import db
+from models import PRODUCT_FIELDS, Product
+from money import cents, json_default, to_decimal
+from pagination import encode_cursor, keyset_after, keyset_before
+import search
+
+# Sort keys of the admin product table. Paging appends the id, so every order is total
+# and a keyset cursor is always (sort value, id); price sorts on its integer cents.
+SORTS = {
+    'id': Product.id,
+    'name': Product.name,
+    'price': cents(Product.price),
+    'stock': func.coalesce(Product.stock, 0),
+}
+
+
+class ApiError(ValueError):
+    pass
+
+
+def parse_fields(raw):
+    """``'name,price'`` or ``['name', 'price']`` -> ordered tuple of columns to load (``id`` always included)."""
+    if not raw:
+        return PRODUCT_FIELDS
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    elif not isinstance(raw, (list, tuple)) or not all(isinstance(field, str) for field in raw):
+        raise ApiError('"fields" must be a list of names or a comma-separated string.')
+    fields = ['id']
+    for field in (f.strip() for f in raw):
+        if not field:
+            continue
+        if field not in PRODUCT_FIELDS:
+            raise ApiError(f'Unknown field "{field}". Allowed: {", ".join(PRODUCT_FIELDS)}.')
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+def parse_ids(raw, max_ids):
+    """``'1,2,3'`` or ``[1, 2, 3]`` -> list of unique ints in request order."""
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(',') if part.strip()]
+    if not isinstance(raw, list):
+        raise ApiError('"ids" must be a list or a comma-separated string.')
+    try:
+        # int() would also take 1.5 or true; only whole numbers, or strings of one, are ids
+        if any(isinstance(value, bool) or not isinstance(value, (int, str)) for value in raw):
+            raise TypeError
+        ids = list(dict.fromkeys(int(value) for value in raw))
+    except (TypeError, ValueError):
+        raise ApiError('"ids" must contain only integers.')
+    if len(ids) > max_ids:
+        raise ApiError(f'At most {max_ids} ids per request.')
+    return ids
+
+
+def parse_limit(raw):
+    """Optional row limit of a filtered call; ``None`` when absent."""
+    if raw is None or raw == '':
+        return None
+    try:
+        if isinstance(raw, bool) or not isinstance(raw, (int, str)):
+            raise TypeError
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise ApiError('"limit" must be a whole number.')
+    if limit < 0:
+        raise ApiError('"limit" cannot be negative.')
+    return limit
+
+
+def parse_filters(args):
+    """Build WHERE clauses from ``in_stock``, ``min_price``, ``max_price``, ``min_stock``, ``max_stock``, ``name``
+    (a prefix) and ``q`` (full-text search)."""
+    clauses = []
+    try:
+        if args.get('in_stock') in ('1', 'true', True):
+            clauses.append(Product.stock > 0)
+        if args.get('min_price') not in (None, ''):
+            clauses.append(Product.price >= to_decimal(args['min_price']))
+        if args.get('max_price') not in (None, ''):
+            clauses.append(Product.price <= to_decimal(args['max_price']))
+        if args.get('min_stock') not in (None, ''):
+            clauses.append(Product.stock >= int(args['min_stock']))
+        if args.get('max_stock') not in (None, ''):
+            clauses.append(Product.stock <= int(args['max_stock']))
+    except (TypeError, ValueError):
+        raise ApiError('Numeric filters must be numbers.')
+    if args.get('name'):
+        prefix = str(args['name']).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append(Product.name.like(f'{prefix}%', escape='\\'))
+    if args.get('q'):
+        match = search.match_clause(str(args['q']))
+        if match is not None:
+            clauses.append(match)
+    return clauses
+
+
+def _columns(fields):
+    return [getattr(Product, field) for field in fields]
+
+
+def iter_by_ids(ids, fields, batch_size, missing):
+    """Yield projected rows for ``ids`` in request order, one ``IN`` query per batch.
+
+    Ids that do not exist are appended to ``missing``.
+    """
+    ids = iter(ids)
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            break
+        found = {row.id: row for row in db.session.execute(
+            select(*_columns(fields)).where(Product.id.in_(batch)))}
+        for product_id in batch:
+            if product_id in found:
+                yield found[product_id]
+            else:
+                missing.append(product_id)
+
+
+def iter_matching(clauses, fields, batch_size, limit=None):
+    """Yield projected rows matching ``clauses`` in id order, fetched in keyset batches."""
+    last_id, sent = 0, 0
+    while limit is None or sent < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sent)
+        batch = db.session.execute(
+            select(*_columns(fields)).where(Product.id > last_id, *clauses).order_by(Product.id).limit(size)
+        ).all()
+        if not batch:
+            break
+        yield from batch
+        if len(batch) < size:
+            break  # a short batch was the last one; no need to ask for an empty one
+        sent += len(batch)
+        last_id = batch[-1].id
+
+
+def stream_json(rows, missing=None, rows_per_chunk=200):
+    """Serialise ``rows`` as ``{"products": [...], "missing": [...]}`` without building it in memory."""
+    parts = ['{"products":[']
+    for i, row in enumerate(rows):
+        parts.append(('' if i == 0 else ',') + json.dumps(dict(row._mapping), ensure_ascii=False, default=json_default))
+        if len(parts) >= rows_per_chunk:
+            yield ''.join(parts)
+            parts = []
+    # ``missing`` is filled in while ``rows`` is consumed, so it is only complete here
+    parts.append('],"missing":' + json.dumps(missing or []) + '}')
+    yield ''.join(parts)
+
+
+def parse_sort(raw):
+    """``'price'`` or ``'-price'`` (descending) -> ``(key, descending)``; defaults to name."""
+    raw = (raw or 'name').strip()
+    key = raw.lstrip('-')
+    if key not in SORTS:
+        raise ApiError(f'Unknown sort "{key}". Allowed: {", ".join(SORTS)}.')
+    return key, raw.startswith('-')
+
+
+def _table_query(fields, clauses, sort, descending, after):
+    # Product entities with only ``fields`` loaded, plus the sort value for the next cursor
+    columns = (SORTS[sort], Product.id)
+    query = select(Product).options(load_only(*_columns(fields))) \
+        .add_columns(SORTS[sort].label('sort_key')).where(*clauses)
+    if after is not None:
+        query = query.where((keyset_before if descending else keyset_after)(columns, after))
+    return query.order_by(*(column.desc() if descending else column for column in columns))
+
+
+def _as_dict(product, fields):
+    return {field: getattr(product, field) for field in fields}
+
+
+def table_page(fields, clauses, sort, descending, limit, offset=0, after=None):
+    """One page of the admin product table.
+
+    ``after`` (a decoded cursor) continues from the previous page with a keyset
+    range scan; ``offset`` jumps anywhere, e.g. when a virtual scrollbar is
+    dragged, at the cost of skipping rows. ``total`` is only counted for the
+    first request of a listing (no cursor).
+    """
+    rows = db.session.execute(
+        _table_query(fields, clauses, sort, descending, after).offset(0 if after else offset).limit(limit + 1)
+    ).all()
+    page = rows[:limit]
+    return {
+        'products': [_as_dict(row.Product, fields) for row in page],
+        'next_cursor': encode_cursor((page[-1].sort_key, page[-1].Product.id)) if len(rows) > limit else None,
+        'total': None if after else db.session.scalar(select(func.count(Product.id)).where(*clauses)),
+    }
+
+
+def iter_table(fields, clauses, sort, descending, batch_size, offset=0, limit=None, after=None):
+    """Yield the matching products in table order as dicts of ``fields``, in keyset batches.
+
+    Only one batch is in memory at a time, and the read transaction ends between
+    batches so a long stream never pins one snapshot.
+    """
+    sent = 0
+    while limit is None or sent < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sent)
+        query = _table_query(fields, clauses, sort, descending, after).limit(size)
+        if after is None and offset:
+            query = query.offset(offset)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        for row in rows:
+            yield _as_dict(row.Product, fields)
+        sent += len(rows)
+        after = (rows[-1].sort_key, rows[-1].Product.id)
+        db.session.rollback()
+
+
+def stream_ndjson(rows, rows_per_chunk=200):
+    """Serialise ``rows`` as one JSON object per line, a chunk of lines at a time."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=json_default) + '\n')
+        if len(lines) >= rows_per_chunk:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
@@ -1,22 +1,137 @@
-# Main application file
+# Main application file: create_app() builds and configures the Flask app
+import os
+from datetime import datetime, timedelta
+
+import click
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from markupsafe import Markup, escape
+
+import database
+from extensions import db, page_cache
+from money import MoneyJSONProvider
+
+
+def create_app(config=None):
+    """Build the shop app. ``config`` (a mapping) overrides the defaults below.
+
+    Importing this module only pulls in Flask and SQLAlchemy; models, routes and
+    CLI commands are imported here, and Flask-Migrate (Alembic) only when the
+    app is loaded by the ``flask`` command, which is the only place it is used.
+    """
+    app = Flask(__name__)
+    app.json = MoneyJSONProvider(app) # Decimal amounts as JSON numbers
+    app.config['SQLALCHEMY_DATABASE_URI'] = database.database_uri() # DATABASE_URL, SQLite por defecto
+    app.config['SQLITE_PRAGMAS'] = database.sqlite_pragmas() # WAL, busy_timeout, mmap... (SQLITE_PRAGMAS)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') # Sin SECRET_KEY se genera una en instance/secret_key
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'database') # 'database', 'file' o 'modulo:Clase'
+    app.config['SESSION_FILE'] = os.environ.get('SESSION_FILE') # Con 'file'; None = instance/sessions.db
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=14) # Vence tras 14 días sin visitas (expiración deslizante)
+    app.config['SESSION_TOUCH_INTERVAL'] = 3600 # Segundos entre escrituras que solo alargan la expiración
+    app.config['SESSION_PURGE_INTERVAL'] = int(os.environ.get('SESSION_PURGE_INTERVAL', 0)) # 0 = usar `flask purge-sessions`
+    app.config['CART_MAX_LINES'] = 100 # Productos distintos por carrito
+    app.config['CART_MAX_QUANTITY'] = 99 # Unidades por producto
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1' # o 'pbkdf2:sha256:600000'; los hashes antiguos se renuevan al iniciar sesión
+    app.config['PASSWORD_HASH_WORKERS'] = 2 # Hilos que calculan hashes a la vez
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10 # Segundos
+    app.config['LOGIN_LIMIT_PER_IP'] = (20, 300) # Intentos fallidos por IP en la ventana (segundos)
+    app.config['LOGIN_LIMIT_PER_USER'] = (5, 300) # Intentos fallidos por usuario en la ventana
+    app.config['LOGIN_LIMIT_MAX_KEYS'] = 10000 # IPs y usuarios recordados en memoria
+    app.config['LOGIN_LIMIT_DB'] = os.environ.get('LOGIN_LIMIT_DB') # Archivo SQLite para compartir los límites entre workers
+    app.config['SHOP_PAGE_SIZE'] = 24 # Productos por página en la tienda
+    app.config['SHOP_MAX_PAGE_SIZE'] = 100 # Límite para ?per_page=
+    app.config['PAGE_CACHE_MAX_ENTRIES'] = 512 # Páginas públicas cacheadas (LRU)
+    app.config['PAGE_CACHE_TTL'] = 300 # Segundos
+    app.config['PRODUCT_CACHE_ENABLED'] = True # Caché de productos para las vistas de solo lectura, ver repository.py
+    app.config['PRODUCT_CACHE_MAX_ENTRIES'] = 2048 # Productos en memoria por proceso (LRU)
+    app.config['PRODUCT_CACHE_TTL'] = 300 # Segundos; sin PRODUCT_CACHE_DB, lo más que otro worker tarda en ver un cambio
+    app.config['PRODUCT_CACHE_DB'] = os.environ.get('PRODUCT_CACHE_DB') # Archivo SQLite compartido entre workers (opcional)
+    app.config['PRODUCT_CACHE_SYNC_INTERVAL'] = 1.0 # Segundos entre lecturas de las invalidaciones de otros workers
+    app.config['ADMIN_PAGE_SIZE'] = 50 # Filas por página en la tabla de productos del admin
+    app.config['ADMIN_MAX_PAGE_SIZE'] = 500 # Límite para ?limit= en /admin/products/data
+    app.config['API_BATCH_SIZE'] = 500 # Ids por consulta IN en /admin/api/products
+    app.config['API_MAX_IDS'] = 10000 # Ids aceptados por llamada
+    app.config['SEARCH_PAGE_SIZE'] = 20 # Resultados por página en /search
+    app.config['SEARCH_MAX_PAGE'] = 50 # Páginas de /search; más allá es un 400 (cada página recorre el OFFSET entero)
+    app.config['INSTRUMENTATION_ENABLED'] = os.environ.get('SHOP_INSTRUMENTATION') == '1' # Server-Timing y /admin/metrics
+    app.config['N_PLUS_ONE_THRESHOLD'] = 20 # Consultas SQL por request antes de avisar
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') # Bearer token opcional para Prometheus
+    app.config['IMAGE_MAX_BYTES'] = 10 * 1024 * 1024
+    app.config['IMAGE_SOURCE_DIR'] = os.environ.get('IMAGE_SOURCE_DIR') # Carpeta local desde la que se aceptan rutas de imagen
+    app.config['RESERVATION_TTL'] = 15 * 60 # Segundos que una reserva retiene el stock
+    app.config['RESERVATION_SWEEP_INTERVAL'] = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 0)) # 0 = usar `flask sweep-reservations`
+    app.config['TASK_MAX_ATTEMPTS'] = 5 # Intentos antes de dar una tarea por fallida
+    app.config['TASK_BACKOFF'] = 10 # Segundos antes del primer reintento; se duplica en cada uno
+    app.config['TASK_BACKOFF_MAX'] = 3600 # Tope de la espera entre reintentos
+    app.config['TASK_LEASE'] = 600 # Segundos que un worker retiene una tarea antes de que otro la retome
+    app.config['TASK_POLL_INTERVAL'] = 1.0 # Segundos entre consultas con la cola vacía
+    app.config['TASK_RETENTION'] = 7 * 24 * 3600 # Segundos que se guardan las tareas terminadas
+    app.config['PRICING_DEFAULT_MARGIN'] = 45 # % de ganancia si el producto no tiene margen propio (el 1.45 de js/actualizar-precios.js)
+    app.config['PRICING_ROUNDING'] = 'ceil' # 'ceil' = sol entero hacia arriba, 'cent' = dos decimales
+    app.config['FX_PROVIDER'] = os.environ.get('FX_PROVIDER', 'sunat') # 'sunat', 'static' o 'modulo:Clase'
+    app.config['FX_STATIC_RATES'] = {} # p. ej. {'USD': 3.75} con FX_PROVIDER='static'
+    app.config['FX_FALLBACK_RATES'] = {'USD': 3.8} # Sin proveedor ni caché, como js/actualizar-precios.js
+    app.config['FX_CACHE_FILE'] = None # None = instance/fx_rates.json
+    app.config['FX_CACHE_TTL'] = 3600 # Segundos entre consultas al proveedor
+    app.config['FX_TIMEOUT'] = 5 # Segundos
+    if config:
+        app.config.from_mapping(config)
+    # Pool options depend on the final URI (tests pass sqlite:///:memory:)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database.engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # --- EXTENSIONES ---
+    db.init_app(app)
+    database.init_engines(app, db)
+    page_cache.init_app(app)
+    from auth import init_auth, instance_secret_key
+    init_auth(app)
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = instance_secret_key(app)
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db, include_object=database.include_object)
+
+    from instrumentation import init_instrumentation
+    init_instrumentation(app, db)
+
+    # --- PLANTILLAS ---
+    @app.context_processor
+    def inject_current_year():
+        return {'current_year': datetime.now().year}
+
+    @app.template_filter('nl2br')
+    def nl2br(value):
+        return Markup('<br>\n').join(escape(value).split('\n'))
+
+    # --- BLUEPRINTS Y COMANDOS ---
+    import models # noqa: F401  (registers the tables on db.metadata)
+    import history # noqa: F401  (records product changes in product_history)
+    from session_store import init_sessions
+    init_sessions(app)
+    from repository import product_repository
+    product_repository.init_app(app)
+    import routes
+    app.register_blueprint(routes.admin_bp)
+    app.register_blueprint(routes.shop_bp)
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///shop.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'super-secret-key' # ¡Cambia esto por una clave segura y aleatoria en producción!
+    # Far-future caching for the generated product images
+    import images
+    images.init_images(app)
 
+    # CLI commands (flask import-products, flask export-products, ...)
+    import cli
+    for command in cli.COMMANDS:
+        app.cli.add_command(command)
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+    if app.config['RESERVATION_SWEEP_INTERVAL'] > 0:
+        import inventory
+        inventory.start_sweeper(app, app.config['RESERVATION_SWEEP_INTERVAL'])
+    if app.config['SESSION_PURGE_INTERVAL'] > 0:
+        import session_store
+        session_store.start_purger(app, app.config['SESSION_PURGE_INTERVAL'])
 
-# Import models here so that Flask-Migrate can see them
-import models
+    return app
 
-# Import routes after db initialization to avoid circular imports
-import routes
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
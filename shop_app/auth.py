@@ -0,0 +1,138 @@
+# Admin credentials: salted scrypt/PBKDF2 hashes checked in a small thread pool, and login attempt limits
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from extensions import db
+from models import User
+from ratelimit import SQLiteSlidingWindowLimiter, SlidingWindowLimiter
+
+_executor = None
+_executor_lock = threading.Lock()
+_dummy_hashes = {}  # method -> hash checked for unknown users, so they take as long as known ones
+
+
+class HashingBusy(RuntimeError):
+    """The hashing pool did not get to a password within ``PASSWORD_HASH_TIMEOUT`` seconds."""
+
+
+class TooManyAttempts(RuntimeError):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many failed logins; retry in {retry_after:.0f} seconds')
+        self.retry_after = retry_after
+
+
+def init_auth(app):
+    """Set up the login limiters: ``LOGIN_LIMIT_PER_IP`` and ``LOGIN_LIMIT_PER_USER``, shared through
+    ``LOGIN_LIMIT_DB`` (an SQLite file) when it is set."""
+    limiters = {}
+    for scope, config_key in (('ip', 'LOGIN_LIMIT_PER_IP'), ('user', 'LOGIN_LIMIT_PER_USER')):
+        limit, window = app.config[config_key]
+        if app.config['LOGIN_LIMIT_DB']:
+            limiters[scope] = SQLiteSlidingWindowLimiter(limit, window, app.config['LOGIN_LIMIT_DB'])
+        else:
+            limiters[scope] = SlidingWindowLimiter(limit, window, max_keys=app.config['LOGIN_LIMIT_MAX_KEYS'])
+    app.extensions['login_limiters'] = limiters
+
+
+def instance_secret_key(app):
+    """The key in ``instance/secret_key``, created on first use; every worker of this instance reads the same one."""
+    path = os.path.join(app.instance_path, 'secret_key')
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    os.makedirs(app.instance_path, exist_ok=True)
+    tmp = f'{path}.tmp{os.getpid()}'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secrets.token_hex(32))
+    try:
+        os.link(tmp, path)  # fails if another worker got there first; then its key wins
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _pool(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                           thread_name_prefix='password-hash')
+        return _executor
+
+
+def _run(app, fn, *args):
+    # hashlib's scrypt and PBKDF2 release the GIL, so request threads keep running while
+    # the pool hashes; the pool size caps how many cores a login flood can take
+    future = _pool(app).submit(fn, *args)
+    try:
+        return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except FutureTimeoutError:
+        future.cancel()  # still queued behind a flood: drop it rather than hash for nobody
+        raise HashingBusy('Password hashing is overloaded')
+
+
+def hash_password(app, password):
+    """A salted hash of ``password`` with ``PASSWORD_HASH_METHOD``, e.g. ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``."""
+    return _run(app, generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+
+def _limit_keys(ip, username):
+    return (('ip', f'ip:{ip}'), ('user', f'user:{username.lower()}'))
+
+
+def _claim_attempt(app, ip, username):
+    """Count a login attempt against both limits before any hashing; raises ``TooManyAttempts`` if either is spent.
+
+    Counting first (rather than once a password turned out wrong) is what stops
+    a burst of concurrent attempts from all passing the check while the first
+    ones are still being hashed.
+    """
+    limiters = app.extensions['login_limiters']
+    claimed = []
+    for scope, key in _limit_keys(ip, username):
+        wait = limiters[scope].acquire(key)
+        if wait:
+            for claimed_scope, claimed_key in claimed:
+                limiters[claimed_scope].release(claimed_key)
+            raise TooManyAttempts(wait)
+        claimed.append((scope, key))
+
+
+def authenticate(app, ip, username, password):
+    """The admin ``User`` with these credentials, or ``None``.
+
+    Every attempt counts towards the login limits; a successful one is taken
+    back and clears the user's failures. Raises ``TooManyAttempts``, without
+    hashing, once a limit is reached, and ``HashingBusy`` when the hashing pool
+    is too backed up to answer (the attempt stays counted).
+
+    Hashes made with an older ``PASSWORD_HASH_METHOD`` are replaced on a
+    successful login, so raising the cost takes effect as admins log in.
+    """
+    _claim_attempt(app, ip, username)
+    user = User.query.filter_by(username=username).first() if username else None
+    method = app.config['PASSWORD_HASH_METHOD']
+    if user is None or not user.is_admin:
+        if method not in _dummy_hashes:
+            _dummy_hashes[method] = hash_password(app, 'not the password')
+        _run(app, check_password_hash, _dummy_hashes[method], password)
+        return None
+    if not _run(app, check_password_hash, user.password_hash, password):
+        return None
+    limiters = app.extensions['login_limiters']
+    limiters['ip'].release(f'ip:{ip}')
+    limiters['user'].reset(f'user:{username.lower()}')
+    if not user.password_hash.startswith(method + '$'):
+        user.password_hash = hash_password(app, password)
+        db.session.commit()
+    return user
@@ -0,0 +1,79 @@
+"""Startup cost of a worker: import time of the app module and of create_app().
+
+Runs ``python -X importtime`` in fresh subprocesses, so every run pays the
+full import cost a pre-fork worker pays, and reports the median over
+``--runs``. Exits with status 1 when the median exceeds ``--budget-ms``, so
+it can guard against a heavy import sneaking back into the startup path.
+
+    python benchmarks/import_time.py --runs 5 --budget-ms 800
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy modules that only specific code paths need; none should load at startup
+DEFERRED_MODULES = ('flask_migrate', 'alembic', 'PIL')
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+built = time.perf_counter()
+print(imported - start, built - imported)
+print(','.join(m for m in %r if m in sys.modules))
+""" % (DEFERRED_MODULES,)
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def measure():
+    """One fresh interpreter: seconds to import app and to build the app, top-level import costs, deferred modules loaded."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE],
+        cwd=APP_DIR, check=True, capture_output=True, text=True,
+    )
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match and len(match.group(3)) <= 2:  # modules imported by the probe and by app itself
+            top_level[match.group(4)] = int(match.group(2)) / 1e6
+    timings, loaded = result.stdout.splitlines()[:2]
+    import_seconds, build_seconds = map(float, timings.split())
+    return import_seconds, build_seconds, top_level, [m for m in loaded.split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=800.0,
+                        help='Maximum median time to import app and run create_app().')
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list.')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    import_ms = statistics.median(r[0] for r in runs) * 1000
+    build_ms = statistics.median(r[1] for r in runs) * 1000
+    slowest = sorted(runs[-1][2].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    report = {
+        'import_app_ms': round(import_ms, 1),
+        'create_app_ms': round(build_ms, 1),
+        'total_ms': round(import_ms + build_ms, 1),
+        'budget_ms': args.budget_ms,
+        'deferred_modules_loaded': runs[-1][3],
+        'slowest_imports_ms': {name: round(seconds * 1000, 1) for name, seconds in slowest},
+    }
+    print(json.dumps(report, indent=2))
+    if import_ms + build_ms > args.budget_ms or report['deferred_modules_loaded']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
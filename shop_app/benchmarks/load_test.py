@@ -0,0 +1,317 @@
+"""Latency and throughput of the shop and admin routes on a seeded catalogue.
+
+For every catalogue size a fresh subprocess seeds a temporary SQLite
+database, then drives the storefront listing and product pages, the admin
+JSON view and the admin create/update/delete routes, first through Flask's
+test client (application cost only) and then over HTTP against a threaded
+WSGI server (adds the server and socket overhead). Each scenario reports
+p50/p95/p99 latency, requests per second and errors; each size reports the
+peak RSS of its process. Results are written as JSON, and ``--compare``
+prints the change against an earlier results file.
+
+    python benchmarks/load_test.py --sizes 1000,10000,100000 --output bench.json
+    python benchmarks/load_test.py --sizes 10000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (route, expected status) in run order; create -> update -> delete work on the same new products
+SCENARIOS = (
+    ('shop.list_products', 200),
+    ('shop.view_product', 200),
+    ('admin.get_product_json', 200),
+    ('admin.create_product', 302),
+    ('admin.update_product', 302),
+    ('admin.delete_product', 302),
+)
+
+WORDS = ('laptop', 'monitor', 'teclado', 'ratón', 'cámara', 'impresora', 'router', 'disco', 'memoria',
+         'procesador', 'auriculares', 'altavoz', 'cable', 'cargador', 'tablet', 'móvil', 'funda', 'soporte')
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+# --- PROCESO HIJO: UN TAMAÑO DE CATÁLOGO ---
+
+def seed(db, Product, size, rng):
+    rows = []
+    for i in range(size):
+        words = rng.sample(WORDS, 3)
+        rows.append({
+            'name': f'{words[0].capitalize()} {words[1]} {i:06d}',
+            'description': ' '.join(rng.choice(WORDS) for _ in range(30)),
+            'price': round(rng.uniform(5, 2000), 2),
+            'stock': rng.choice((0, 1, 2, 5, 10, 50)),
+        })
+        if len(rows) == 5000:
+            db.session.execute(Product.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Product.__table__.insert(), rows)
+    db.session.commit()
+
+
+def build_requests(name, count, rng, ids, cursors, created):
+    """The (path, form) pairs of one scenario."""
+    if name == 'shop.list_products':
+        return [(f'/products?after={rng.choice(cursors)}', None) for _ in range(count)]
+    if name == 'shop.view_product':
+        return [(f'/products/{rng.choice(ids)}', None) for _ in range(count)]
+    if name == 'admin.get_product_json':
+        return [(f'/admin/products/{rng.choice(ids)}/json', None) for _ in range(count)]
+    if name == 'admin.create_product':
+        return [('/admin/products', {'name': f'Bench product {i}', 'description': 'Created by the load test',
+                                     'price': '19.99', 'stock': '3'}) for i in range(count)]
+    if name == 'admin.update_product':
+        return [(f'/admin/products/{pid}/edit', {'name': f'Bench product {pid} v2', 'description': 'Updated',
+                                                 'price': '24.99', 'stock': '4'}) for pid in created]
+    if name == 'admin.delete_product':
+        return [(f'/admin/products/{pid}/delete', {}) for pid in created]
+    raise ValueError(name)
+
+
+def run_load(send, requests, concurrency, expected):
+    """Spread ``requests`` over ``concurrency`` threads; ``send(worker, path, form)`` returns a status code."""
+    import threading
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    chunks = [requests[i::concurrency] for i in range(concurrency)]
+
+    def worker(index):
+        local, failed = [], 0
+        for path, form in chunks[index]:
+            start = time.perf_counter()
+            try:
+                status = send(index, path, form)
+            except Exception:
+                status = None
+            local.append(time.perf_counter() - start)
+            if status != expected:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def client_sender(app, session_cookie, concurrency):
+    clients = []
+    for _ in range(concurrency):
+        client = app.test_client()
+        client.set_cookie('session', session_cookie)
+        clients.append(client)
+
+    def send(index, path, form):
+        client = clients[index]
+        response = client.get(path) if form is None else client.post(path, data=form)
+        response.close()
+        return response.status_code
+    return send
+
+
+def server_sender(port, session_cookie):
+    import http.client
+    from urllib.parse import urlencode
+
+    headers = {'Cookie': f'session={session_cookie}'}
+
+    def send(index, path, form):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            if form is None:
+                connection.request('GET', path, headers=headers)
+            else:
+                connection.request('POST', path, body=urlencode(form),
+                                   headers=dict(headers, **{'Content-Type': 'application/x-www-form-urlencoded'}))
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+    return send
+
+
+def run_size(args):
+    import logging
+    import random
+    import threading
+
+    sys.path.insert(0, APP_DIR)
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from extensions import db
+    from models import Product
+    from pagination import encode_cursor
+
+    workdir = tempfile.mkdtemp(prefix='shop-load-')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "bench.db")}',
+        'PAGE_CACHE_ENABLED': args.page_cache,
+        'INSTRUMENTATION_ENABLED': False,
+        'RESERVATION_SWEEP_INTERVAL': 0,
+    })
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        seed(db, Product, args.size, rng)
+        in_stock = Product.query.filter(Product.stock > 0).with_entities(Product.id, Product.name).all()
+    seed_seconds = time.perf_counter() - started
+    ids = [row.id for row in in_stock]
+    cursors = [encode_cursor((row.name, row.id)) for row in rng.sample(in_stock, min(len(in_stock), 1000))]
+
+    # An admin session cookie, signed by the app, shared by every worker
+    with app.test_client() as client:
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        session_cookie = client.get_cookie('session').value
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {'size': args.size, 'seed_seconds': round(seed_seconds, 2), 'modes': {}}
+    senders = {'test_client': client_sender(app, session_cookie, args.concurrency),
+               'wsgi_server': server_sender(server.server_port, session_cookie)}
+    for mode in args.modes:
+        send = senders[mode]
+        scenarios = results['modes'][mode] = {}
+        for name, expected in SCENARIOS:
+            if name.startswith('admin.create'):
+                with app.app_context():
+                    before = db.session.scalar(db.select(db.func.max(Product.id)))
+            created = []
+            if name in ('admin.update_product', 'admin.delete_product'):
+                with app.app_context():
+                    created = db.session.scalars(db.select(Product.id).where(Product.id > before)).all()
+            requests = build_requests(name, args.requests, rng, ids, cursors, created)
+            scenarios[name] = run_load(send, requests, args.concurrency, expected)
+    server.shutdown()
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(results))
+
+
+# --- PROCESO PRINCIPAL ---
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Print p95 and RPS changes of ``current`` against ``baseline`` (both results documents)."""
+    print(f'{"size":>7} {"mode":<12} {"scenario":<24} {"p95 ms":>17} {"rps":>17}')
+    for size, result in current['results'].items():
+        old_result = baseline['results'].get(size)
+        if old_result is None:
+            continue
+        for mode, scenarios in result['modes'].items():
+            for name, stats in scenarios.items():
+                old = old_result['modes'].get(mode, {}).get(name)
+                if not old:
+                    continue
+                p95 = f'{old["p95_ms"]:.2f} -> {stats["p95_ms"]:.2f}'
+                rps = f'{old["rps"]:.0f} -> {stats["rps"]:.0f}'
+                print(f'{size:>7} {mode:<12} {name:<24} {p95:>17} {rps:>17}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated catalogue sizes.')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads.')
+    parser.add_argument('--modes', default='test_client,wsgi_server',
+                        help='Comma-separated: test_client, wsgi_server.')
+    parser.add_argument('--page-cache', action='store_true',
+                        help='Keep the page cache on (off by default so every request renders).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results JSON here as well as to stdout.')
+    parser.add_argument('--compare', metavar='BASELINE', help='Earlier results JSON to compare against.')
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.modes = [mode for mode in args.modes.split(',') if mode]
+
+    if args.size:
+        return run_size(args)
+
+    document = {
+        'meta': {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'page_cache': args.page_cache,
+        },
+        'results': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        command = [sys.executable, os.path.abspath(__file__), '--size', str(size), '--requests', str(args.requests),
+                   '--concurrency', str(args.concurrency), '--modes', ','.join(args.modes), '--seed', str(args.seed)]
+        if args.page_cache:
+            command.append('--page-cache')
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        document['results'][str(size)] = json.loads(output.strip().splitlines()[-1])
+
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(document, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
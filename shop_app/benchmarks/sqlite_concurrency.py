@@ -0,0 +1,129 @@
+"""Read throughput with concurrent writers, before and after the SQLite tuning.
+
+Each scenario runs in a fresh subprocess against its own temporary database:
+``baseline`` disables the connection pragmas (rollback journal, no busy
+timeout beyond the driver default), ``tuned`` uses the defaults from
+database.py (WAL, synchronous=NORMAL, busy_timeout, mmap, cache size).
+Readers page through the storefront listing query while writers update
+products, mimicking admin edits during shop traffic.
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 2 --seconds 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SCENARIOS = {
+    'baseline': 'null',
+    'tuned': '{}',
+}
+
+
+def run_scenario(args):
+    import random
+    import threading
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from sqlalchemy.exc import OperationalError
+
+    from app import create_app
+    from extensions import db
+    from models import Product
+
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            {'name': f'Producto {i:06d}', 'price': 10.0, 'stock': 1 + i % 5} for i in range(args.products)
+        ])
+        db.session.commit()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        done = errors = 0
+        with app.app_context():
+            while not stop.is_set():
+                start = f'Producto {rng.randrange(args.products):06d}'
+                try:
+                    Product.query.filter(Product.stock > 0, Product.name > start) \
+                        .order_by(Product.name, Product.id).limit(24).all()
+                    done += 1
+                except OperationalError:
+                    errors += 1
+                db.session.rollback()
+        with lock:
+            counts['reads'] += done
+            counts['read_errors'] += errors
+
+    def writer(seed):
+        rng = random.Random(seed)
+        done = errors = 0
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    product = db.session.get(Product, rng.randint(1, args.products))
+                    product.price = round(rng.uniform(1, 100), 2)
+                    product.stock = rng.randint(0, 10)
+                    db.session.commit()
+                    done += 1
+                except OperationalError:
+                    db.session.rollback()
+                    errors += 1
+        with lock:
+            counts['writes'] += done
+            counts['write_errors'] += errors
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(args.writers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'reads_per_second': round(counts['reads'] / args.seconds, 1),
+        'writes_per_second': round(counts['writes'] / args.seconds, 1),
+        **counts,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        return run_scenario(args)
+
+    results = {}
+    for name, pragmas in SCENARIOS.items():
+        workdir = tempfile.mkdtemp(prefix='shop-bench-')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bench.db")}', SQLITE_PRAGMAS=pragmas)
+        output = subprocess.run(
+            [sys.executable, __file__, '--scenario', name, '--readers', str(args.readers),
+             '--writers', str(args.writers), '--seconds', str(args.seconds), '--products', str(args.products)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Concurrency benchmark for inventory.reserve.
+
+Runs many threads placing random multi-line orders against a handful of
+products in a throwaway SQLite database, then checks that no product's stock
+went negative and that every unit taken is accounted for by a reservation.
+
+    python benchmarks/stock_reservations.py --threads 16 --orders 4000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--threads', type=int, default=16)
+parser.add_argument('--orders', type=int, default=4000, help='Total orders across all threads.')
+parser.add_argument('--products', type=int, default=20)
+parser.add_argument('--stock', type=int, default=500, help='Initial stock per product.')
+parser.add_argument('--max-lines', type=int, default=3)
+parser.add_argument('--database', help='SQLAlchemy URL; defaults to a temporary SQLite file.')
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp(prefix='shop-bench-')
+os.environ['DATABASE_URL'] = args.database or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Product, StockReservation  # noqa: E402
+import inventory  # noqa: E402
+
+app = create_app()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    db.session.add_all([Product(name=f'Bench {i}', price=10.0, stock=args.stock) for i in range(args.products)])
+    db.session.commit()
+    product_ids = [p.id for p in Product.query.all()]
+
+results = {'ok': 0, 'insufficient': 0, 'errors': 0}
+lock = threading.Lock()
+per_thread = args.orders // args.threads
+
+
+def worker(seed):
+    rng = random.Random(seed)
+    counts = {'ok': 0, 'insufficient': 0, 'errors': 0}
+    with app.app_context():
+        for _ in range(per_thread):
+            lines = {pid: rng.randint(1, 3) for pid in rng.sample(product_ids, rng.randint(1, args.max_lines))}
+            try:
+                inventory.reserve(lines)
+                counts['ok'] += 1
+            except inventory.InsufficientStock:
+                counts['insufficient'] += 1
+            except Exception:
+                counts['errors'] += 1
+        db.session.remove()
+    with lock:
+        for key, value in counts.items():
+            results[key] += value
+
+
+threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+started = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.perf_counter() - started
+
+with app.app_context():
+    min_stock = db.session.scalar(db.select(func.min(Product.stock)))
+    remaining = db.session.scalar(db.select(func.sum(Product.stock)))
+    reserved = db.session.scalar(db.select(func.coalesce(func.sum(StockReservation.quantity), 0)))
+
+report = {
+    'database': os.environ['DATABASE_URL'],
+    'threads': args.threads,
+    'orders': per_thread * args.threads,
+    **results,
+    'seconds': round(elapsed, 3),
+    'orders_per_second': round((results['ok'] + results['insufficient']) / elapsed, 1),
+    'min_stock': min_stock,
+    'units_accounted': remaining + reserved == args.products * args.stock,
+}
+print(json.dumps(report, indent=2))
+sys.exit(0 if min_stock >= 0 and report['units_accounted'] else 1)
@@ -0,0 +1,194 @@
+# Bulk product import/export (CSV and NDJSON), used by the admin panel and the CLI
+import csv
+import io
+import json
+import re
+from itertools import islice
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+import facets
+from models import PRODUCT_FIELDS, Product
+from money import json_default
+from repository import mark_changed
+from validators import MAX_INTEGER, ProductValidationError, parse_product_data
+
+FORMATS = ('csv', 'ndjson')
+EXPORT_FIELDS = PRODUCT_FIELDS
+DEFAULT_CHUNK_SIZE = 500
+NOT_UTF8_MESSAGE = 'The line is not valid UTF-8.'
+_NOT_UTF8 = re.compile('[\udc80-\udcff]')
+MAX_REPORTED_ERRORS = 1000
+
+
+def guess_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(line_number, row)`` from a binary stream without reading it all into memory.
+
+    ``row`` is a dict, or a ``ProductValidationError`` when the line itself cannot be parsed.
+    Bytes that are not UTF-8 make their row an error instead of stopping the file.
+    """
+    # surrogateescape turns undecodable bytes into lone surrogates, which _NOT_UTF8 then finds row by row
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                yield reader.line_num, ProductValidationError(f'Invalid CSV: {e}')
+                continue
+            if any(isinstance(value, str) and _NOT_UTF8.search(value) for value in row.values()):
+                row = ProductValidationError(NOT_UTF8_MESSAGE)
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if _NOT_UTF8.search(line):
+                yield line_number, ProductValidationError(NOT_UTF8_MESSAGE)
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ProductValidationError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(row, dict):
+                row = ProductValidationError('Each line must be a JSON object.')
+            yield line_number, row
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []  # (line, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted, 'updated': self.updated, 'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+def _clean_row(row, get_taxonomy=None):
+    values = facets.check_taxonomy(parse_product_data(row), get_taxonomy)
+    raw_id = row.get('id')
+    if raw_id not in (None, ''):
+        try:
+            values['id'] = int(raw_id)
+        except (TypeError, ValueError):
+            raise ProductValidationError('Invalid id: must be an integer.')
+        if not 0 < values['id'] <= MAX_INTEGER:
+            raise ProductValidationError(f'Invalid id: must be between 1 and {MAX_INTEGER}.')
+    return values
+
+
+def _import_chunk(chunk, report):
+    # Taxonomy ids are checked row by row, so an unknown one is reported on its own line instead of
+    # failing the chunk's foreign keys; each id is looked up once per chunk
+    taxonomy = {}
+
+    def get_taxonomy(model, entry_id):
+        if (model, entry_id) not in taxonomy:
+            taxonomy[model, entry_id] = db.session.get(model, entry_id)
+        return taxonomy[model, entry_id]
+
+    valid = {}  # product id (or a line-unique placeholder) -> (line, values); last row for an id wins
+    for line, row in chunk:
+        if isinstance(row, Exception):
+            report.add_error(line, str(row))
+            continue
+        try:
+            values = _clean_row(row, get_taxonomy)
+        except ProductValidationError as e:
+            report.add_error(line, str(e))
+            continue
+        valid[values.get('id', ('new', line))] = (line, values)
+    if not valid:
+        return
+
+    ids = [key for key in valid if isinstance(key, int)]
+    # Current versions: the bulk UPDATE checks and bumps them like an admin edit (see Product.version)
+    existing = dict(db.session.execute(select(Product.id, Product.version).where(Product.id.in_(ids))).all()) if ids else {}
+    inserts = [values for key, (_, values) in valid.items() if key not in existing]
+    updates = [dict(values, version=existing[key]) for key, (_, values) in valid.items() if key in existing]
+    try:
+        # ORM bulk statements: one executemany per statement, one transaction per chunk
+        if inserts:
+            db.session.execute(insert(Product), inserts)
+        if updates:
+            db.session.execute(update(Product), updates)
+            mark_changed(existing)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        message = f'Chunk rolled back: {getattr(e, "orig", None) or e}'
+        for line, _ in valid.values():
+            report.add_error(line, message)
+        return
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+
+def import_products(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Upsert products from an iterable of ``(line, row)`` pairs, committing once per chunk.
+
+    Rows carrying the id of an existing product update it; all other rows are inserted.
+    Invalid rows are reported and skipped; they never abort the run.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, report)
+    return report
+
+
+def export_products(fmt, batch_size=1000):
+    """Yield the product table as CSV or NDJSON text, one id-ordered batch at a time."""
+    columns = [getattr(Product, field) for field in EXPORT_FIELDS]
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(*columns).where(Product.id > last_id).order_by(Product.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows(batch)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(json.dumps(dict(row._mapping), ensure_ascii=False, default=json_default) + '\n' for row in batch)
+        # End the read transaction between batches so a long export never pins one snapshot
+        db.session.rollback()
@@ -0,0 +1,155 @@
+# In-process response cache for the public catalogue pages
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'etag', 'expires_at')
+
+    def __init__(self, body, mimetype, etag, expires_at):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """LRU + TTL cache of rendered pages, keyed by strings such as ``product:42``.
+
+    Entries are evicted least-recently-used once ``PAGE_CACHE_MAX_ENTRIES`` is
+    reached and expire after ``PAGE_CACHE_TTL`` seconds. The cache lives in the
+    worker process, so the TTL also bounds how stale other workers can be after
+    an admin write is invalidated in the worker that handled it.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = 512
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 512)
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        self.max_entries = app.config['PAGE_CACHE_MAX_ENTRIES']
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        app.extensions['page_cache'] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, mimetype):
+        entry = CachedPage(body, mimetype, hashlib.sha1(body).hexdigest(), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def invalidate_product(self, product_id):
+        """Drop what an admin write to one product can change: its page and every listing page."""
+        with self._lock:
+            self._entries.pop(f'product:{product_id}', None)
+            for key in [k for k in self._entries if k.startswith('listing:')]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            }
+
+    def cached(self, key_func):
+        """Decorator for GET views: serve from cache and answer ``If-None-Match`` with 304.
+
+        Requests with pending flash messages bypass the cache so the messages are
+        rendered (and consumed) by a fresh page rather than hidden by a cached one.
+        Only 200 responses are stored.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                return self.serve(key_func, view, args, kwargs)
+            return wrapped
+        return decorator
+
+    def serve(self, key_func, view, args, kwargs):
+        if not current_app.config['PAGE_CACHE_ENABLED'] or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = key_func(*args, **kwargs)
+        entry = self.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = self.set(key, response.get_data(), response.mimetype)
+
+        response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+class PageCache:
+    """The page cache extension: each app gets its own ``ResponseCache`` in ``app.extensions['page_cache']``.
+
+    The shared ``extensions.page_cache`` instance holds no state; its methods and
+    its ``cached`` decorator act on the cache of the current app, so apps built
+    in one process (tests, the static exporter) never see each other's pages or
+    settings.
+    """
+
+    def init_app(self, app):
+        ResponseCache(app)
+
+    def __getattr__(self, name):
+        # get, set, invalidate, invalidate_prefix, invalidate_product, clear, stats
+        return getattr(current_app.extensions['page_cache'], name)
+
+    def cached(self, key_func):
+        """``ResponseCache.cached``, resolved against the current app's cache on each request."""
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                return current_app.extensions['page_cache'].serve(key_func, view, args, kwargs)
+            return wrapped
+        return decorator
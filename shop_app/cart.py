@@ -0,0 +1,103 @@
+# Shopping cart kept in the server-side session as [[product_id, quantity], ...], priced in one query
+from decimal import Decimal
+
+from flask import current_app, session
+from sqlalchemy import select
+
+from extensions import db
+from models import Product
+
+
+class CartError(ValueError):
+    pass
+
+
+def lines():
+    """The cart as ``{product_id: quantity}``, in the order products were added."""
+    return {product_id: quantity for product_id, quantity in session.get('cart', ())}
+
+
+def _store(cart):
+    # A new list every time: the session only notices assignments, not changes inside its values.
+    # Pairs rather than a dict, whose keys the session serializer would sort.
+    if cart:
+        session['cart'] = [[product_id, quantity] for product_id, quantity in cart.items()]
+    else:
+        session.pop('cart', None)
+
+
+def _quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise CartError('Quantity must be a whole number.')
+    if quantity < 0:
+        raise CartError('Quantity cannot be negative.')
+    return min(quantity, current_app.config['CART_MAX_QUANTITY'])
+
+
+def _check_room(cart, product_id):
+    if product_id not in cart and len(cart) >= current_app.config['CART_MAX_LINES']:
+        raise CartError(f'A cart holds at most {current_app.config["CART_MAX_LINES"]} different products.')
+
+
+def add(product_id, quantity=1):
+    """Add to a line; callers check that the product exists."""
+    cart = lines()
+    quantity = _quantity(quantity)
+    _check_room(cart, product_id)
+    cart[product_id] = min(cart.get(product_id, 0) + quantity, current_app.config['CART_MAX_QUANTITY'])
+    _store({pid: qty for pid, qty in cart.items() if qty})
+
+
+def set_quantity(product_id, quantity):
+    """Set a line's quantity; 0 removes it. A new line counts against ``CART_MAX_LINES`` as in ``add``."""
+    cart = lines()
+    quantity = _quantity(quantity)
+    if quantity:
+        _check_room(cart, product_id)
+        cart[product_id] = quantity
+    else:
+        cart.pop(product_id, None)
+    _store(cart)
+
+
+def remove(product_id):
+    set_quantity(product_id, 0)
+
+
+def clear():
+    _store({})
+
+
+def summary(cart=None):
+    """Priced cart: every line's product fetched in a single query, however many lines there are.
+
+    ``cart`` defaults to the session's; lines of products deleted since they
+    were added are then dropped from it. ``available`` is false when a line
+    asks for more than the stock; checkout (``inventory.reserve``) is what
+    actually takes the units.
+    """
+    from_session = cart is None
+    cart = lines() if from_session else cart
+    products = {}
+    if cart:
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.price, Product.stock, Product.image_url)
+            .where(Product.id.in_(list(cart)))
+        )
+        products = {row.id: row for row in rows}
+    items, total, units = [], Decimal('0.00'), 0
+    for product_id, quantity in cart.items():
+        product = products.get(product_id)
+        if product is None:
+            continue
+        line_total = product.price * quantity
+        items.append({'product_id': product_id, 'name': product.name, 'price': product.price,
+                      'quantity': quantity, 'line_total': line_total, 'image_url': product.image_url,
+                      'available': (product.stock or 0) >= quantity})
+        total += line_total
+        units += quantity
+    if from_session and len(items) < len(cart):
+        _store({item['product_id']: item['quantity'] for item in items})
+    return {'items': items, 'units': units, 'total': total}
@@ -0,0 +1,167 @@
+# Flask CLI commands (flask --app app <command>), registered on the app in create_app()
+import signal
+import sys
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import db, page_cache
+from models import User
+import auth
+import bulk
+import facets
+import fx
+import inventory
+import pricing
+import reporting
+import session_store
+import static_export
+import tasks
+
+
+@click.command('import-products')
+@with_appcontext
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=bulk.DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+def import_products_command(path, fmt, chunk_size):
+    """Stream a CSV or NDJSON file of products into the database."""
+    fmt = fmt or bulk.guess_format(path)
+    with open(path, 'rb') as stream:
+        report = bulk.import_products(bulk.iter_rows(stream, fmt), chunk_size=max(1, chunk_size))
+    page_cache.clear()
+    for line, message in report.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'{report.inserted} created, {report.updated} updated, {report.error_count} rejected.')
+    if report.error_count:
+        sys.exit(1)
+
+
+@click.command('export-products')
+@with_appcontext
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), default='csv', show_default=True)
+def export_products_command(path, fmt):
+    """Write every product as CSV or NDJSON to PATH (stdout by default)."""
+    out = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+    try:
+        for chunk in bulk.export_products(fmt):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+@click.command('sweep-reservations')
+@with_appcontext
+@click.option('--interval', default=0, help='Keep running, sweeping every INTERVAL seconds.')
+def sweep_reservations_command(interval):
+    """Return the stock held by expired checkout reservations."""
+    while True:
+        reclaimed = inventory.sweep_expired()
+        click.echo(f'{reclaimed} expired reservation lines reclaimed.')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@click.command('purge-sessions')
+@with_appcontext
+@click.option('--interval', default=0, help='Keep running, purging every INTERVAL seconds.')
+def purge_sessions_command(interval):
+    """Delete expired sessions and the carts in them."""
+    while True:
+        purged = session_store.purge_expired(current_app)
+        click.echo(f'{purged} expired sessions deleted.')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@click.command('reprice')
+@with_appcontext
+@click.option('--cached-rates', is_flag=True, help='Use the cached exchange rates instead of asking the provider; '
+                                                     'fails if there are none.')
+def reprice_command(cached_rates):
+    """Recompute the price of every product that has a cost price."""
+    try:
+        summary = pricing.run_repricing(current_app._get_current_object(), cached_only=cached_rates)
+    except fx.FxError as e:
+        raise click.ClickException(str(e))
+    rates = ', '.join(f'{currency}={rate}' for currency, rate in sorted(summary['rates'].items()))
+    click.echo(f'Rates ({summary["source"]}): {rates}')
+    click.echo(f'{summary["updated"]} products repriced in {summary["seconds"]}s.')
+
+
+@click.command('worker')
+@with_appcontext
+@click.option('--burst', is_flag=True, help='Exit once no task is due instead of waiting for more.')
+def worker_command(burst):
+    """Run background tasks (image processing, repricing) from the task table."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        click.echo('Stopping after the current task...')
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    ran = tasks.work(app, burst=burst, stop=stop)
+    click.echo(f'{ran} tasks run.')
+
+
+@click.command('rebuild-facets')
+@with_appcontext
+def rebuild_facets_command():
+    """Recount the storefront filter counts from the product table."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Facet counts are only materialised on SQLite; other databases count live.')
+    with db.engine.begin() as connection:
+        facets.rebuild_facets(connection)
+    page_cache.clear()
+    click.echo('Facet counts rebuilt.')
+
+
+@click.command('export-static')
+@with_appcontext
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--base-url', required=True, help='Public URL the files are served from, e.g. https://user.github.io/shop.')
+@click.option('--workers', default=0, help='Render processes; 0 = one per CPU, 1 = render in this process.')
+@click.option('--full', is_flag=True, help='Render every page again (after changing templates).')
+def export_static_command(out_dir, base_url, workers, full):
+    """Write the storefront as static HTML plus sitemap.xml and products.json, re-rendering only what changed."""
+    started = time.perf_counter()
+    report = static_export.export_static(current_app, out_dir, base_url, workers=workers or None, full=full)
+    click.echo(f"{report['products']} product pages and {report['listing_pages']} listing pages rendered, "
+               f"{report['unchanged']} unchanged, {report['deleted']} removed in {time.perf_counter() - started:.1f}s.")
+
+@click.command('create-admin')
+@with_appcontext
+@click.argument('username')
+@click.password_option(help='Prompted for (twice) when not given.')
+def create_admin_command(username, password):
+    """Create an admin account, or set the password of an existing one."""
+    user = User.query.filter_by(username=username).first()
+    created = user is None
+    if created:
+        user = User(username=username)
+        db.session.add(user)
+    user.is_admin = True
+    user.password_hash = auth.hash_password(current_app, password)
+    db.session.commit()
+    click.echo(f'Admin "{username}" {"created" if created else "updated"}.')
+
+@click.command('rebuild-reports')
+@with_appcontext
+def rebuild_reports_command():
+    """Recompute the daily sales rollups from the orders."""
+    reporting.rebuild()
+    click.echo('Sales reports rebuilt.')
+
+
+COMMANDS = (import_products_command, export_products_command, sweep_reservations_command, purge_sessions_command,
+            reprice_command, worker_command, rebuild_facets_command, rebuild_reports_command,
+            create_admin_command, export_static_command)
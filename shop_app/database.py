@@ -0,0 +1,96 @@
+# Database URI, engine options and SQLite connection pragmas, all overridable from the environment
+import json
+import os
+from functools import partial
+
+from sqlalchemy import event
+
+# Applied to every new SQLite connection. WAL lets readers run while a writer
+# commits; busy_timeout makes writers queue instead of failing with
+# "database is locked"; synchronous=NORMAL is durable enough under WAL.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,        # ms
+    'mmap_size': 268435456,      # 256 MiB of the file memory-mapped
+    'cache_size': -65536,        # negative = KiB, i.e. 64 MiB page cache per connection
+    'foreign_keys': 'ON',
+}
+
+# Tables created by raw DDL (FTS5 index and its shadow tables); autogenerate must not drop them
+UNMANAGED_TABLE_PREFIXES = ('product_fts',)
+
+
+def database_uri(environ=os.environ, default='sqlite:///shop.db'):
+    uri = environ.get('DATABASE_URL', default)
+    # Heroku-style URLs use the scheme SQLAlchemy dropped in 1.4
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri, environ=os.environ):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for ``uri``.
+
+    ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT`` and ``DB_POOL_RECYCLE``
+    tune the connection pool; ``SQLALCHEMY_ENGINE_OPTIONS`` (a JSON object) is
+    merged last and wins.
+    """
+    options = {}
+    if uri.startswith('sqlite'):
+        if ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///'):
+            options['pool_size'] = int(environ.get('DB_POOL_SIZE', 10))
+            options['max_overflow'] = int(environ.get('DB_MAX_OVERFLOW', 20))
+    else:
+        options.update(
+            pool_size=int(environ.get('DB_POOL_SIZE', 10)),
+            max_overflow=int(environ.get('DB_MAX_OVERFLOW', 20)),
+            pool_timeout=int(environ.get('DB_POOL_TIMEOUT', 30)),
+            pool_recycle=int(environ.get('DB_POOL_RECYCLE', 1800)),
+            pool_pre_ping=True,
+        )
+    overrides = json.loads(environ.get('SQLALCHEMY_ENGINE_OPTIONS', '{}'))
+    if not isinstance(overrides, dict):
+        raise ValueError('SQLALCHEMY_ENGINE_OPTIONS must be a JSON object')
+    options.update(overrides)
+    return options
+
+
+def sqlite_pragmas(environ=os.environ):
+    """Default pragmas overridden key by key by the ``SQLITE_PRAGMAS`` JSON object.
+
+    A key set to ``null`` drops that pragma; ``SQLITE_PRAGMAS=null`` disables them all.
+    """
+    overrides = json.loads(environ.get('SQLITE_PRAGMAS', '{}'))
+    if overrides is None:
+        return {}
+    if not isinstance(overrides, dict):
+        raise ValueError('SQLITE_PRAGMAS must be a JSON object or null')
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS, **overrides)
+    for name, value in pragmas.items():
+        if not name.isidentifier() or not str(value).replace('-', '').isalnum():
+            raise ValueError(f'Invalid SQLite pragma {name}={value!r}')
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_engines(app, db):
+    """Install the SQLite pragma hook on every SQLite engine of ``db``."""
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and pragmas:
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Alembic ``include_object`` hook that skips ``UNMANAGED_TABLE_PREFIXES``."""
+    return not (type_ == 'table' and name.startswith(UNMANAGED_TABLE_PREFIXES))
@@ -0,0 +1,7 @@
+# Extension instances shared by every app built by create_app(); bound to an app with init_app()
+from flask_sqlalchemy import SQLAlchemy
+
+from cache import PageCache
+
+db = SQLAlchemy()
+page_cache = PageCache() # Per-app state lives in app.extensions['page_cache']
@@ -0,0 +1,164 @@
+# Storefront filters by category, subcategory and brand, with precomputed facet counts
+from sqlalchemy import event, func, select, update
+
+from extensions import db
+from models import Brand, Category, Product, ProductFacet, Subcategory
+from repository import mark_changed
+from validators import ProductValidationError
+
+# URL parameter -> taxonomy model; products carry a <name>_id column for each
+DIMENSIONS = {'category': Category, 'subcategory': Subcategory, 'brand': Brand}
+
+# product_facet holds one in-stock count per (category, subcategory, brand)
+# combination, so the counts for any filter selection are a SUM over a few
+# hundred rows instead of a GROUP BY over the whole catalogue. The triggers move
+# a product between combinations as it is written: only inserts, deletes,
+# taxonomy changes and stock crossing zero touch the table, so ordinary stock
+# decrements from reservations skip it. The same statements are frozen in the
+# migration that creates the table.
+_KEY = 'category_id, subcategory_id, brand_id'
+_OLD = 'category_id = coalesce(old.category_id, 0) AND subcategory_id = coalesce(old.subcategory_id, 0) ' \
+       'AND brand_id = coalesce(old.brand_id, 0)'
+_NEW = 'coalesce(new.category_id, 0), coalesce(new.subcategory_id, 0), coalesce(new.brand_id, 0)'
+
+FACET_DDL = (
+    f"""CREATE TRIGGER IF NOT EXISTS product_facet_ai AFTER INSERT ON product WHEN new.stock > 0 BEGIN
+        INSERT INTO product_facet({_KEY}, product_count) VALUES ({_NEW}, 1)
+        ON CONFLICT({_KEY}) DO UPDATE SET product_count = product_count + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_facet_ad AFTER DELETE ON product WHEN old.stock > 0 BEGIN
+        UPDATE product_facet SET product_count = product_count - 1 WHERE {_OLD};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_facet_au AFTER UPDATE OF stock, category_id, subcategory_id, brand_id ON product
+    WHEN (old.stock > 0) IS NOT (new.stock > 0) OR old.category_id IS NOT new.category_id
+        OR old.subcategory_id IS NOT new.subcategory_id OR old.brand_id IS NOT new.brand_id BEGIN
+        UPDATE product_facet SET product_count = product_count - 1 WHERE {_OLD} AND old.stock > 0;
+        INSERT INTO product_facet({_KEY}, product_count) SELECT {_NEW}, 1 WHERE new.stock > 0
+        ON CONFLICT({_KEY}) DO UPDATE SET product_count = product_count + 1;
+    END""",
+)
+
+REBUILD_SQL = (
+    'DELETE FROM product_facet',
+    f"""INSERT INTO product_facet({_KEY}, product_count)
+        SELECT coalesce(category_id, 0), coalesce(subcategory_id, 0), coalesce(brand_id, 0), count(*)
+        FROM product WHERE stock > 0 GROUP BY 1, 2, 3""",
+)
+
+
+def parse_selection(args):
+    """``?category=3&brand=1&brand=4`` (or ``brand=1,4``) -> ``{'category': [3], 'subcategory': [], 'brand': [1, 4]}``.
+
+    Raises ``ValueError`` for values that are not integers.
+    """
+    return {name: sorted({int(value) for raw in args.getlist(name) for value in raw.split(',') if value.strip()})
+            for name in DIMENSIONS}
+
+
+def toggle(selection, name, value_id):
+    """``selection`` with ``value_id`` added to or removed from ``name``, for the filter links."""
+    ids = set(selection[name]) ^ {value_id}
+    return {**selection, name: sorted(ids)}
+
+
+def filter_products(query, selection):
+    """Restrict a Product query to the selection: any of the values within a facet, all facets together."""
+    for name, ids in selection.items():
+        if ids:
+            query = query.filter(getattr(Product, f'{name}_id').in_(ids))
+    return query
+
+
+def facet_counts(selection):
+    """In-stock product counts for every value of every facet, given the current selection.
+
+    Each facet is counted with the other facets' filters applied but not its own,
+    so choosing a brand still shows how many products the other brands have.
+    Returns ``{'category': [{'id', 'name', 'count', 'selected'}, ...], ...}``,
+    values without products left out.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        source, count, scope = ProductFacet, func.sum(ProductFacet.product_count), []
+    else:
+        # Other databases have no triggers: count the in-stock products directly
+        source, count, scope = Product, func.count(), [Product.stock > 0]
+    facets = {}
+    for name, model in DIMENSIONS.items():
+        others = [getattr(source, f'{other}_id').in_(ids) for other, ids in selection.items() if ids and other != name]
+        rows = db.session.execute(
+            select(model.id, model.name, count.label('count'))
+            .select_from(source).join(model, model.id == getattr(source, f'{name}_id'))
+            .where(*scope, *others)
+            .group_by(model.id, model.name).having(count > 0).order_by(model.name)
+        ).all()
+        facets[name] = [{'id': row.id, 'name': row.name, 'count': int(row.count), 'selected': row.id in selection[name]}
+                        for row in rows]
+    return facets
+
+
+def check_taxonomy(values, get=None):
+    """Check the taxonomy ids from ``validators.parse_taxonomy_data`` against the database.
+
+    A subcategory implies its category, which is filled in when missing.
+    Raises ``ProductValidationError`` for unknown ids or a subcategory of another category.
+    ``get(model, id)`` looks the entries up, ``db.session.get`` by default; bulk
+    imports pass one that remembers them across the rows of a chunk.
+    """
+    get = get or db.session.get
+    for name, model in DIMENSIONS.items():
+        value_id = values.get(f'{name}_id')
+        if value_id is not None and get(model, value_id) is None:
+            raise ProductValidationError(f'Unknown {name} {value_id}.')
+    if values.get('subcategory_id') is not None:
+        parent_id = get(Subcategory, values['subcategory_id']).category_id
+        if values.get('category_id') is None:
+            values['category_id'] = parent_id
+        elif values['category_id'] != parent_id:
+            raise ProductValidationError('The subcategory does not belong to the chosen category.')
+    return values
+
+
+def detach_products(name, value_id):
+    """Clear a category, subcategory or brand from its products, before deleting it.
+
+    Deleting a category also deletes its subcategories (ON DELETE CASCADE), so
+    those are cleared too. One UPDATE; the facet triggers move the counts.
+    """
+    column = getattr(Product, f'{name}_id')
+    values = {column.key: None}
+    if name == 'category':
+        values['subcategory_id'] = None
+    db.session.execute(update(Product).where(column == value_id).values(values)
+                       .execution_options(synchronize_session=False))
+    mark_changed()
+    if name == 'category':
+        db.session.execute(update(Product)
+                           .where(Product.subcategory_id.in_(select(Subcategory.id).where(Subcategory.category_id == value_id)))
+                           .values(subcategory_id=None).execution_options(synchronize_session=False))
+
+
+def taxonomy_choices():
+    """Categories (with their subcategories) and brands for the admin selects."""
+    categories = Category.query.options(db.selectinload(Category.subcategories)).order_by(Category.name).all()
+    return categories, Brand.query.order_by(Brand.name).all()
+
+
+def rebuild_facets(connection):
+    """Recount product_facet from the product table (after a restore, or to check for drift)."""
+    for statement in REBUILD_SQL:
+        connection.exec_driver_sql(statement)
+
+
+def create_facet_triggers(connection):
+    for statement in FACET_DDL:
+        connection.exec_driver_sql(statement)
+    rebuild_facets(connection)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_facet_triggers(target, connection, tables=(), **kw):
+    # Keeps db.create_all() (tests, fresh installs) in step with the migration. On the
+    # metadata rather than a table: product_facet has no foreign key, so nothing
+    # orders it after product, which the triggers are created on.
+    if connection.dialect.name == 'sqlite' and ProductFacet.__table__ in tables:
+        create_facet_triggers(connection)
@@ -0,0 +1,140 @@
+# Exchange rates for repricing: pluggable providers with a local cached fallback
+import json
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from importlib import import_module
+
+BASE_CURRENCY = 'PEN'  # prices are stored in soles; rates are soles per unit of each currency
+
+
+class FxError(Exception):
+    pass
+
+
+class SunatProvider:
+    """SUNAT selling rate (``venta``) for USD, the rate js/actualizar-precios.js used."""
+
+    url = 'https://api.apis.net.pe/v1/tipo-cambio-sunat'
+
+    def __init__(self, app):
+        self.timeout = app.config['FX_TIMEOUT']
+
+    def fetch(self):
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+                data = json.load(response)
+            return {'USD': float(data['venta'])}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise FxError(f'SUNAT exchange rate unavailable: {e}')
+
+
+class StaticProvider:
+    """Fixed rates from ``FX_STATIC_RATES``, for tests and manual overrides."""
+
+    def __init__(self, app):
+        self.rates = app.config['FX_STATIC_RATES']
+
+    def fetch(self):
+        if not self.rates:
+            raise FxError('FX_STATIC_RATES is empty.')
+        return dict(self.rates)
+
+
+PROVIDERS = {'sunat': SunatProvider, 'static': StaticProvider}
+
+
+class Rates:
+    __slots__ = ('rates', 'source', 'fetched_at')
+
+    def __init__(self, rates, source, fetched_at):
+        self.rates = {BASE_CURRENCY: 1.0, **rates}
+        self.source = source          # provider name, 'cache' or 'fallback'
+        self.fetched_at = fetched_at  # ISO timestamp of the provider answer, None for the fallback
+
+    def to_dict(self):
+        return {'rates': self.rates, 'source': self.source, 'fetched_at': self.fetched_at}
+
+
+def load_provider(app):
+    """Instantiate ``FX_PROVIDER``: a name from ``PROVIDERS`` or a ``module:Class`` path."""
+    spec = app.config['FX_PROVIDER']
+    if spec in PROVIDERS:
+        return PROVIDERS[spec](app)
+    module, _, name = spec.partition(':')
+    try:
+        return getattr(import_module(module), name)(app)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise FxError(f'Unknown FX_PROVIDER "{spec}": {e}')
+
+
+def _cache_path(app):
+    return app.config['FX_CACHE_FILE'] or os.path.join(app.instance_path, 'fx_rates.json')
+
+
+def _write_cache(path, rates):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(rates.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def _read_cache(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return Rates({k: float(v) for k, v in data['rates'].items()}, 'cache', data.get('fetched_at'))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+_memo = {}  # cache file path -> (monotonic expiry, Rates)
+_lock = threading.Lock()
+
+
+def cached_rates(app):
+    """The rates already at hand: this process's unexpired memo, else the cache file; ``None`` if neither.
+
+    Never asks the provider, so request handlers can call it. Fetching is left to
+    ``get_rates`` in the reprice task and ``flask reprice``.
+    """
+    path = _cache_path(app)
+    with _lock:
+        memo = _memo.get(path)
+    if memo and memo[0] > time.monotonic():
+        return memo[1]
+    return _read_cache(path) or (memo[1] if memo else None)
+
+
+def get_rates(app, refresh=False):
+    """Current rates, asking the provider at most once per ``FX_CACHE_TTL`` seconds.
+
+    Every provider answer is saved to the cache file, which is what we fall back
+    to when the provider fails; with neither, ``FX_FALLBACK_RATES`` is used.
+    ``refresh`` skips the in-process memo and asks the provider again.
+    """
+    path = _cache_path(app)
+    with _lock:
+        memo = _memo.get(path)
+    if memo and not refresh and memo[0] > time.monotonic():
+        return memo[1]
+    # The provider is asked without the lock: a slow answer must not hold up threads that only read the memo
+    ttl = app.config['FX_CACHE_TTL']
+    try:
+        fetched = load_provider(app).fetch()
+        rates = Rates({k.upper(): float(v) for k, v in fetched.items()}, app.config['FX_PROVIDER'],
+                      datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        try:
+            _write_cache(path, rates)
+        except OSError:
+            app.logger.warning('Could not write the FX cache file %s', path, exc_info=True)
+    except (FxError, ValueError, TypeError, AttributeError) as e:
+        app.logger.warning('FX provider failed (%s); using cached rates', e)
+        rates = _read_cache(path) or Rates(app.config['FX_FALLBACK_RATES'], 'fallback', None)
+        ttl = min(ttl, 60)  # try the provider again soon
+    with _lock:
+        _memo[path] = (time.monotonic() + ttl, rates)
+    return rates
@@ -0,0 +1,77 @@
+# Product audit trail: every ORM change to a product is appended to product_history in the same transaction
+from decimal import Decimal
+
+from flask import has_request_context, session as flask_session
+from sqlalchemy import event, insert, inspect, select
+
+from extensions import db
+from models import PRODUCT_FIELDS, Product, ProductHistory
+
+TRACKED_FIELDS = tuple(field for field in PRODUCT_FIELDS if field != 'id') + ('image_key',)
+
+
+def _plain(value):
+    # JSON-friendly; prices are whole cents, so a float keeps them exact
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _snapshot(product):
+    return {field: _plain(getattr(product, field)) for field in TRACKED_FIELDS if getattr(product, field) is not None}
+
+
+def _diff(product):
+    state = inspect(product)
+    changes = {}
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old != new:
+            changes[field] = [_plain(old), _plain(new)]
+    return changes
+
+
+@event.listens_for(db.session, 'after_flush')
+def record_product_changes(session, flush_context):
+    """Write a product_history row per product inserted, changed or deleted by this flush.
+
+    Runs after the flush (new products have their id and updated ones their new
+    version) but before commit, so the history commits or rolls back with the
+    change. Set-based UPDATEs (repricing, stock reservations, bulk imports)
+    bypass the ORM and are not recorded here.
+    """
+    changed_by = flask_session.get('admin_username') if has_request_context() else None
+    rows = []
+    for product in session.new:
+        if isinstance(product, Product):
+            rows.append({'product_id': product.id, 'version': product.version, 'action': 'create',
+                         'changes': _snapshot(product)})
+    for product in session.dirty:
+        if isinstance(product, Product):
+            changes = _diff(product)
+            if changes:
+                rows.append({'product_id': product.id, 'version': product.version, 'action': 'update',
+                             'changes': changes})
+    for product in session.deleted:
+        if isinstance(product, Product):
+            rows.append({'product_id': product.id, 'version': product.version, 'action': 'delete',
+                         'changes': _snapshot(product)})
+    if rows:
+        # Core on the flush's connection: the session cannot run ORM statements mid-flush
+        session.connection().execute(insert(ProductHistory.__table__), [dict(row, changed_by=changed_by) for row in rows])
+
+
+def product_history(product_id, before=None, limit=50):
+    """A product's changes, newest first: ``(entries, next_before)``.
+
+    ``before`` is the id of the last entry of the previous page; pages are range
+    scans of ix_product_history_product_id_id, however long the history gets.
+    ``next_before`` is ``None`` on the last page.
+    """
+    query = select(ProductHistory).where(ProductHistory.product_id == product_id)
+    if before is not None:
+        query = query.where(ProductHistory.id < before)
+    entries = db.session.scalars(query.order_by(ProductHistory.id.desc()).limit(limit + 1)).all()
+    return entries[:limit], entries[limit - 1].id if len(entries) > limit else None
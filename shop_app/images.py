@@ -0,0 +1,219 @@
+# Product image pipeline: content-addressed resized variants (WebP + JPEG) built by the task worker
+import hashlib
+import io
+import os
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from flask import request, url_for
+from sqlalchemy import update
+
+from extensions import db
+from models import Product
+from repository import mark_changed
+import tasks
+
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}),
+                   ('jpg', 'JPEG', {'quality': 82, 'progressive': True, 'optimize': True}))
+IMAGE_SUBDIR = os.path.join('img', 'products')  # under the app's static folder
+FAR_FUTURE = 365 * 24 * 3600
+SPOOL_SUBDIR = 'image_uploads'  # under the instance folder: uploads waiting for the worker
+
+
+class ImageError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _pillow():
+    """``(Image, ImageOps)``, imported on first use so workers that never touch images skip it; ``None`` without Pillow."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # Pillow is optional; without it images are stored unprocessed
+        return None
+    return Image, ImageOps
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def variant_filename(key, width, ext):
+    return f'{IMAGE_SUBDIR}/{key}-{width}.{ext}'.replace(os.sep, '/')
+
+
+def read_source(app, upload=None, path=None):
+    """Return the bytes of an uploaded file or of a file under ``IMAGE_SOURCE_DIR``; ``None`` if neither is given.
+
+    ``path`` may be relative to ``IMAGE_SOURCE_DIR`` or a ``file://`` URL inside it;
+    anything resolving outside that directory is refused.
+    """
+    max_bytes = app.config['IMAGE_MAX_BYTES']
+    if upload is not None and upload.filename:
+        data = upload.read(max_bytes + 1)
+    elif path:
+        root = app.config['IMAGE_SOURCE_DIR']
+        if not root:
+            return None
+        if path.startswith('file://'):
+            path = urlparse(path).path
+        full_path = os.path.realpath(os.path.join(root, path))
+        if not full_path.startswith(os.path.realpath(root) + os.sep) or not os.path.isfile(full_path):
+            return None
+        with open(full_path, 'rb') as f:
+            data = f.read(max_bytes + 1)
+    else:
+        return None
+    if len(data) > max_bytes:
+        raise ImageError(f'Image is larger than {max_bytes // (1024 * 1024)} MB.')
+    pillow = _pillow()
+    if pillow is not None:
+        try:
+            pillow[0].open(io.BytesIO(data)).verify()  # header check only; decoding happens in the worker
+        except Exception:
+            raise ImageError('The file is not a supported image.')
+    return data
+
+
+def _atomic_write(path, write):
+    """Write ``path`` through a temporary file, so readers see the old file or the whole new one, never a part."""
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_variants(data, static_folder):
+    """Write the resized variants of ``data`` and return ``(key, widths)``.
+
+    Files are named by content hash, so re-uploading the same image is a no-op and
+    the URLs can be cached forever. Images narrower than a target width are not
+    upscaled; their own width becomes the largest variant.
+    """
+    Image, ImageOps = _pillow()
+    key = content_key(data)
+    out_dir = os.path.join(static_folder, IMAGE_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for ext, fmt, options in VARIANT_FORMATS:
+            path = os.path.join(static_folder, variant_filename(key, width, ext))
+            if not os.path.exists(path):
+                _atomic_write(path, lambda f: resized.save(f, fmt, **options))
+    return key, widths
+
+
+def store_original(data, static_folder):
+    """Fallback without Pillow: keep the upload as is under its content hash and return its static filename."""
+    ext = 'img'
+    if data[:3] == b'\xff\xd8\xff':
+        ext = 'jpg'
+    elif data[:8] == b'\x89PNG\r\n\x1a\n':
+        ext = 'png'
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        ext = 'webp'
+    filename = f'{IMAGE_SUBDIR}/{content_key(data)}.{ext}'.replace(os.sep, '/')
+    path = os.path.join(static_folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        _atomic_write(path, lambda f: f.write(data))
+    return filename
+
+
+def _drop_variants(product):
+    product.image_key = None
+    product.image_widths = None
+
+
+def prepare_form_image(app, product, files, form, previous_url=None):
+    """Handle the image fields of the admin product form before the product is committed.
+
+    Reads an uploaded ``image_file`` or an ``image_url`` that names a file under
+    ``IMAGE_SOURCE_DIR``. Remote URLs are stored as they are; one that differs
+    from ``previous_url`` drops the product's variants, which would otherwise keep
+    showing the old image. Returns the image bytes still to be processed once the
+    product has an id, or ``None``. Raises ``ImageError`` for oversized or
+    unreadable images.
+    """
+    data = read_source(app, upload=files.get('image_file'))
+    if data is None:
+        path = form.get('image_url', '')
+        if not path or urlparse(path).scheme in ('http', 'https'):
+            if path and path != previous_url:
+                _drop_variants(product)
+            return None
+        data = read_source(app, path=path)
+        if data is None:
+            return None
+        product.image_url = ''  # a local path is not a public URL; the variants replace it
+    if _pillow() is None:
+        product.image_url = url_for('static', filename=store_original(data, app.static_folder))
+        _drop_variants(product)
+        return None
+    return data
+
+
+def _spool_path(app, name):
+    return os.path.join(app.instance_path, SPOOL_SUBDIR, name)
+
+
+@tasks.handler('product_image')
+def process_product_image(app, product_id, spool):
+    """Build the variants of a spooled upload and point the product at them. Runs in the task worker."""
+    path = _spool_path(app, spool)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise tasks.PermanentError(f'Spooled image {spool} is gone.')
+    key, widths = build_variants(data, app.static_folder)
+    # Bumping the version keeps an admin form opened before the upload from saving over the new image.
+    # The web workers drop the product and its page when they sync with the repository's shared store.
+    db.session.execute(
+        update(Product).where(Product.id == product_id)
+        .values(image_key=key, image_widths=','.join(map(str, widths)), version=Product.version + 1)
+    )
+    mark_changed([product_id])
+    db.session.commit()
+    os.remove(path)
+    return {'key': key, 'widths': widths}
+
+
+def schedule_product_image(app, product_id, data):
+    """Spool ``data`` under the instance folder and queue the variant generation.
+
+    The task joins the caller's transaction (see ``tasks.enqueue``); uploading
+    the same image again while it is still queued does not add a second task.
+    """
+    spool = f'{product_id}-{content_key(data)}'
+    path = _spool_path(app, spool)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        _atomic_write(path, lambda f: f.write(data))
+    return tasks.enqueue('product_image', {'product_id': product_id, 'spool': spool}, key=f'product_image:{spool}')
+
+
+def init_images(app):
+    prefix = f'{app.static_url_path}/{IMAGE_SUBDIR}/'.replace(os.sep, '/')
+
+    @app.after_request
+    def cache_image_variants(response):
+        # Content-addressed files never change, so browsers and CDNs may keep them for a year
+        if request.path.startswith(prefix) and response.status_code == 200:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = FAR_FUTURE
+            response.cache_control.immutable = True
+        return response
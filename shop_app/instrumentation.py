@@ -0,0 +1,202 @@
+# Opt-in request timing, SQL and template instrumentation, exported in Prometheus text format
+import threading
+import time
+from bisect import bisect_left
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, the shape Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items())
+
+
+class Metrics:
+    """One app's request, SQL and template series; ``init_instrumentation`` keeps it in ``app.extensions['metrics']``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = {}   # (endpoint, method) -> Histogram
+        self.request_queries = {}   # endpoint -> Histogram of statements per request
+        self.template_render = {}   # template name -> Histogram
+        self.responses = {}         # (endpoint, status) -> count
+        self.sql_seconds = {}       # endpoint -> cumulative seconds spent in the database
+        self.n_plus_one = {}        # endpoint -> requests over the query threshold
+
+    def _histogram(self, table, key, buckets):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def observe_request(self, endpoint, method, status, seconds, queries, sql_seconds, over_threshold):
+        with self._lock:
+            self._histogram(self.request_latency, (endpoint, method), LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.request_queries, endpoint, QUERY_COUNT_BUCKETS).observe(queries)
+            self.responses[(endpoint, status)] = self.responses.get((endpoint, status), 0) + 1
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + sql_seconds
+            if over_threshold:
+                self.n_plus_one[endpoint] = self.n_plus_one.get(endpoint, 0) + 1
+
+    def observe_template(self, name, seconds):
+        with self._lock:
+            self._histogram(self.template_render, name, LATENCY_BUCKETS).observe(seconds)
+
+    def render_prometheus(self, extra_gauges=()):
+        lines = []
+
+        def histogram(name, help_text, table, label_names):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, hist in sorted(table.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                labels = dict(zip(label_names, key))
+                for bound, total in hist.cumulative():
+                    lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {total}')
+                lines.append(f'{name}_sum{{{_labels(**labels)}}} {hist.sum}')
+                lines.append(f'{name}_count{{{_labels(**labels)}}} {hist.count}')
+
+        def counter(name, help_text, table, label_names):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(table.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f'{name}{{{_labels(**dict(zip(label_names, key)))}}} {value}')
+
+        with self._lock:
+            histogram('shop_request_duration_seconds', 'Request latency by endpoint.',
+                      self.request_latency, ('endpoint', 'method'))
+            histogram('shop_request_sql_queries', 'SQL statements executed per request.',
+                      self.request_queries, ('endpoint',))
+            histogram('shop_template_render_seconds', 'Jinja render time by template.',
+                      self.template_render, ('template',))
+            counter('shop_responses_total', 'Responses by endpoint and status code.',
+                    self.responses, ('endpoint', 'status'))
+            counter('shop_sql_seconds_total', 'Time spent executing SQL, by endpoint.',
+                    self.sql_seconds, ('endpoint',))
+            counter('shop_n_plus_one_requests_total', 'Requests that ran more SQL statements than the N+1 threshold.',
+                    self.n_plus_one, ('endpoint',))
+        for name, help_text, value in extra_gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _timing():
+    return g.get('_timing') if has_request_context() else None
+
+
+# The start time lives on the statement's execution context, so a statement that raises leaves nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _record_query(context):
+    start = getattr(context, '_query_start', None)
+    timing = _timing()
+    if start is not None and timing is not None:
+        timing['queries'] += 1
+        timing['sql'] += time.perf_counter() - start
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(context)
+
+
+def _handle_error(exception_context):
+    # Failed statements took database time too
+    _record_query(exception_context.execution_context)
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        timing['render_stack'].append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing['render_stack']:
+        elapsed = time.perf_counter() - timing['render_stack'].pop()
+        timing['templates'] += elapsed
+        sender.extensions['metrics'].observe_template(template.name or '<string>', elapsed)
+
+
+def init_instrumentation(app, db):
+    """Hook request, SQL and template timing into ``app`` when ``INSTRUMENTATION_ENABLED`` is set.
+
+    Responses get a ``Server-Timing`` header (``db``, ``tpl`` and ``app`` durations in ms)
+    and requests running more than ``N_PLUS_ONE_THRESHOLD`` statements are logged.
+    """
+    app.config.setdefault('INSTRUMENTATION_ENABLED', False)
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', 20)
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    metrics = app.extensions['metrics'] = Metrics()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_timer():
+        g._timing = {'start': time.perf_counter(), 'queries': 0, 'sql': 0.0, 'templates': 0.0, 'render_stack': []}
+
+    @app.after_request
+    def record_timing(response):
+        timing = g.pop('_timing', None)
+        if timing is None:
+            return response
+        total = time.perf_counter() - timing['start']
+        endpoint = request.endpoint or 'unmatched'
+        threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        over_threshold = timing['queries'] > threshold
+        if over_threshold:
+            app.logger.warning('Possible N+1: %s %s ran %d SQL statements (threshold %d)',
+                               request.method, request.path, timing['queries'], threshold)
+        metrics.observe_request(endpoint, request.method, response.status_code, total,
+                                timing['queries'], timing['sql'], over_threshold)
+        response.headers['Server-Timing'] = (
+            f'db;dur={timing["sql"] * 1000:.2f};desc="{timing["queries"]} queries", '
+            f'tpl;dur={timing["templates"] * 1000:.2f}, '
+            f'app;dur={total * 1000:.2f}'
+        )
+        return response
+
+
+def current_metrics():
+    """The current app's ``Metrics``; ``None`` when instrumentation is off."""
+    return current_app.extensions.get('metrics')
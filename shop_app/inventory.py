@@ -0,0 +1,185 @@
+# Stock reservations: atomic decrements for checkout, with expiry and a sweeper
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select, update
+
+from extensions import db
+from models import Product, StockReservation
+from repository import mark_changed
+from validators import MAX_INTEGER
+
+DEFAULT_TTL = 15 * 60  # seconds a reservation holds stock before the sweeper returns it
+
+_product = Product.__table__
+_reservation = StockReservation.__table__
+
+# Executemany-friendly "give the units back" statement
+_restock = (
+    update(_product)
+    .where(_product.c.id == bindparam('pid'))
+    .values(stock=_product.c.stock + bindparam('qty'), version=_product.c.version + 1)
+)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f'Not enough stock for product {product_id} (requested {requested}).')
+        self.product_id = product_id
+        self.requested = requested
+
+
+class ReservationNotFound(LookupError):
+    pass
+
+
+class ProductNotFound(LookupError):
+    def __init__(self, product_id):
+        super().__init__(f'Product {product_id} does not exist.')
+        self.product_id = product_id
+
+
+def _merge_lines(lines):
+    """``{product_id: qty}`` or ``[(product_id, qty), ...]`` -> Counter, rejecting non-positive quantities."""
+    items = lines.items() if hasattr(lines, 'items') else lines
+    merged = Counter()
+    for product_id, quantity in items:
+        product_id, quantity = int(product_id), int(quantity)
+        if quantity <= 0:
+            raise ValueError('Quantities must be positive integers.')
+        if not 0 < product_id <= MAX_INTEGER:
+            raise ValueError(f'Product ids must be between 1 and {MAX_INTEGER}.')
+        merged[product_id] += quantity
+        if merged[product_id] > MAX_INTEGER:
+            raise ValueError(f'Quantities must be at most {MAX_INTEGER}.')
+    if not merged:
+        raise ValueError('A reservation needs at least one line.')
+    return merged
+
+
+def reserve(lines, ttl=DEFAULT_TTL):
+    """Take stock for every line of an order in one transaction; returns ``(token, expires_at)``.
+
+    Each line is a conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n``;
+    the database serialises concurrent decrements, so stock can never go negative.
+    If any line cannot be satisfied the whole order is rolled back and
+    ``InsufficientStock`` is raised, or ``ProductNotFound`` for a product that
+    does not exist.
+    """
+    merged = _merge_lines(lines)
+    token = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    try:
+        # Fixed product order so concurrent multi-line orders take row locks in the same order
+        for product_id, quantity in sorted(merged.items()):
+            result = db.session.execute(
+                update(_product)
+                .where(_product.c.id == product_id, _product.c.stock >= quantity)
+                .values(stock=_product.c.stock - quantity, version=_product.c.version + 1)
+            )
+            if result.rowcount != 1:
+                # Only a failed line pays for telling a missing product from a sold-out one
+                if db.session.execute(select(_product.c.id).where(_product.c.id == product_id)).first() is None:
+                    raise ProductNotFound(product_id)
+                raise InsufficientStock(product_id, quantity)
+        mark_changed(merged)
+        db.session.execute(_reservation.insert(), [
+            {'token': token, 'product_id': product_id, 'quantity': quantity, 'status': 'held',
+             'expires_at': expires_at, 'created_at': datetime.utcnow()}
+            for product_id, quantity in merged.items()
+        ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return token, expires_at
+
+
+def confirm(token, commit=True):
+    """Turn a held reservation into a sale and return its ``[(product_id, quantity), ...]`` lines.
+
+    Raises ``ReservationNotFound`` if it is unknown, released or expired. With
+    ``commit=False`` the caller commits, so the order can be written in the same transaction.
+    """
+    lines = db.session.execute(
+        update(_reservation)
+        .where(_reservation.c.token == token, _reservation.c.status == 'held',
+               _reservation.c.expires_at > datetime.utcnow())
+        .values(status='confirmed')
+        .returning(_reservation.c.product_id, _reservation.c.quantity)
+    ).all()
+    if not lines:
+        db.session.rollback()
+        raise ReservationNotFound(token)
+    if commit:
+        db.session.commit()
+    return [tuple(line) for line in lines]
+
+
+def _return_stock(condition, status):
+    """Flip matching held reservations to ``status`` and put their units back, atomically.
+
+    ``RETURNING`` reports exactly the rows this statement flipped, so a reservation
+    confirmed or released concurrently is never restocked twice.
+    """
+    try:
+        claimed = db.session.execute(
+            update(_reservation)
+            .where(condition, _reservation.c.status == 'held')
+            .values(status=status)
+            .returning(_reservation.c.product_id, _reservation.c.quantity)
+        ).all()
+        totals = Counter()
+        for product_id, quantity in claimed:
+            totals[product_id] += quantity
+        if totals:
+            db.session.execute(_restock, [{'pid': pid, 'qty': qty} for pid, qty in sorted(totals.items())])
+            mark_changed(totals)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(claimed)
+
+
+def release(token):
+    """Cancel a held reservation and return its stock. Raises ``ReservationNotFound`` if nothing was held."""
+    if not _return_stock(_reservation.c.token == token, 'released'):
+        raise ReservationNotFound(token)
+
+
+def sweep_expired(now=None, batch_size=500):
+    """Return the stock of held reservations past their expiry; returns how many lines were reclaimed."""
+    now = now or datetime.utcnow()
+    reclaimed = 0
+    while True:
+        expired_ids = (
+            select(_reservation.c.id)
+            .where(_reservation.c.status == 'held', _reservation.c.expires_at <= now)
+            .limit(batch_size)
+        )
+        count = _return_stock(_reservation.c.id.in_(expired_ids), 'expired')
+        reclaimed += count
+        if count < batch_size:
+            return reclaimed
+
+
+def start_sweeper(app, interval):
+    """Run ``sweep_expired`` every ``interval`` seconds in a daemon thread of this process."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    reclaimed = sweep_expired()
+                    if reclaimed:
+                        app.logger.info('Reservation sweeper returned stock for %d lines', reclaimed)
+            except Exception:
+                app.logger.exception('Reservation sweep failed')
+
+    thread = threading.Thread(target=run, name='reservation-sweeper', daemon=True)
+    thread.start()
+    return thread
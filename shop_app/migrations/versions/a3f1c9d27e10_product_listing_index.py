@@ -0,0 +1,30 @@
+"""Index for the keyset-paginated storefront listing
+
+Revision ID: a3f1c9d27e10
+Revises: 5c39018b3e16
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d27e10'
+down_revision = '5c39018b3e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Partial index on (name, id) restricted to stock > 0. A plain (stock, name, id)
+    # index cannot serve ORDER BY name after a range condition on stock, so the
+    # planner would still sort; this one yields rows already in listing order.
+    op.create_index(
+        'ix_product_in_stock_name_id', 'product', ['name', 'id'], unique=False,
+        sqlite_where=sa.text('stock > 0'), postgresql_where=sa.text('stock > 0'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_product_in_stock_name_id', table_name='product')
@@ -0,0 +1,109 @@
+"""Categories, subcategories and brands, with materialised facet counts
+
+Revision ID: a8e3f7c2d614
+Revises: f4d2b8e6a1c9
+Create Date: 2026-10-18 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e3f7c2d614'
+down_revision = 'f4d2b8e6a1c9'
+branch_labels = None
+depends_on = None
+
+
+def _add_reference(column, target):
+    if op.get_bind().dialect.name == 'sqlite':
+        # Alembic would add the foreign key as a separate ALTER, which SQLite lacks; inline REFERENCES is allowed
+        op.execute(f'ALTER TABLE product ADD COLUMN {column} INTEGER REFERENCES {target} (id)')
+    else:
+        op.add_column('product', sa.Column(column, sa.Integer(), nullable=True))
+        op.create_foreign_key(f'fk_product_{column}', 'product', target, [column], ['id'])
+
+
+def upgrade():
+    op.create_table('category',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('brand',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('subcategory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('category_id', 'name')
+    )
+    op.create_index(op.f('ix_subcategory_category_id'), 'subcategory', ['category_id'], unique=False)
+    op.create_table('product_facet',
+    sa.Column('category_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('subcategory_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('brand_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('category_id', 'subcategory_id', 'brand_id')
+    )
+
+    # Plain ALTER TABLE (see d91f5c3a7b28): batch mode would drop the product_fts triggers,
+    # and with foreign_keys=ON dropping the old product table cascades to stock_reservation
+    _add_reference('category_id', 'category')
+    _add_reference('subcategory_id', 'subcategory')
+    _add_reference('brand_id', 'brand')
+    op.create_index(op.f('ix_product_category_id'), 'product', ['category_id'], unique=False)
+    op.create_index(op.f('ix_product_subcategory_id'), 'product', ['subcategory_id'], unique=False)
+    op.create_index(op.f('ix_product_brand_id'), 'product', ['brand_id'], unique=False)
+
+    # Triggers keeping product_facet current, as in facets.FACET_DDL (SQLite only;
+    # other databases count live), then the counts of the existing products
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    key = 'category_id, subcategory_id, brand_id'
+    old = ('category_id = coalesce(old.category_id, 0) AND subcategory_id = coalesce(old.subcategory_id, 0) '
+           'AND brand_id = coalesce(old.brand_id, 0)')
+    new = 'coalesce(new.category_id, 0), coalesce(new.subcategory_id, 0), coalesce(new.brand_id, 0)'
+    op.execute(f"""CREATE TRIGGER product_facet_ai AFTER INSERT ON product WHEN new.stock > 0 BEGIN
+        INSERT INTO product_facet({key}, product_count) VALUES ({new}, 1)
+        ON CONFLICT({key}) DO UPDATE SET product_count = product_count + 1;
+    END""")
+    op.execute(f"""CREATE TRIGGER product_facet_ad AFTER DELETE ON product WHEN old.stock > 0 BEGIN
+        UPDATE product_facet SET product_count = product_count - 1 WHERE {old};
+    END""")
+    op.execute(f"""CREATE TRIGGER product_facet_au AFTER UPDATE OF stock, category_id, subcategory_id, brand_id ON product
+    WHEN (old.stock > 0) IS NOT (new.stock > 0) OR old.category_id IS NOT new.category_id
+        OR old.subcategory_id IS NOT new.subcategory_id OR old.brand_id IS NOT new.brand_id BEGIN
+        UPDATE product_facet SET product_count = product_count - 1 WHERE {old} AND old.stock > 0;
+        INSERT INTO product_facet({key}, product_count) SELECT {new}, 1 WHERE new.stock > 0
+        ON CONFLICT({key}) DO UPDATE SET product_count = product_count + 1;
+    END""")
+    op.execute(f"""INSERT INTO product_facet({key}, product_count)
+        SELECT coalesce(category_id, 0), coalesce(subcategory_id, 0), coalesce(brand_id, 0), count(*)
+        FROM product WHERE stock > 0 GROUP BY 1, 2, 3""")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS product_facet_au')
+        op.execute('DROP TRIGGER IF EXISTS product_facet_ad')
+        op.execute('DROP TRIGGER IF EXISTS product_facet_ai')
+    op.drop_index(op.f('ix_product_brand_id'), table_name='product')
+    op.drop_index(op.f('ix_product_subcategory_id'), table_name='product')
+    op.drop_index(op.f('ix_product_category_id'), table_name='product')
+    op.drop_column('product', 'brand_id')
+    op.drop_column('product', 'subcategory_id')
+    op.drop_column('product', 'category_id')
+    op.drop_table('product_facet')
+    op.drop_index(op.f('ix_subcategory_category_id'), table_name='subcategory')
+    op.drop_table('subcategory')
+    op.drop_table('brand')
+    op.drop_table('category')
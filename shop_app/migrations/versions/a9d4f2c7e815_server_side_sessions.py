@@ -0,0 +1,32 @@
+"""Server-side sessions
+
+Revision ID: a9d4f2c7e815
+Revises: f8c2d6a4e197
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4f2c7e815'
+down_revision = 'f8c2d6a4e197'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('web_session',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # The purger deletes by expiry
+    op.create_index(op.f('ix_web_session_expires_at'), 'web_session', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_web_session_expires_at'), table_name='web_session')
+    op.drop_table('web_session')
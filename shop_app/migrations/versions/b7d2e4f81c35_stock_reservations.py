@@ -0,0 +1,38 @@
+"""Stock reservations for checkout
+
+Revision ID: b7d2e4f81c35
+Revises: a3f1c9d27e10
+Create Date: 2026-10-18 17:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e4f81c35'
+down_revision = 'a3f1c9d27e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=32), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_reservation_token', 'stock_reservation', ['token'], unique=False)
+    op.create_index('ix_stock_reservation_status_expires_at', 'stock_reservation', ['status', 'expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stock_reservation_status_expires_at', table_name='stock_reservation')
+    op.drop_index('ix_stock_reservation_token', table_name='stock_reservation')
+    op.drop_table('stock_reservation')
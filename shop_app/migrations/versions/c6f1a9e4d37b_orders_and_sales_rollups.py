@@ -0,0 +1,67 @@
+"""Orders and daily sales rollups
+
+Revision ID: c6f1a9e4d37b
+Revises: b3c9d1e7f250
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1a9e4d37b'
+down_revision = 'b3c9d1e7f250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shop_order',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=32), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('total_cents', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token')
+    )
+    op.create_index(op.f('ix_shop_order_created_at'), 'shop_order', ['created_at'], unique=False)
+    op.create_table('order_line',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('product_name', sa.String(length=100), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('unit_price_cents', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['shop_order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_order_line_order_id'), 'order_line', ['order_id'], unique=False)
+    op.create_table('sales_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue_cents', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'status')
+    )
+    op.create_table('product_sales_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue_cents', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'product_id', 'status')
+    )
+
+
+def downgrade():
+    op.drop_table('product_sales_daily')
+    op.drop_table('sales_daily')
+    op.drop_index(op.f('ix_order_line_order_id'), table_name='order_line')
+    op.drop_table('order_line')
+    op.drop_index(op.f('ix_shop_order_created_at'), table_name='shop_order')
+    op.drop_table('shop_order')
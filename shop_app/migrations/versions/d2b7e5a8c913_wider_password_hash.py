@@ -0,0 +1,33 @@
+"""Room for scrypt password hashes
+
+Revision ID: d2b7e5a8c913
+Revises: c6f1a9e4d37b
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e5a8c913'
+down_revision = 'c6f1a9e4d37b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nothing references the user table, so rebuilding it in batch mode is safe
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=120),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=120),
+               existing_nullable=False)
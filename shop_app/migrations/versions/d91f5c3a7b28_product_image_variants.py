@@ -0,0 +1,28 @@
+"""Product image variants
+
+Revision ID: d91f5c3a7b28
+Revises: c4e8a1b6d902
+Create Date: 2026-10-18 18:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f5c3a7b28'
+down_revision = 'c4e8a1b6d902'
+branch_labels = None
+depends_on = None
+
+
+# Plain ALTER TABLE rather than batch mode: a batch "copy and move" would
+# recreate product and silently drop the product_fts triggers.
+def upgrade():
+    op.add_column('product', sa.Column('image_key', sa.String(length=32), nullable=True))
+    op.add_column('product', sa.Column('image_widths', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('product', 'image_widths')
+    op.drop_column('product', 'image_key')
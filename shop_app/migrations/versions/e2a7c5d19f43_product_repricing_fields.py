@@ -0,0 +1,32 @@
+"""Product repricing fields
+
+Revision ID: e2a7c5d19f43
+Revises: d91f5c3a7b28
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5d19f43'
+down_revision = 'd91f5c3a7b28'
+branch_labels = None
+depends_on = None
+
+
+# Plain ALTER TABLE (see d91f5c3a7b28): batch mode would drop the product_fts triggers.
+# The NOT NULL columns carry server defaults so existing rows are filled in.
+def upgrade():
+    op.add_column('product', sa.Column('cost_price', sa.Float(), nullable=True))
+    op.add_column('product', sa.Column('cost_currency', sa.String(length=3), server_default='USD', nullable=False))
+    op.add_column('product', sa.Column('margin', sa.Float(), nullable=True))
+    op.add_column('product', sa.Column('igv_rate', sa.Float(), server_default='18', nullable=False))
+
+
+def downgrade():
+    op.drop_column('product', 'igv_rate')
+    op.drop_column('product', 'margin')
+    op.drop_column('product', 'cost_currency')
+    op.drop_column('product', 'cost_price')
@@ -0,0 +1,26 @@
+"""Product modification time for incremental static exports
+
+Revision ID: e5a3c8f1b046
+Revises: d2b7e5a8c913
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a3c8f1b046'
+down_revision = 'd2b7e5a8c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN, never batch mode on product (see migrations/README)
+    op.add_column('product', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE product SET updated_at = CURRENT_TIMESTAMP')
+
+
+def downgrade():
+    op.drop_column('product', 'updated_at')
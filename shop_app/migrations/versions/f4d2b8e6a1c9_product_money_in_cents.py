@@ -0,0 +1,37 @@
+"""Store product prices as integer cents
+
+Revision ID: f4d2b8e6a1c9
+Revises: e2a7c5d19f43
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4d2b8e6a1c9'
+down_revision = 'e2a7c5d19f43'
+branch_labels = None
+depends_on = None
+
+
+# New INTEGER columns filled from the old FLOAT ones, then the old ones are
+# dropped. Plain ALTER TABLE (see d91f5c3a7b28) keeps the product_fts triggers;
+# changing the type in place would need a batch-mode table rebuild.
+def upgrade():
+    # The server default only fills the NOT NULL column for the ALTER; the UPDATE sets the real values
+    op.add_column('product', sa.Column('price_cents', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('product', sa.Column('cost_price_cents', sa.Integer(), nullable=True))
+    op.execute('UPDATE product SET price_cents = CAST(ROUND(price * 100) AS INTEGER), '
+               'cost_price_cents = CAST(ROUND(cost_price * 100) AS INTEGER)')
+    op.drop_column('product', 'cost_price')
+    op.drop_column('product', 'price')
+
+
+def downgrade():
+    op.add_column('product', sa.Column('price', sa.Float(), server_default='0', nullable=False))
+    op.add_column('product', sa.Column('cost_price', sa.Float(), nullable=True))
+    op.execute('UPDATE product SET price = price_cents / 100.0, cost_price = cost_price_cents / 100.0')
+    op.drop_column('product', 'cost_price_cents')
+    op.drop_column('product', 'price_cents')
@@ -0,0 +1,38 @@
+"""Product version counter and change history
+
+Revision ID: f8c2d6a4e197
+Revises: e5a3c8f1b046
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8c2d6a4e197'
+down_revision = 'e5a3c8f1b046'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=16), nullable=False),
+    sa.Column('changes', sa.JSON(), nullable=False),
+    sa.Column('changed_by', sa.String(length=80), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_product_history_product_id_id', 'product_history', ['product_id', 'id'], unique=False)
+    # Plain ADD COLUMN, never batch mode on product (see migrations/README)
+    op.add_column('product', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('product', 'version')
+    op.drop_index('ix_product_history_product_id_id', table_name='product_history')
+    op.drop_table('product_history')
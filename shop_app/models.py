@@ -1,22 +1,220 @@
 # Database models
-from app import db # Import db from app.py
+from datetime import datetime
+
+from extensions import db # Bound to the app in create_app()
+from money import Money
+
+# Columns exposed by exports and the JSON APIs, in output order
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'image_url',
+                  'cost_price', 'cost_currency', 'margin', 'igv_rate',
+                  'category_id', 'subcategory_id', 'brand_id')
+
+DEFAULT_IGV_RATE = 18.0 # Peruvian sales tax, in percent
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column('price_cents', Money, key='price', nullable=False) # Decimal in Python, integer cents in the table
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(200))
+    image_key = db.Column(db.String(32)) # Content hash of the processed image, see images.py
+    image_widths = db.Column(db.String(32)) # Comma-separated widths of the generated variants
+    # Repricing inputs, see pricing.py; without a cost price the price is set by hand
+    cost_price = db.Column('cost_price_cents', Money, key='cost_price') # In cost_currency
+    cost_currency = db.Column(db.String(3), nullable=False, default='USD', server_default='USD')
+    margin = db.Column(db.Float) # Percent over the price with IGV; None uses PRICING_DEFAULT_MARGIN
+    igv_rate = db.Column(db.Float, nullable=False, default=DEFAULT_IGV_RATE, server_default='18')
+    # Storefront filters; the in-stock counts per value live in product_facet, see facets.py.
+    # No ON DELETE action (SQLite cannot add one without rebuilding the table): facets.detach_products
+    # clears an entry from its products before it is deleted.
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
+    subcategory_id = db.Column(db.Integer, db.ForeignKey('subcategory.id'), index=True)
+    brand_id = db.Column(db.Integer, db.ForeignKey('brand.id'), index=True)
+    # Set by every ORM and Core UPDATE (not raw SQL); `flask export-static` re-renders what changed since
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optimistic locking: ORM updates check and bump it, so an edit based on a stale read fails with
+    # StaleDataError instead of overwriting. Set-based writes (repricing, stock, imports) bump it themselves.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (
+        # Partial index matching the storefront query (stock > 0 ORDER BY name, id):
+        # the listing becomes an ordered index range scan with no sort step.
+        db.Index('ix_product_in_stock_name_id', 'name', 'id',
+                 sqlite_where=db.text('stock > 0'), postgresql_where=db.text('stock > 0')),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+    @property
+    def image_variant_widths(self):
+        return [int(width) for width in self.image_widths.split(',')] if self.image_key and self.image_widths else []
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
+class Category(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    subcategories = db.relationship('Subcategory', backref='category', order_by='Subcategory.name',
+                                    cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
+class Subcategory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(80), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('category_id', 'name'),)
+
+    def __repr__(self):
+        return f'<Subcategory {self.name}>'
+
+class Brand(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<Brand {self.name}>'
+
+class ProductFacet(db.Model):
+    """In-stock product count per (category, subcategory, brand) combination; 0 stands for "none".
+
+    Maintained by triggers on product (see facets.py), so every write path keeps
+    it current: admin form, bulk import, repricing and stock reservations.
+    """
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    subcategory_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    brand_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ProductFacet {self.category_id}/{self.subcategory_id}/{self.brand_id}: {self.product_count}>'
+
+class StockReservation(db.Model):
+    """Units taken out of Product.stock for a pending checkout; see inventory.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False, index=True) # Groups the lines of one order
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='held') # held, confirmed, released, expired
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # The sweeper looks for held reservations past their expiry
+        db.Index('ix_stock_reservation_status_expires_at', 'status', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<StockReservation {self.token} product={self.product_id} x{self.quantity} {self.status}>'
+
+ORDER_STATUSES = ('pending', 'paid', 'shipped', 'delivered', 'cancelled', 'refunded')
+
+class Order(db.Model):
+    """A confirmed checkout; see orders.py. Every change also updates the reporting rollups."""
+    __tablename__ = 'shop_order' # ORDER is an SQL keyword
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), unique=True) # Stock reservation it came from
+    status = db.Column(db.String(16), nullable=False, default='pending') # One of ORDER_STATUSES
+    email = db.Column(db.String(120))
+    total = db.Column('total_cents', Money, key='total', nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    lines = db.relationship('OrderLine', backref='order', cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Order {self.id} {self.status}>'
+
+class OrderLine(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('shop_order.id', ondelete='CASCADE'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False) # No foreign key: order history outlives products
+    product_name = db.Column(db.String(100), nullable=False) # As sold
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column('unit_price_cents', Money, key='unit_price', nullable=False)
+
+    def __repr__(self):
+        return f'<OrderLine {self.product_name} x{self.quantity}>'
+
+class SalesDaily(db.Model):
+    """Orders, units and revenue per day and order status; kept current by reporting.py."""
+    day = db.Column(db.Date, primary_key=True) # UTC day the order was placed
+    status = db.Column(db.String(16), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column('revenue_cents', Money, key='revenue', nullable=False, default=0)
+
+class ProductSalesDaily(db.Model):
+    """Units and revenue per day, product and order status; kept current by reporting.py."""
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status = db.Column(db.String(16), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column('revenue_cents', Money, key='revenue', nullable=False, default=0)
+
+class ProductHistory(db.Model):
+    """One change to a product: a JSON diff of the changed fields, by whom and when. Append-only; see history.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False) # No foreign key: the history outlives the product
+    version = db.Column(db.Integer, nullable=False) # Product.version after the change
+    action = db.Column(db.String(16), nullable=False) # 'create', 'update' or 'delete'
+    changes = db.Column(db.JSON, nullable=False) # {field: [old, new]}; just the values on create and delete
+    changed_by = db.Column(db.String(80)) # Admin username; None outside an admin request
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Per-product history, newest first, paged with WHERE id < :before
+        db.Index('ix_product_history_product_id_id', 'product_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<ProductHistory {self.product_id} v{self.version} {self.action}>'
+
+class Task(db.Model):
+    """A unit of background work, run by `flask worker`; see tasks.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False) # Handler registered with tasks.handler()
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(16), nullable=False, default='queued') # queued, running, done, failed
+    idempotency_key = db.Column(db.String(128)) # At most one queued or running task per key
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Not before; pushed back by retries
+    locked_by = db.Column(db.String(64)) # Worker running it
+    locked_until = db.Column(db.DateTime) # Lease; an expired lease means the worker died
+    last_error = db.Column(db.Text)
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Workers poll for queued tasks that are due
+        db.Index('ix_task_status_run_at', 'status', 'run_at'),
+        db.Index('uq_task_active_idempotency_key', 'idempotency_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+
+    def __repr__(self):
+        return f'<Task {self.id} {self.name} {self.status}>'
+
 class User(db.Model): # Optional User/Admin model
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False) # werkzeug.security hash; see auth.py
     is_admin = db.Column(db.Boolean, default=False)
 
     def __repr__(self):
         return f'<User {self.username}>'
+
+class WebSession(db.Model):
+    """Server-side session data (admin login, shopping cart); the cookie only carries the signed id. See session_store.py."""
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False) # Compact JSON, zlib-compressed when that is smaller
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # Pushed forward as the visitor comes back
+
+    def __repr__(self):
+        return f'<WebSession {self.id[:8]}… until {self.expires_at}>'
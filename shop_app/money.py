@@ -0,0 +1,69 @@
+# Money as integer cents in the database and Decimal in Python
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Integer, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal('0.01')
+
+
+def to_decimal(value):
+    """``'19.9'``, ``19.9``, ``Decimal('19.899')`` -> ``Decimal('19.90')`` (half up); ``ValueError`` if not a number."""
+    if isinstance(value, float):
+        value = repr(value)  # shortest round-trip text, so 19.9 is 19.9 and not 19.899999...
+    try:
+        amount = Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'Invalid amount {value!r}.')
+    if not amount.is_finite():
+        raise ValueError(f'Invalid amount {value!r}.')
+    return amount
+
+
+class Money(TypeDecorator):
+    """An amount stored as an INTEGER number of cents and loaded as a two-place ``Decimal``.
+
+    Sums and comparisons run on exact integers in SQL: ``func.sum(Product.price)``
+    comes back as a ``Decimal``, and ``Product.price >= Decimal('10.5')`` binds 1050.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_decimal(value) / CENT)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return (Decimal(int(value)) * CENT).quantize(CENT)
+
+
+def cents(column):
+    """The raw integer cents of a ``Money`` column, for SQL arithmetic such as ``cents(price) * stock``."""
+    return type_coerce(column, Integer)
+
+
+def as_money(expression):
+    """Read an integer-cents SQL expression back as ``Decimal`` amounts."""
+    return type_coerce(expression, Money())
+
+
+class MoneyJSONProvider(DefaultJSONProvider):
+    """``jsonify`` amounts as JSON numbers (``19.9``) rather than Flask's default of strings."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
+
+
+def json_default(o):
+    """``default=`` hook for ``json.dumps`` calls outside ``jsonify`` (streamed API, NDJSON export)."""
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
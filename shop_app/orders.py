@@ -0,0 +1,65 @@
+# Orders: placed from confirmed stock reservations; every change goes through here so the reporting rollups follow
+from datetime import datetime
+
+from sqlalchemy import update
+
+from extensions import db
+from models import ORDER_STATUSES, Order, OrderLine, Product
+import inventory
+import reporting
+
+
+class OrderConflict(Exception):
+    """The order changed status in another request since it was read."""
+
+
+def place_order(token, email=None):
+    """Confirm the reservation ``token`` and record it as a pending order at today's prices, in one transaction.
+
+    Raises ``inventory.ReservationNotFound`` like ``inventory.confirm``.
+    """
+    lines = inventory.confirm(token, commit=False)
+    try:
+        products = {p.id: p for p in Product.query.filter(Product.id.in_([pid for pid, _ in lines]))}
+        order = Order(token=token, email=email or None, status='pending')
+        for product_id, quantity in sorted(lines):
+            product = products[product_id]  # reservations cascade with their product, so it exists
+            order.lines.append(OrderLine(product_id=product_id, product_name=product.name,
+                                         quantity=quantity, unit_price=product.price))
+        order.total = sum(line.unit_price * line.quantity for line in order.lines)
+        db.session.add(order)
+        db.session.flush()  # fills in created_at
+        reporting.record_order(order)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return order
+
+
+def set_status(order, status):
+    """Move ``order`` to ``status`` and its figures to the matching rollup rows.
+
+    The status is changed with a conditional UPDATE, so two admins changing the
+    same order at once cannot both move its figures: the second gets ``OrderConflict``.
+    """
+    if status not in ORDER_STATUSES:
+        raise ValueError(f'Unknown order status "{status}".')
+    if status == order.status:
+        return order
+    try:
+        reporting.record_order(order, -1)
+        changed = db.session.execute(
+            update(Order).where(Order.id == order.id, Order.status == order.status)
+            .values(status=status, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            raise OrderConflict(f'Order {order.id} was changed by someone else; reload and try again.')
+        order.status = status
+        reporting.record_order(order)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return order
@@ -0,0 +1,96 @@
+# Keyset (cursor) pagination helpers
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row (e.g. ``(name, id)``) as an opaque URL-safe token."""
+    raw = json.dumps(list(values), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token, size):
+    """Decode a token produced by ``encode_cursor``; raises ``InvalidCursor`` on garbage."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor('Malformed pagination cursor.')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed pagination cursor.')
+    return values
+
+
+def keyset_after(columns, values):
+    """Row-value comparison ``(c1, c2, ...) > (v1, v2, ...)`` written portably.
+
+    SQLite and PostgreSQL can both turn this OR/AND expansion into an index range
+    scan, unlike ``OFFSET`` which has to walk every skipped row.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+
+def keyset_before(columns, values):
+    """Row-value comparison ``(c1, c2, ...) < (v1, v2, ...)``."""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i]))
+    return or_(*clauses)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query plus the cursors around it."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginate_keyset(query, columns, key, per_page, after=None, before=None):
+    """Fetch one page of ``query`` ordered by ``columns`` (ascending).
+
+    ``key`` maps a result row to the tuple of its sort values. ``after``/``before``
+    are decoded cursors; only one of them is honoured, ``after`` taking precedence.
+    One extra row is fetched to know whether another page exists, so no COUNT(*)
+    is ever issued.
+    """
+    if after is not None:
+        rows = query.filter(keyset_after(columns, after)) \
+            .order_by(*columns).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = rows[:per_page]
+        next_cursor = encode_cursor(key(items[-1])) if has_more and items else None
+        prev_cursor = encode_cursor(key(items[0])) if items else None
+    elif before is not None:
+        rows = query.filter(keyset_before(columns, before)) \
+            .order_by(*[c.desc() for c in columns]).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        prev_cursor = encode_cursor(key(items[0])) if has_more and items else None
+        next_cursor = encode_cursor(key(items[-1])) if items else None
+    else:
+        rows = query.order_by(*columns).limit(per_page + 1).all()
+        items = rows[:per_page]
+        next_cursor = encode_cursor(key(items[-1])) if len(rows) > per_page else None
+        prev_cursor = None
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,102 @@
+# Repricing: sale price from cost, exchange rate, IGV and margin, for every product in one UPDATE
+import time
+from datetime import datetime
+
+from sqlalchemy import Integer, case, cast, func, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db, page_cache
+from models import Product
+from money import cents
+from repository import ALL, mark_changed
+import fx
+import tasks
+
+ROUNDING_MODES = ('ceil', 'cent')
+
+
+def _ceil(expr):
+    # CEIL() is only in SQLite builds with the math functions; integer part, plus one for any fraction
+    whole = cast(expr, Integer)
+    return case((expr > whole, whole + 1), else_=whole)
+
+
+def price_expression(rates, default_margin, rounding='ceil'):
+    """SQL for ``cost * rate * (1 + igv%) * (1 + margin%)`` in integer cents, rounded per ``rounding``.
+
+    ``ceil`` rounds up to whole soles, as js/actualizar-precios.js did; ``cent``
+    rounds to the nearest cent. ``rates`` are soles per unit; currencies missing
+    from them (other than soles) give NULL.
+    """
+    rate = case({fx.BASE_CURRENCY: 1.0, **rates}, value=Product.cost_currency)
+    margin = func.coalesce(Product.margin, default_margin)
+    # Rounded to 4 places first so float noise such as 10000.0000000001 cents does not ceil to the next sol
+    raw = func.round(cents(Product.cost_price) * rate * (1 + Product.igv_rate / 100.0) * (1 + margin / 100.0), 4)
+    if rounding == 'ceil':
+        return _ceil(raw / 100.0) * 100
+    return cast(func.round(raw), Integer)
+
+
+def reprice(rates, default_margin=45, rounding='ceil', product_ids=None):
+    """Recompute ``price`` of every product that has a cost price, in one statement and one transaction.
+
+    Products without a cost price, or with a cost currency missing from
+    ``rates``, keep their price. Rows whose price would not change are not
+    written. Returns the number of products repriced.
+    """
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f'Unknown rounding mode "{rounding}".')
+    rates = {fx.BASE_CURRENCY: 1.0, **rates}
+    new_price = price_expression(rates, default_margin, rounding)
+    statement = (
+        update(Product)
+        .where(Product.cost_price.is_not(None), Product.cost_currency.in_(list(rates)), cents(Product.price) != new_price)
+        .values(price=new_price, version=Product.version + 1)  # an open edit form is now stale
+        .execution_options(synchronize_session=False)
+    )
+    if product_ids is not None:
+        statement = statement.where(Product.id.in_(product_ids))
+    updated = db.session.execute(statement).rowcount
+    mark_changed(product_ids if product_ids is not None else ALL)
+    db.session.commit()
+    return updated
+
+
+def run_repricing(app, refresh_rates=True, cached_only=False):
+    """Fetch the exchange rates, reprice the catalogue and drop the cached pages; returns a summary.
+
+    ``cached_only`` uses the rates in the cache file without asking the
+    provider, and raises ``fx.FxError`` if there are none.
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        if cached_only:
+            rates = fx.cached_rates(app)
+            if rates is None:
+                raise fx.FxError(f'No cached exchange rates in {fx._cache_path(app)}.')
+        else:
+            rates = fx.get_rates(app, refresh=refresh_rates)
+        updated = reprice(rates.rates, app.config['PRICING_DEFAULT_MARGIN'], app.config['PRICING_ROUNDING'])
+        page_cache.clear()
+    return {
+        'updated': updated,
+        'seconds': round(time.perf_counter() - started, 3),
+        'finished_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        **rates.to_dict(),
+    }
+
+
+@tasks.handler('reprice')
+def reprice_task(app, refresh_rates=True):
+    return run_repricing(app, refresh_rates=refresh_rates)
+
+
+def schedule_repricing():
+    """Queue a repricing run and commit; while one is queued or running, that one is returned."""
+    task = tasks.enqueue('reprice', key='reprice')
+    try:
+        db.session.commit()
+    except IntegrityError:  # queued by a concurrent request in the meantime
+        db.session.rollback()
+        task = tasks.latest('reprice')
+    return task
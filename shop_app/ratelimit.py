@@ -0,0 +1,150 @@
+# Sliding-window rate limiting (login attempts), in process memory or shared between workers through SQLite
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class SlidingWindowLimiter:
+    """At most ``limit`` hits per key in any ``window`` seconds.
+
+    Each key keeps the times of its last ``limit`` hits, so memory is bounded by
+    ``max_keys * limit``; past ``max_keys`` the least recently used keys are
+    forgotten. Counts are per process: use ``SQLiteSlidingWindowLimiter`` to
+    share them between workers.
+    """
+
+    def __init__(self, limit, window, max_keys=10000, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may hit again; 0 if it may now."""
+        now = self.clock()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                return 0
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if not hits:
+                del self._hits[key]
+                return 0
+            return max(0, hits[0] + self.window - now) if len(hits) >= self.limit else 0
+
+    def hit(self, key):
+        with self._lock:
+            self._append(key, self.clock())
+
+    def _append(self, key, at):
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque(maxlen=self.limit)
+        hits.append(at)
+        self._hits.move_to_end(key)
+        while len(self._hits) > self.max_keys:
+            self._hits.popitem(last=False)
+
+    def acquire(self, key):
+        """Hit ``key`` if it may hit now and return 0; otherwise return ``retry_after`` without hitting.
+
+        The check and the hit are one step, so concurrent callers cannot all get
+        past a check made before any of them hit.
+        """
+        now = self.clock()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is not None:
+                while hits and hits[0] <= now - self.window:
+                    hits.popleft()
+                if len(hits) >= self.limit:
+                    return max(0, hits[0] + self.window - now)
+            self._append(key, now)
+            return 0
+
+    def release(self, key):
+        """Take back the latest hit of ``key``."""
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits:
+                hits.pop()
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class SQLiteSlidingWindowLimiter(SlidingWindowLimiter):
+    """``SlidingWindowLimiter`` whose hits are rows in the SQLite file at ``path``, seen by every worker using it.
+
+    Expired rows are deleted as new hits arrive, so the file only holds the
+    traffic of the last ``window`` seconds. Limiters with different windows can
+    share a file as long as their keys differ.
+    """
+
+    def __init__(self, limit, window, path, clock=time.time):
+        super().__init__(limit, window, clock=clock)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit_hit '
+                               '(key TEXT NOT NULL, at REAL NOT NULL, expires_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_rate_limit_hit_key_at ON rate_limit_hit (key, at)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_rate_limit_hit_expires_at ON rate_limit_hit (expires_at)')
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def retry_after(self, key):
+        now = self.clock()
+        recent = [at for (at,) in self._connect().execute(
+            'SELECT at FROM rate_limit_hit WHERE key = ? AND at > ? ORDER BY at DESC LIMIT ?',
+            (key, now - self.window, self.limit))]
+        return max(0, recent[-1] + self.window - now) if len(recent) >= self.limit else 0
+
+    def hit(self, key):
+        now = self.clock()
+        with self._connect() as connection:
+            connection.execute('DELETE FROM rate_limit_hit WHERE expires_at <= ?', (now,))
+            connection.execute('INSERT INTO rate_limit_hit (key, at, expires_at) VALUES (?, ?, ?)',
+                               (key, now, now + self.window))
+
+    def acquire(self, key):
+        now = self.clock()
+        connection = self._connect()
+        # BEGIN IMMEDIATE takes the write lock before counting, so workers acquire one at a time
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            recent = [at for (at,) in connection.execute(
+                'SELECT at FROM rate_limit_hit WHERE key = ? AND at > ? ORDER BY at DESC LIMIT ?',
+                (key, now - self.window, self.limit))]
+            if len(recent) >= self.limit:
+                connection.rollback()
+                return max(0, recent[-1] + self.window - now)
+            connection.execute('DELETE FROM rate_limit_hit WHERE expires_at <= ?', (now,))
+            connection.execute('INSERT INTO rate_limit_hit (key, at, expires_at) VALUES (?, ?, ?)',
+                               (key, now, now + self.window))
+            connection.commit()
+            return 0
+        except BaseException:
+            connection.rollback()
+            raise
+
+    def release(self, key):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM rate_limit_hit WHERE rowid = (SELECT rowid FROM rate_limit_hit '
+                               'WHERE key = ? ORDER BY at DESC LIMIT 1)', (key,))
+
+    def reset(self, key):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM rate_limit_hit WHERE key = ?', (key,))
@@ -0,0 +1,148 @@
+# Sales reporting read model: daily rollups kept current as orders change, so the dashboard never scans orders
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, func, insert, select, update
+
+from extensions import db
+from models import Order, OrderLine, Product, ProductSalesDaily, SalesDaily
+from money import as_money, cents
+
+REVENUE_STATUSES = ('paid', 'shipped', 'delivered')  # orders that count as sales
+MAX_DAYS = 366
+
+
+def _bump(model, key, **deltas):
+    """Add ``deltas`` to the rollup row at ``key``, creating it on first use.
+
+    The UPDATE takes SQLite's write lock, so no other transaction can insert the
+    same row between it and the INSERT.
+    """
+    changed = db.session.execute(
+        update(model).where(*(getattr(model, k) == v for k, v in key.items()))
+        .values({k: getattr(model, k) + v for k, v in deltas.items()})
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not changed:
+        db.session.execute(insert(model).values(**key, **deltas))
+
+
+def record_order(order, sign=1):
+    """Add (``sign=1``) or take back (``sign=-1``) what ``order`` contributes to the rollups under its current status.
+
+    Called in the transaction that changes the order, see orders.py: a status
+    change is ``record_order(order, -1)``, the change, then ``record_order(order, 1)``.
+    """
+    day = order.created_at.date()
+    units, revenue = 0, Decimal(0)
+    products = defaultdict(lambda: [0, Decimal(0)])
+    for line in order.lines:
+        amount = line.unit_price * line.quantity
+        units += line.quantity
+        revenue += amount
+        products[line.product_id][0] += line.quantity
+        products[line.product_id][1] += amount
+    _bump(SalesDaily, {'day': day, 'status': order.status}, orders=sign, units=sign * units, revenue=sign * revenue)
+    for product_id, (product_units, product_revenue) in sorted(products.items()):
+        _bump(ProductSalesDaily, {'day': day, 'product_id': product_id, 'status': order.status},
+              units=sign * product_units, revenue=sign * product_revenue)
+    if sign < 0:
+        # Rows left without orders go, so the rollups stay equal to what rebuild() computes
+        db.session.execute(delete(SalesDaily).where(SalesDaily.day == day, SalesDaily.status == order.status,
+                                                    SalesDaily.orders == 0))
+        db.session.execute(delete(ProductSalesDaily).where(
+            ProductSalesDaily.day == day, ProductSalesDaily.status == order.status,
+            ProductSalesDaily.product_id.in_(products), ProductSalesDaily.units == 0))
+
+
+def dashboard(days=30, today=None, top=10):
+    """Sales of the last ``days`` days (today included), from the rollups only.
+
+    The cost depends on ``days`` and the number of products sold, never on the
+    number of orders. Returns per-day totals (days without sales included),
+    totals per status and the ``top`` products by revenue.
+    """
+    days = max(1, min(int(days), MAX_DAYS))
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+
+    per_day = {row.day: row for row in db.session.execute(
+        select(SalesDaily.day, func.sum(SalesDaily.orders).label('orders'), func.sum(SalesDaily.units).label('units'),
+               as_money(func.sum(cents(SalesDaily.revenue))).label('revenue'))
+        .where(SalesDaily.day >= start, SalesDaily.day <= today, SalesDaily.status.in_(REVENUE_STATUSES))
+        .group_by(SalesDaily.day)
+    )}
+    daily = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = per_day.get(day)
+        daily.append({'day': day.isoformat(), 'orders': row.orders if row else 0, 'units': row.units if row else 0,
+                      'revenue': row.revenue if row else Decimal('0.00')})
+
+    by_status = {row.status: {'orders': row.orders, 'units': row.units, 'revenue': row.revenue}
+                 for row in db.session.execute(
+                     select(SalesDaily.status, func.sum(SalesDaily.orders).label('orders'),
+                            func.sum(SalesDaily.units).label('units'),
+                            as_money(func.sum(cents(SalesDaily.revenue))).label('revenue'))
+                     .where(SalesDaily.day >= start, SalesDaily.day <= today)
+                     .group_by(SalesDaily.status)
+                 )}
+
+    revenue = func.sum(cents(ProductSalesDaily.revenue))
+    top_products = [
+        {'product_id': row.product_id, 'name': row.name or f'Product #{row.product_id}',
+         'units': row.units, 'revenue': row.revenue}
+        for row in db.session.execute(
+            select(ProductSalesDaily.product_id, Product.name, func.sum(ProductSalesDaily.units).label('units'),
+                   as_money(revenue).label('revenue'))
+            .outerjoin(Product, Product.id == ProductSalesDaily.product_id)
+            .where(ProductSalesDaily.day >= start, ProductSalesDaily.day <= today,
+                   ProductSalesDaily.status.in_(REVENUE_STATUSES))
+            .group_by(ProductSalesDaily.product_id, Product.name)
+            .order_by(revenue.desc(), ProductSalesDaily.product_id)
+            .limit(top)
+        )
+    ]
+
+    return {
+        'from': start.isoformat(),
+        'to': today.isoformat(),
+        'orders': sum(d['orders'] for d in daily),
+        'units': sum(d['units'] for d in daily),
+        'revenue': sum((d['revenue'] for d in daily), Decimal('0.00')),
+        'daily': daily,
+        'by_status': by_status,
+        'top_products': top_products,
+    }
+
+
+def rebuild():
+    """Recompute both rollups from the orders (after a restore, or to check for drift) and commit."""
+    day = func.date(Order.created_at)
+    line_cents = OrderLine.quantity * cents(OrderLine.unit_price)
+    per_order = (
+        select(Order.id, day.label('day'), Order.status,
+               func.coalesce(func.sum(OrderLine.quantity), 0).label('units'),
+               func.coalesce(func.sum(line_cents), 0).label('revenue'))
+        .outerjoin(OrderLine, OrderLine.order_id == Order.id)
+        .group_by(Order.id, day, Order.status)
+        .subquery()
+    )
+    sales, product_sales = SalesDaily.__table__, ProductSalesDaily.__table__
+    db.session.execute(delete(sales))
+    db.session.execute(delete(product_sales))
+    db.session.execute(sales.insert().from_select(
+        [sales.c.day, sales.c.status, sales.c.orders, sales.c.units, sales.c.revenue],
+        select(per_order.c.day, per_order.c.status, func.count(), func.sum(per_order.c.units),
+               func.sum(per_order.c.revenue))
+        .group_by(per_order.c.day, per_order.c.status)
+    ))
+    db.session.execute(product_sales.insert().from_select(
+        [product_sales.c.day, product_sales.c.product_id, product_sales.c.status, product_sales.c.units,
+         product_sales.c.revenue],
+        select(day, OrderLine.product_id, Order.status, func.sum(OrderLine.quantity), func.sum(line_cents))
+        .join(OrderLine, OrderLine.order_id == Order.id)
+        .group_by(day, OrderLine.product_id, Order.status)
+    ))
+    db.session.commit()
@@ -0,0 +1,327 @@
+# Cached product lookups for the read-only views: an in-process LRU, optionally backed by an SQLite file shared by the workers
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+from flask import abort, current_app, has_app_context
+from sqlalchemy import DateTime, event, inspect
+
+from extensions import db, page_cache
+from models import Product
+from money import Money
+from validators import MAX_INTEGER
+
+FIELDS = tuple(attr.key for attr in inspect(Product).column_attrs)
+_DECIMAL_FIELDS = frozenset(attr.key for attr in inspect(Product).column_attrs if isinstance(attr.columns[0].type, Money))
+_DATETIME_FIELDS = frozenset(attr.key for attr in inspect(Product).column_attrs if isinstance(attr.columns[0].type, DateTime))
+
+ALL = None  # "every product" in invalidations
+
+
+class ProductSnapshot:
+    """Immutable copy of a product's columns, safe to share between requests and threads.
+
+    Has the attributes the storefront and admin templates read from a
+    ``Product``; writes must load the ORM object instead.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for field in FIELDS:
+            object.__setattr__(self, field, values.get(field))
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(**{field: getattr(product, field) for field in FIELDS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    image_variant_widths = Product.image_variant_widths
+
+    def to_json(self):
+        values = {}
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value is not None and field in _DECIMAL_FIELDS:
+                value = str(value)
+            elif value is not None and field in _DATETIME_FIELDS:
+                value = value.isoformat()
+            values[field] = value
+        return json.dumps(values)
+
+    @classmethod
+    def from_json(cls, data):
+        values = json.loads(data)
+        for field in _DECIMAL_FIELDS:
+            if values.get(field) is not None:
+                values[field] = Decimal(values[field])
+        for field in _DATETIME_FIELDS:
+            if values.get(field) is not None:
+                values[field] = datetime.fromisoformat(values[field])
+        return cls(**values)
+
+    def __repr__(self):
+        return f'<ProductSnapshot {self.id} v{self.version}>'
+
+
+class SQLiteProductStore:
+    """Snapshots and an invalidation log in the SQLite file at ``path``, shared by every worker using it.
+
+    ``product_invalidation`` is append-only: each worker reads the rows past the
+    last one it has seen and drops those products from its own memory. Snapshots
+    are stamped with the product version, and a snapshot is never replaced by an
+    older one nor stored once the product was invalidated after it was read.
+    """
+
+    RETENTION = 3600  # seconds the invalidation log is kept; longer than any worker goes without syncing
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS product_snapshot '
+                               '(product_id INTEGER PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL, '
+                               'stored_at REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS product_invalidation '
+                               '(seq INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, version INTEGER, '
+                               'origin TEXT NOT NULL, at REAL NOT NULL)')
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def last_seq(self):
+        return self._connect().execute('SELECT COALESCE(MAX(seq), 0) FROM product_invalidation').fetchone()[0]
+
+    def get(self, product_id, max_age):
+        row = self._connect().execute('SELECT data FROM product_snapshot WHERE product_id = ? AND stored_at > ?',
+                                      (product_id, time.time() - max_age)).fetchone()
+        return ProductSnapshot.from_json(row[0]) if row else None
+
+    def set(self, snapshot, seen_seq):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO product_snapshot (product_id, version, data, stored_at) '
+                'SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM product_invalidation WHERE seq > ? '
+                '  AND (product_id = ? OR product_id IS NULL)) '
+                'ON CONFLICT (product_id) DO UPDATE SET version = excluded.version, data = excluded.data, '
+                '  stored_at = excluded.stored_at WHERE excluded.version >= product_snapshot.version',
+                (snapshot.id, snapshot.version, snapshot.to_json(), time.time(), seen_seq, snapshot.id))
+
+    def invalidate(self, versions, origin):
+        """Drop products, ``{product_id: new version or None}`` or ``ALL``, and log it for the other workers."""
+        now = time.time()
+        with self._connect() as connection:
+            if versions is ALL:
+                connection.execute('DELETE FROM product_snapshot')
+                rows = [(None, None)]
+            else:
+                connection.executemany('DELETE FROM product_snapshot WHERE product_id = ?',
+                                       [(product_id,) for product_id in versions])
+                rows = list(versions.items())
+            connection.executemany('INSERT INTO product_invalidation (product_id, version, origin, at) '
+                                   'VALUES (?, ?, ?, ?)', [(pid, version, origin, now) for pid, version in rows])
+            connection.execute('DELETE FROM product_invalidation WHERE at < ?', (now - self.RETENTION,))
+
+    def invalidations(self, after_seq, origin):
+        """``(last seq, product ids or ALL)`` invalidated by other workers since ``after_seq``."""
+        rows = self._connect().execute('SELECT seq, product_id, origin FROM product_invalidation WHERE seq > ? '
+                                       'ORDER BY seq', (after_seq,)).fetchall()
+        if not rows:
+            return after_seq, set()
+        others = [product_id for _, product_id, row_origin in rows if row_origin != origin]
+        return rows[-1][0], ALL if ALL in others else set(others)
+
+
+class ProductRepository:
+    """Product lookups for the views that only read: ``get_or_404`` returns a ``ProductSnapshot``.
+
+    Level 1 is an LRU of snapshots in this process (``PRODUCT_CACHE_MAX_ENTRIES``,
+    expiring after ``PRODUCT_CACHE_TTL`` seconds). Level 2, when
+    ``PRODUCT_CACHE_DB`` names an SQLite file, is shared by the workers of this
+    machine, web and task workers alike. Committed product changes invalidate
+    both levels (see ``mark_changed``); other workers see them within
+    ``PRODUCT_CACHE_SYNC_INTERVAL`` seconds, and within the TTL without level 2.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()  # product_id -> (snapshot, expires_at)
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation, so a read that raced one is not cached
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.store = None
+        self.enabled = True
+        self.max_entries = 2048
+        self.ttl = 300
+        self.sync_interval = 1.0
+        self._seen_seq = 0
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.configure(app)
+
+    def configure(self, app):
+        """Take the settings and the level 2 store from ``app``'s config, starting empty."""
+        self.enabled = app.config['PRODUCT_CACHE_ENABLED']
+        self.max_entries = app.config['PRODUCT_CACHE_MAX_ENTRIES']
+        self.ttl = app.config['PRODUCT_CACHE_TTL']
+        self.sync_interval = app.config['PRODUCT_CACHE_SYNC_INTERVAL']
+        path = app.config['PRODUCT_CACHE_DB']
+        self.store = SQLiteProductStore(path) if path and self.enabled else None
+        self._seen_seq = self.store.last_seq() if self.store else 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'shared': self.store is not None}
+
+    def sync(self, force=False):
+        """Apply the invalidations other workers logged in level 2; at most every ``sync_interval`` seconds."""
+        now = time.monotonic()
+        if self.store is None or (not force and now - self._synced_at < self.sync_interval):
+            return
+        self._synced_at = now
+        self._seen_seq, product_ids = self.store.invalidations(self._seen_seq, self.origin)
+        if product_ids:
+            self._drop(product_ids)
+
+    def _drop(self, product_ids):
+        with self._lock:
+            self._generation += 1
+            if product_ids is ALL:
+                self._entries.clear()
+            else:
+                for product_id in product_ids:
+                    self._entries.pop(product_id, None)
+        # The storefront page is built from the snapshot; listing pages keep their own TTL
+        if product_ids is ALL:
+            page_cache.invalidate_prefix('product:')
+        else:
+            for product_id in product_ids:
+                page_cache.invalidate(f'product:{product_id}')
+
+    def invalidate(self, versions):
+        """Drop changed products, ``{product_id: new version or None}`` or ``ALL``, here and in level 2."""
+        self._drop(ALL if versions is ALL else set(versions))
+        if self.store is not None:
+            self.store.invalidate(versions, self.origin)
+
+    def get(self, product_id):
+        """The product as a ``ProductSnapshot``, or ``None`` if it does not exist."""
+        if not 0 < product_id <= MAX_INTEGER:
+            return None  # no such row, and SQLite cannot even bind ids past 64 bits
+        if not self.enabled:
+            product = db.session.get(Product, product_id)
+            return ProductSnapshot.from_product(product) if product else None
+        self.sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation, seen_seq = self._generation, self._seen_seq
+
+        snapshot = self.store.get(product_id, self.ttl) if self.store else None
+        if snapshot is None:
+            product = db.session.get(Product, product_id)
+            if product is None:
+                return None
+            snapshot = ProductSnapshot.from_product(product)
+            if self.store is not None:
+                self.store.set(snapshot, seen_seq)
+        with self._lock:
+            if self._generation == generation:
+                self._entries[product_id] = (snapshot, now + self.ttl)
+                self._entries.move_to_end(product_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def get_or_404(self, product_id):
+        snapshot = self.get(product_id)
+        if snapshot is None:
+            abort(404)
+        return snapshot
+
+
+class ProductRepositoryExtension:
+    """Each app gets its own ``ProductRepository`` in ``app.extensions['product_repository']``.
+
+    Like ``extensions.page_cache``, the shared ``product_repository`` instance
+    holds no state and forwards to the repository of the current app.
+    """
+
+    def init_app(self, app):
+        repository = app.extensions['product_repository'] = ProductRepository(app)
+        # Invalidations from other workers drop pages as well as snapshots, so check before every request
+        app.before_request(repository.sync)
+
+    def __getattr__(self, name):
+        # get, get_or_404, invalidate, sync, clear, stats
+        return getattr(current_app.extensions['product_repository'], name)
+
+
+product_repository = ProductRepositoryExtension() # Per-app state lives in app.extensions['product_repository']
+
+
+def mark_changed(product_ids=ALL, session=None):
+    """Invalidate these products (default: all) when the current transaction commits.
+
+    ORM changes are picked up by themselves; set-based UPDATEs (stock
+    reservations, repricing, bulk imports) call this with the ids they touch.
+    """
+    pending = (session or db.session).info.setdefault('changed_products', {})
+    if product_ids is ALL:
+        pending[ALL] = None
+    else:
+        for product_id in product_ids:
+            pending.setdefault(product_id, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_products(session, flush_context):
+    pending = session.info.setdefault('changed_products', {})
+    for product in session.dirty:
+        if isinstance(product, Product):
+            pending[product.id] = product.version
+    for product in session.deleted:
+        if isinstance(product, Product):
+            pending[product.id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_products(session):
+    pending = session.info.pop('changed_products', None)
+    repository = current_app.extensions.get('product_repository') if has_app_context() else None
+    if pending and repository is not None:
+        repository.invalidate(ALL if ALL in pending else pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_products(session):
+    session.info.pop('changed_products', None)
@@ -1,8 +1,29 @@
 # Admin and shop routes
+import math
 from functools import wraps
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash, session
-from app import app, db # Import app and db from app.py
-from models import Product # Import Product model
+from flask import Blueprint, Response, current_app, render_template, request, redirect, url_for, jsonify, flash, session, abort, stream_with_context
+from sqlalchemy.orm.exc import StaleDataError
+from extensions import db, page_cache # Bound to the app in create_app()
+from models import ORDER_STATUSES, Category, Order, Product, Task # Import Product model
+import api
+import auth
+import bulk
+import cart
+import facets
+import fx
+import history
+import images
+import inventory
+import orders
+import pricing
+import reporting
+import tasks
+from search import search_products
+from instrumentation import current_metrics
+from repository import product_repository
+from pagination import InvalidCursor, decode_cursor, paginate_keyset
+from money import as_money, cents, to_decimal
+from validators import ProductValidationError, parse_pricing_data, parse_product_data, parse_taxonomy_data
 
 # --- DECORADOR DE AUTENTICACIÓN ---
 def login_required(f):
@@ -21,18 +42,35 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        # ¡CAMBIA ESTA CONTRASEÑA EN UN ENTORNO DE PRODUCCIÓN!
-        if request.form.get('password') == 'admin123':
+        username = request.form.get('username', '').strip()
+        try:
+            user = auth.authenticate(current_app, request.remote_addr, username, request.form.get('password', ''))
+        except auth.TooManyAttempts as e:
+            # Refused before any hashing, so a flood of attempts costs almost nothing
+            wait = math.ceil(e.retry_after)
+            flash(f'Too many failed logins. Try again in {wait} seconds.', 'danger')
+            return render_template('admin/login.html', title="Admin Login", username=username), 429, \
+                {'Retry-After': str(wait)}
+        except auth.HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('admin/login.html', title="Admin Login", username=username), 503, \
+                {'Retry-After': str(math.ceil(current_app.config['PASSWORD_HASH_TIMEOUT']))}
+        if user is not None:
+            session.clear()
             session['admin_logged_in'] = True
+            session['admin_user_id'] = user.id
+            session['admin_username'] = user.username
             flash('You were successfully logged in.', 'success')
             return redirect(url_for('admin.get_products'))
-        else:
-            flash('Invalid password.', 'danger')
+        flash('Invalid username or password.', 'danger')
+        return render_template('admin/login.html', title="Admin Login", username=username), 401
     return render_template('admin/login.html', title="Admin Login")
 
 @admin_bp.route('/logout')
 def logout():
     session.pop('admin_logged_in', None)
+    session.pop('admin_user_id', None)
+    session.pop('admin_username', None)
     flash('You were successfully logged out.', 'success')
     return redirect(url_for('admin.login'))
 
@@ -40,8 +78,47 @@ def logout():
 @admin_bp.route('/products', methods=['GET'])
 @login_required
 def get_products():
-    products = Product.query.all()
-    return render_template('admin/products.html', products=products, title="Manage Products")
+    # The first page is rendered here (the table works without JavaScript); static/js/admin_products.js
+    # then scrolls through the rest from product_table_data
+    try:
+        table = _product_table(request.args)
+    except (api.ApiError, InvalidCursor, ValueError) as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.get_products'))
+    # Summed in SQL on integer cents: exact, and no second pass over the ORM objects
+    stock_value = db.session.scalar(db.select(as_money(db.func.coalesce(db.func.sum(cents(Product.price) * Product.stock), 0))))
+    return render_template('admin/products.html', table=table, stock_value=stock_value, title="Manage Products")
+
+ADMIN_TABLE_FIELDS = ('id', 'name', 'price', 'stock', 'image_url')
+
+def _product_table(args, stream=False):
+    """The admin product table for ``args``: ``sort`` (``name``, ``-price``...), ``q`` and the api.parse_filters
+    filters, ``fields``, and ``after`` (keyset cursor) or ``offset`` plus ``limit``."""
+    fields = api.parse_fields(args.get('fields') or ADMIN_TABLE_FIELDS)
+    sort, descending = api.parse_sort(args.get('sort'))
+    clauses = api.parse_filters(args)
+    after = decode_cursor(args['after'], 2) if args.get('after') else None
+    offset = max(0, args.get('offset', 0, type=int))
+    limit = args.get('limit', type=int)
+    if stream:
+        return api.iter_table(fields, clauses, sort, descending, current_app.config['API_BATCH_SIZE'],
+                              offset=offset, limit=limit, after=after)
+    limit = max(1, min(limit or current_app.config['ADMIN_PAGE_SIZE'], current_app.config['ADMIN_MAX_PAGE_SIZE']))
+    return dict(api.table_page(fields, clauses, sort, descending, limit, offset=offset, after=after),
+                sort=args.get('sort') or 'name', q=args.get('q', ''), offset=offset, limit=limit)
+
+@admin_bp.route('/products/data', methods=['GET'])
+@login_required
+def product_table_data():
+    """One page of the admin product table as JSON, or with ``format=ndjson`` every matching row
+    (from ``offset``/``after``, up to ``limit``) streamed one object per line."""
+    try:
+        if request.args.get('format') == 'ndjson':
+            rows = _product_table(request.args, stream=True)
+            return Response(stream_with_context(api.stream_ndjson(rows)), mimetype='application/x-ndjson')
+        return jsonify(_product_table(request.args))
+    except (api.ApiError, InvalidCursor, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
 
 @admin_bp.route('/products/new', methods=['GET'])
 @login_required
@@ -52,24 +129,19 @@ def create_product_form():
 @login_required
 def create_product():
     form_data = request.form
-    if not form_data.get('name') or not form_data.get('price'):
-        flash('Name and Price are required fields.', 'danger')
-        return render_template('admin/product_form.html', product=form_data, title="Add New Product", form_action=url_for('admin.create_product')), 400
-
     try:
-        new_product = Product(
-            name=form_data['name'],
-            description=form_data.get('description', ''),
-            price=float(form_data['price']),
-            stock=int(form_data.get('stock', 0) or 0),
-            image_url=form_data.get('image_url', '')
-        )
+        new_product = Product(**facets.check_taxonomy(parse_product_data(form_data)))
+        pending_image = images.prepare_form_image(current_app, new_product, request.files, form_data)
         db.session.add(new_product)
+        if pending_image is not None:
+            db.session.flush() # the task needs the product id; both commit together
+            images.schedule_product_image(current_app, new_product.id, pending_image)
         db.session.commit()
+        page_cache.invalidate_prefix('listing:')
         flash(f'Product "{new_product.name}" created successfully!', 'success')
         return redirect(url_for('admin.get_products'))
-    except ValueError:
-        flash('Invalid price or stock format. Please enter valid numbers.', 'danger')
+    except (ProductValidationError, images.ImageError) as e:
+        flash(str(e), 'danger')
         return render_template('admin/product_form.html', product=form_data, title="Add New Product", form_action=url_for('admin.create_product')), 400
     except Exception as e:
         db.session.rollback()
@@ -79,15 +151,19 @@ def create_product():
 @admin_bp.route('/products/<int:product_id>/edit', methods=['GET'])
 @login_required
 def edit_product_form(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = product_repository.get_or_404(product_id) # A stale version only turns the save into a 409
     return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id))
 
 @admin_bp.route('/products/<int:product_id>/edit', methods=['POST'])
 @login_required
 def update_product(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = db.get_or_404(Product, product_id)
     form_data = request.form
 
+    # The form carries the version it was rendered from; anything older was overwritten in between
+    if form_data.get('version', type=int) not in (None, product.version):
+        return _edit_conflict(product)
+
     if not form_data.get('name') or not form_data.get('price'):
         flash('Name and Price are required fields.', 'danger')
         return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id), form_data=form_data), 400
@@ -95,13 +171,35 @@ def update_product(product_id):
     try:
         product.name = form_data.get('name', product.name)
         product.description = form_data.get('description', product.description)
-        product.price = float(form_data.get('price', product.price))
+        product.price = to_decimal(form_data.get('price', product.price))
         product.stock = int(form_data.get('stock', product.stock) or 0)
+        previous_image_url = product.image_url
         product.image_url = form_data.get('image_url', product.image_url)
+        for field, value in parse_pricing_data(form_data).items():
+            setattr(product, field, value)
+        for field, value in facets.check_taxonomy(parse_taxonomy_data(form_data)).items():
+            setattr(product, field, value)
+        pending_image = images.prepare_form_image(current_app, product, request.files, form_data,
+                                                   previous_url=previous_image_url)
+        if pending_image is not None:
+            images.schedule_product_image(current_app, product.id, pending_image)
 
         db.session.commit()
+        page_cache.invalidate_product(product.id)
         flash(f'Product "{product.name}" updated successfully!', 'success')
         return redirect(url_for('admin.get_products'))
+    except images.ImageError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id), form_data=form_data), 400
+    except ProductValidationError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id), form_data=form_data), 400
+    except StaleDataError:
+        # Saved by someone else between our read and our UPDATE ... WHERE version = :version
+        db.session.rollback()
+        return _edit_conflict(product)
     except ValueError:
         flash('Invalid price or stock format. Please enter valid numbers.', 'danger')
         return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id), form_data=form_data), 400
@@ -110,14 +208,38 @@ def update_product(product_id):
         flash(f'Error updating product: {str(e)}', 'danger')
         return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id), form_data=form_data), 500
 
+def _edit_conflict(product):
+    flash('Someone else saved this product after you opened it, so your changes were not saved. '
+          'The form now shows the current values; see the history for what changed.', 'danger')
+    return render_template('admin/product_form.html', product=product, title=f"Edit Product: {product.name}", form_action=url_for('admin.update_product', product_id=product.id)), 409
+
+@admin_bp.route('/products/<int:product_id>/history', methods=['GET'])
+@login_required
+def product_history(product_id):
+    product = db.session.get(Product, product_id) # None once deleted; the history stays
+    entries, next_before = history.product_history(product_id, before=request.args.get('before', type=int),
+                                                   limit=max(1, min(request.args.get('limit', 50, type=int), 500)))
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'product_id': product_id,
+            'history': [{'id': e.id, 'version': e.version, 'action': e.action, 'changes': e.changes,
+                         'changed_by': e.changed_by, 'changed_at': e.changed_at.isoformat() + 'Z'} for e in entries],
+            'next_before': next_before,
+        })
+    if product is None and not entries:
+        abort(404)
+    return render_template('admin/product_history.html', product=product, product_id=product_id, entries=entries,
+                           next_before=next_before, title=f"History of {product.name if product else f'product {product_id}'}")
+
 @admin_bp.route('/products/<int:product_id>/delete', methods=['POST'])
 @login_required
 def delete_product(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = db.get_or_404(Product, product_id)
     try:
         product_name = product.name
         db.session.delete(product)
         db.session.commit()
+        page_cache.invalidate_product(product_id)
         flash(f'Product "{product_name}" deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -127,20 +249,223 @@ def delete_product(product_id):
 @admin_bp.route('/products/<int:product_id>/json', methods=['GET'])
 @login_required
 def get_product_json(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = product_repository.get_or_404(product_id)
     return jsonify({
         'id': product.id, 'name': product.name, 'description': product.description,
         'price': product.price, 'stock': product.stock, 'image_url': product.image_url
     })
 
+@admin_bp.route('/api/products', methods=['GET', 'POST'])
+@login_required
+def get_products_batch_json():
+    # Parameters come from the query string, or from a JSON body for long id lists
+    params = request.args
+    if request.method == 'POST':
+        params = request.get_json(silent=True)
+        if not isinstance(params, dict):
+            return jsonify({'error': 'Expected a JSON object body.'}), 400
+    try:
+        fields = api.parse_fields(params.get('fields'))
+        batch_size = current_app.config['API_BATCH_SIZE']
+        missing = []
+        if params.get('ids') is not None:
+            ids = api.parse_ids(params['ids'], current_app.config['API_MAX_IDS'])
+            rows = api.iter_by_ids(ids, fields, batch_size, missing)
+        else:
+            limit = api.parse_limit(params.get('limit'))
+            rows = api.iter_matching(api.parse_filters(params), fields, batch_size, limit)
+    except (api.ApiError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(stream_with_context(api.stream_json(rows, missing)), mimetype='application/json')
+
+@admin_bp.route('/products/import', methods=['GET'])
+@login_required
+def import_products_form():
+    return render_template('admin/import.html', report=None, title="Import Products")
+
+@admin_bp.route('/products/import', methods=['POST'])
+@login_required
+def import_products():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV or NDJSON file to import.', 'danger')
+        return render_template('admin/import.html', report=None, title="Import Products"), 400
+    fmt = request.form.get('format') or bulk.guess_format(upload.filename)
+    if fmt not in bulk.FORMATS:
+        flash(f'Unsupported format "{fmt}".', 'danger')
+        return render_template('admin/import.html', report=None, title="Import Products"), 400
+
+    chunk_size = request.form.get('chunk_size', bulk.DEFAULT_CHUNK_SIZE, type=int)
+    report = bulk.import_products(bulk.iter_rows(upload.stream, fmt), chunk_size=max(1, chunk_size))
+    page_cache.clear()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report.to_dict())
+    flash(f'Import finished: {report.inserted} created, {report.updated} updated, {report.error_count} rejected.',
+          'success' if not report.error_count else 'warning')
+    return render_template('admin/import.html', report=report, title="Import Products")
+
+@admin_bp.route('/products/export', methods=['GET'])
+@login_required
+def export_products():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk.FORMATS:
+        abort(400)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(bulk.export_products(fmt)), mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=products.{fmt}'},
+    )
+
+@admin_bp.route('/cache', methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify({**page_cache.stats(), 'products': product_repository.stats()})
+
+# --- CATEGORÍAS, SUBCATEGORÍAS Y MARCAS ---
+admin_bp.add_app_template_global(facets.taxonomy_choices, 'taxonomy_choices') # Selects of the product form
+
+@admin_bp.route('/taxonomy', methods=['GET'])
+@login_required
+def taxonomy():
+    return render_template('admin/taxonomy.html', title="Categories & Brands")
+
+@admin_bp.route('/taxonomy', methods=['POST'])
+@login_required
+def create_taxonomy_entry():
+    kind = request.form.get('kind')
+    name = (request.form.get('name') or '').strip()
+    if kind not in facets.DIMENSIONS or not name:
+        flash('Choose what to add and give it a name.', 'danger')
+        return redirect(url_for('admin.taxonomy'))
+    category_id = request.form.get('category_id', type=int)
+    if kind == 'subcategory' and (category_id is None or db.session.get(Category, category_id) is None):
+        flash('Choose the category of the subcategory.', 'danger')
+        return redirect(url_for('admin.taxonomy'))
+    try:
+        entry = facets.DIMENSIONS[kind](name=name)
+        if kind == 'subcategory':
+            entry.category_id = category_id
+        db.session.add(entry)
+        db.session.commit()
+        flash(f'{kind.capitalize()} "{name}" added.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error adding {kind} "{name}": {str(e)}', 'danger')
+    return redirect(url_for('admin.taxonomy'))
+
+@admin_bp.route('/taxonomy/<kind>/<int:entry_id>/delete', methods=['POST'])
+@login_required
+def delete_taxonomy_entry(kind, entry_id):
+    if kind not in facets.DIMENSIONS:
+        abort(404)
+    entry = db.get_or_404(facets.DIMENSIONS[kind], entry_id)
+    try:
+        facets.detach_products(kind, entry_id)
+        db.session.delete(entry)
+        db.session.commit()
+        page_cache.invalidate_prefix('listing:')
+        flash(f'{kind.capitalize()} "{entry.name}" deleted.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error deleting {kind} "{entry.name}": {str(e)}', 'danger')
+    return redirect(url_for('admin.taxonomy'))
+
+# --- PRECIOS (TIPO DE CAMBIO, IGV Y MARGEN) ---
+@admin_bp.route('/pricing', methods=['GET'])
+@login_required
+def pricing_overview():
+    managed = Product.query.filter(Product.cost_price.is_not(None)).count()
+    return render_template('admin/pricing.html', rates=fx.cached_rates(current_app), last_run=tasks.latest('reprice'),
+                           managed=managed, title="Pricing")
+
+@admin_bp.route('/pricing/reprice', methods=['POST'])
+@login_required
+def reprice_products():
+    # Runs in the task worker: one set-based UPDATE, but the FX lookup can take seconds
+    pricing.schedule_repricing()
+    flash('Repricing queued. Reload this page to see the result.', 'info')
+    return redirect(url_for('admin.pricing_overview'))
+
+# --- TAREAS EN SEGUNDO PLANO ---
+@admin_bp.route('/tasks', methods=['GET'])
+@login_required
+def task_status():
+    status = request.args.get('status')
+    query = Task.query.order_by(Task.id.desc())
+    if status in tasks.ACTIVE + tasks.FINISHED:
+        query = query.filter(Task.status == status)
+    return render_template('admin/tasks.html', tasks=query.limit(100).all(), counts=tasks.status_counts(),
+                           status=status, title="Tasks")
+
+@admin_bp.route('/tasks/<int:task_id>/retry', methods=['POST'])
+@login_required
+def retry_task(task_id):
+    if tasks.retry(task_id):
+        flash(f'Task {task_id} queued again.', 'success')
+    else:
+        flash(f'Task {task_id} was not retried: it has not failed, or the same work is already queued.', 'warning')
+    return redirect(url_for('admin.task_status'))
+
+# --- PEDIDOS Y REPORTES DE VENTAS ---
+@admin_bp.route('/orders', methods=['GET'])
+@login_required
+def list_orders():
+    status = request.args.get('status')
+    query = Order.query.order_by(Order.id.desc())
+    if status in ORDER_STATUSES:
+        query = query.filter(Order.status == status)
+    return render_template('admin/orders.html', orders=query.limit(100).all(), statuses=ORDER_STATUSES,
+                           status=status, title="Orders")
+
+@admin_bp.route('/orders/<int:order_id>/status', methods=['POST'])
+@login_required
+def update_order_status(order_id):
+    order = db.get_or_404(Order, order_id)
+    try:
+        orders.set_status(order, request.form.get('status', ''))
+    except (ValueError, orders.OrderConflict) as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'Order {order_id} is now {order.status}.', 'success')
+    return redirect(url_for('admin.list_orders', status=request.args.get('status')))
+
+@admin_bp.route('/reports', methods=['GET'])
+@login_required
+def sales_report():
+    # Read from the daily rollups only, so the cost does not grow with the number of orders
+    days = request.args.get('days', 30, type=int)
+    report = reporting.dashboard(days=days)
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(report)
+    return render_template('admin/reports.html', report=report, days=len(report['daily']), title="Sales Reports")
+
+@admin_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    metrics = current_metrics()
+    if metrics is None:
+        abort(404)
+    # Prometheus scrapers authenticate with METRICS_TOKEN; browsers with the admin session
+    token = current_app.config['METRICS_TOKEN']
+    if not session.get('admin_logged_in') and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        abort(401)
+    cache_stats = page_cache.stats()
+    product_stats = product_repository.stats()
+    body = metrics.render_prometheus(extra_gauges=[
+        ('shop_page_cache_hits', 'Page cache hits since start.', cache_stats['hits']),
+        ('shop_page_cache_misses', 'Page cache misses since start.', cache_stats['misses']),
+        ('shop_page_cache_evictions', 'Page cache LRU evictions since start.', cache_stats['evictions']),
+        ('shop_page_cache_entries', 'Pages currently cached.', cache_stats['entries']),
+        ('shop_product_cache_hits', 'Product cache hits since start.', product_stats['hits']),
+        ('shop_product_cache_misses', 'Product cache misses since start.', product_stats['misses']),
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @admin_bp.route('/test')
 @login_required
 def admin_test():
     flash("Admin test route successfully reached!", "info")
     return redirect(url_for('admin.get_products'))
 
-app.register_blueprint(admin_bp)
-
 # --- BLUEPRINT DE LA TIENDA (PÚBLICO) ---
 shop_bp = Blueprint('shop', __name__)
 
@@ -148,15 +473,176 @@ shop_bp = Blueprint('shop', __name__)
 def redirect_to_products():
     return redirect(url_for('shop.list_products'))
 
+def _filtered_listing():
+    """The page of in-stock products for the request's filters, the selection and its facet counts."""
+    per_page = request.args.get('per_page', current_app.config['SHOP_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['SHOP_MAX_PAGE_SIZE']))
+    try:
+        after = decode_cursor(request.args['after'], 2) if request.args.get('after') else None
+        before = decode_cursor(request.args['before'], 2) if request.args.get('before') else None
+        selection = facets.parse_selection(request.args)
+    except (InvalidCursor, ValueError):
+        abort(400)
+
+    # Keyset pagination on (name, id): served by ix_product_in_stock_name_id, no OFFSET scans
+    page = paginate_keyset(
+        facets.filter_products(Product.query.filter(Product.stock > 0), selection),
+        (Product.name, Product.id),
+        key=lambda p: (p.name, p.id),
+        per_page=per_page, after=after, before=before,
+    )
+    return page, per_page, selection, facets.facet_counts(selection)
+
 @shop_bp.route('/', methods=['GET'])
 @shop_bp.route('/products', methods=['GET'])
+@page_cache.cached(lambda: f'listing:{request.full_path}')
 def list_products():
-    products = Product.query.filter(Product.stock > 0).order_by(Product.name).all()
-    return render_template('shop/product_list.html', products=products, title="Products")
+    page, per_page, selection, counts = _filtered_listing()
+    pages = {'per_page': request.args.get('per_page'), **selection}
+    return render_product_list(
+        page.items,
+        prev_url=url_for('shop.list_products', before=page.prev_cursor, **pages) if page.has_prev else None,
+        next_url=url_for('shop.list_products', after=page.next_cursor, **pages) if page.has_next else None,
+        selection=selection, counts=counts)
+
+def render_product_list(products, prev_url=None, next_url=None, selection=None, counts=None):
+    """The storefront listing page; also rendered by static_export.py, without filters."""
+    return render_template('shop/product_list.html', products=products, prev_url=prev_url, next_url=next_url,
+                           selection=selection or {}, facets=counts or {}, toggle=facets.toggle, title="Products")
+
+@shop_bp.route('/api/products', methods=['GET'])
+@page_cache.cached(lambda: f'listing:{request.full_path}') # Invalidated with the listing pages
+def filter_products_json():
+    page, per_page, selection, counts = _filtered_listing()
+    return jsonify({
+        'products': [{'id': p.id, 'name': p.name, 'price': p.price, 'stock': p.stock, 'image_url': p.image_url,
+                      'category_id': p.category_id, 'subcategory_id': p.subcategory_id, 'brand_id': p.brand_id}
+                     for p in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'selection': selection,
+        'facets': counts,
+    })
 
 @shop_bp.route('/products/<int:product_id>', methods=['GET'])
+@page_cache.cached(lambda product_id: f'product:{product_id}')
 def view_product(product_id):
-    product = Product.query.get_or_404(product_id)
+    return render_product_page(product_repository.get_or_404(product_id))
+
+def render_product_page(product):
+    """The storefront page of one product; also rendered by static_export.py."""
     return render_template('shop/product_detail.html', product=product, title=product.name)
 
-app.register_blueprint(shop_bp)
+@shop_bp.route('/search', methods=['GET'])
+@page_cache.cached(lambda: f'listing:{request.full_path}') # Invalidated with the listing pages
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    max_page = current_app.config['SEARCH_MAX_PAGE']
+    if page > max_page:
+        abort(400)
+    per_page = current_app.config['SEARCH_PAGE_SIZE']
+    # One extra row tells us whether there is a next page
+    results = search_products(query, limit=per_page + 1, offset=(page - 1) * per_page) if query else []
+    return render_template('shop/search.html', products=results[:per_page], query=query, page=page,
+                           has_next=len(results) > per_page and page < max_page,
+                           title=f'Search: {query}' if query else 'Search')
+
+# --- CARRITO ---
+def _cart_response(status=200):
+    # JSON for fetch() callers, otherwise back to the cart page
+    if request.is_json or request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(cart.summary()), status
+    return redirect(url_for('shop.view_cart'))
+
+def _cart_input():
+    if not request.is_json:
+        return request.form
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        abort(400)  # [1] or "x": nothing to read the fields from
+    return data
+
+@shop_bp.route('/cart', methods=['GET'])
+def view_cart():
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(cart.summary())
+    return render_template('shop/cart.html', cart=cart.summary(), title='Your Cart')
+
+@shop_bp.route('/cart/items', methods=['POST'])
+def add_to_cart():
+    data = _cart_input()
+    try:
+        product_id = int(data.get('product_id'))
+    except (TypeError, ValueError):
+        abort(400)
+    product = product_repository.get_or_404(product_id)
+    try:
+        cart.add(product_id, data.get('quantity', 1))
+    except cart.CartError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(url_for('shop.view_cart'))
+    if not request.is_json:
+        flash(f'Added "{product.name}" to your cart.', 'success')
+    return _cart_response(201)
+
+@shop_bp.route('/cart/items/<int:product_id>', methods=['POST'])
+def update_cart_item(product_id):
+    data = _cart_input()
+    if product_id not in cart.lines():
+        product_repository.get_or_404(product_id)  # the form path never prices the cart, so check before storing
+    try:
+        cart.set_quantity(product_id, data.get('quantity'))
+    except cart.CartError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'danger')
+    return _cart_response()
+
+@shop_bp.route('/cart/items/<int:product_id>/delete', methods=['POST'])
+def remove_cart_item(product_id):
+    cart.remove(product_id)
+    return _cart_response()
+
+@shop_bp.route('/cart/clear', methods=['POST'])
+def clear_cart():
+    cart.clear()
+    return _cart_response()
+
+# --- RESERVAS DE STOCK (CHECKOUT) ---
+@shop_bp.route('/reservations', methods=['POST'])
+def create_reservation():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('lines'), list):
+        return jsonify({'error': 'Expected {"lines": [{"product_id": ..., "quantity": ...}]}.'}), 400
+    try:
+        lines = [(line['product_id'], line['quantity']) for line in data['lines']]
+        token, expires_at = inventory.reserve(lines, ttl=current_app.config['RESERVATION_TTL'])
+    except inventory.InsufficientStock as e:
+        return jsonify({'error': str(e), 'product_id': e.product_id}), 409
+    except inventory.ProductNotFound as e:
+        return jsonify({'error': str(e), 'product_id': e.product_id}), 404
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid reservation lines: {e}'}), 400
+    return jsonify({'token': token, 'expires_at': expires_at.isoformat() + 'Z'}), 201
+
+@shop_bp.route('/reservations/<token>/confirm', methods=['POST'])
+def confirm_reservation(token):
+    data = request.get_json(silent=True) or {}
+    try:
+        order = orders.place_order(token, email=data.get('email') if isinstance(data, dict) else None)
+    except inventory.ReservationNotFound:
+        return jsonify({'error': 'Reservation not found or expired.'}), 404
+    return jsonify({'token': token, 'status': 'confirmed', 'order_id': order.id, 'total': order.total})
+
+@shop_bp.route('/reservations/<token>/release', methods=['POST'])
+def release_reservation(token):
+    try:
+        inventory.release(token)
+    except inventory.ReservationNotFound:
+        return jsonify({'error': 'Reservation not found or no longer held.'}), 404
+    return jsonify({'token': token, 'status': 'released'})
@@ -0,0 +1,105 @@
+# Full-text product search (SQLite FTS5), with a LIKE fallback for other databases
+import re
+
+from sqlalchemy import and_, event, or_, select, text
+
+from extensions import db
+from models import Product
+
+# External-content FTS5 table over product(name, description). unicode61 with
+# remove_diacritics folds "cámara" and "camara" to the same token; the prefix
+# indexes make "cam*" a direct index lookup instead of a full-vocabulary scan.
+# The same statements are frozen in the migration that creates the index.
+FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    # Only name/description edits touch the index; stock and price updates skip it
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+)
+
+# bm25 column weights: a hit in the name counts ten times one in the description
+_SEARCH_SQL = text("""
+    SELECT product.* FROM product_fts
+    JOIN product ON product.id = product_fts.rowid
+    WHERE product_fts MATCH :query AND product.stock > 0
+    ORDER BY bm25(product_fts, 10.0, 1.0), product.id
+    LIMIT :limit OFFSET :offset
+""")
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(user_input):
+    """Turn free text into an FTS5 query: every word must match, each as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation typed by users are inert.
+    Returns ``None`` when there is nothing searchable.
+    """
+    words = _WORD.findall(user_input or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words[:16])
+
+
+def search_products(user_input, limit=20, offset=0):
+    """In-stock products matching ``user_input``, best match first."""
+    query = fts_query(user_input)
+    if query is None:
+        return []
+    if db.engine.dialect.name == 'sqlite':
+        statement = select(Product).from_statement(_SEARCH_SQL)
+        return db.session.scalars(statement, {'query': query, 'limit': limit, 'offset': offset}).all()
+
+    # Other databases: unranked substring match on every word (no FTS index)
+    clauses = [or_(Product.name.ilike(f'%{word}%'), Product.description.ilike(f'%{word}%'))
+               for word in _WORD.findall(user_input)]
+    return Product.query.filter(Product.stock > 0, *clauses) \
+        .order_by(Product.name, Product.id).limit(limit).offset(offset).all()
+
+
+def match_clause(user_input):
+    """WHERE clause for products matching ``user_input`` (any stock), or ``None`` when there is nothing searchable.
+
+    On SQLite an id lookup in the FTS index, so it can be combined with other
+    filters and any ORDER BY; elsewhere the same substring match as ``search_products``.
+    """
+    query = fts_query(user_input)
+    if query is None:
+        return None
+    if db.engine.dialect.name == 'sqlite':
+        return Product.id.in_(text('SELECT rowid FROM product_fts WHERE product_fts MATCH :fts_query')
+                              .bindparams(fts_query=query))
+    return and_(*(or_(Product.name.ilike(f'%{word}%'), Product.description.ilike(f'%{word}%'))
+                  for word in _WORD.findall(user_input)))
+
+
+def create_search_index(connection):
+    """Create the FTS table and triggers (idempotent) and index existing rows."""
+    for statement in FTS_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    # Keeps db.create_all() (tests, fresh installs) in step with the migration
+    if connection.dialect.name == 'sqlite':
+        create_search_index(connection)
+
+
+@event.listens_for(Product.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS product_fts')
@@ -0,0 +1,258 @@
+# Server-side sessions: the cookie holds a signed random id, the data lives in a pluggable store
+import hashlib
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from importlib import import_module
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select, update
+from werkzeug.datastructures import CallbackDict
+
+from extensions import db
+from models import WebSession
+
+COMPRESS_OVER = 512  # bytes of JSON past which the data is stored zlib-compressed
+
+
+def dumps(data):
+    """Session dict -> compact bytes: Flask's tagged JSON (tuples, Markup, datetimes...), compressed when large."""
+    raw = session_json_serializer.dumps(dict(data)).encode()
+    if len(raw) > COMPRESS_OVER:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return b'z' + packed
+    return b'j' + raw
+
+
+def loads(blob):
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+    return session_json_serializer.loads(raw.decode())
+
+
+class DatabaseStore:
+    """Sessions as rows of the web_session table in the app database."""
+
+    _table = WebSession.__table__
+
+    def __init__(self, app):
+        pass
+
+    def load(self, sid):
+        """``(data bytes, expires_at)`` of an unexpired session, or ``None``."""
+        with db.engine.connect() as connection:
+            row = connection.execute(select(self._table.c.data, self._table.c.expires_at)
+                                     .where(self._table.c.id == sid, self._table.c.expires_at > datetime.utcnow())).first()
+        return (row.data, row.expires_at) if row else None
+
+    def save(self, sid, data, expires_at):
+        # Own connection and transaction: runs after the view, whatever it left in db.session
+        with db.engine.begin() as connection:
+            result = connection.execute(update(self._table).where(self._table.c.id == sid)
+                                        .values(data=data, expires_at=expires_at))
+            if result.rowcount == 0:
+                connection.execute(self._table.insert().values(id=sid, data=data, expires_at=expires_at))
+
+    def touch(self, sid, expires_at):
+        with db.engine.begin() as connection:
+            connection.execute(update(self._table).where(self._table.c.id == sid).values(expires_at=expires_at))
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self._table).where(self._table.c.id == sid))
+
+    def purge(self, now=None, batch_size=1000):
+        """Delete expired sessions, ``batch_size`` per transaction so writers are never blocked for long."""
+        now = now or datetime.utcnow()
+        purged = 0
+        while True:
+            with db.engine.begin() as connection:
+                expired = select(self._table.c.id).where(self._table.c.expires_at <= now).limit(batch_size)
+                deleted = connection.execute(delete(self._table).where(self._table.c.id.in_(expired))).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+
+
+class FileStore:
+    """Sessions in a local SQLite key-value file (``SESSION_FILE``), kept apart from the app database."""
+
+    def __init__(self, app):
+        self.path = app.config['SESSION_FILE'] or f'{app.instance_path}/sessions.db'
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS session_kv '
+                               '(id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at TEXT NOT NULL) WITHOUT ROWID')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_session_kv_expires_at ON session_kv (expires_at)')
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def load(self, sid):
+        row = self._connect().execute('SELECT data, expires_at FROM session_kv WHERE id = ? AND expires_at > ?',
+                                      (sid, datetime.utcnow().isoformat())).fetchone()
+        return (row[0], datetime.fromisoformat(row[1])) if row else None
+
+    def save(self, sid, data, expires_at):
+        with self._connect() as connection:
+            connection.execute('INSERT INTO session_kv (id, data, expires_at) VALUES (?, ?, ?) ON CONFLICT (id) '
+                               'DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at',
+                               (sid, data, expires_at.isoformat()))
+
+    def touch(self, sid, expires_at):
+        with self._connect() as connection:
+            connection.execute('UPDATE session_kv SET expires_at = ? WHERE id = ?', (expires_at.isoformat(), sid))
+
+    def delete(self, sid):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM session_kv WHERE id = ?', (sid,))
+
+    def purge(self, now=None, batch_size=1000):
+        now = (now or datetime.utcnow()).isoformat()
+        purged = 0
+        while True:
+            with self._connect() as connection:
+                deleted = connection.execute('DELETE FROM session_kv WHERE id IN (SELECT id FROM session_kv '
+                                             'WHERE expires_at <= ? LIMIT ?)', (now, batch_size)).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+
+
+STORES = {'database': DatabaseStore, 'file': FileStore}
+
+
+def load_store(app):
+    """Instantiate ``SESSION_BACKEND``: a name from ``STORES`` or a ``module:Class`` path."""
+    spec = app.config['SESSION_BACKEND']
+    if spec in STORES:
+        return STORES[spec](app)
+    module, _, name = spec.partition(':')
+    try:
+        return getattr(import_module(module), name)(app)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise RuntimeError(f'Unknown SESSION_BACKEND "{spec}": {e}')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """The session dict; ``sid`` is ``None`` until it is first saved."""
+
+    def __init__(self, data=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+    def clear(self):
+        # Clearing is how a login starts its session (see routes.login): it also gets a new id,
+        # so an id planted before the login is worthless afterwards
+        super().clear()
+        self.rotate = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface over a store (see ``load_store``) with sliding expiry.
+
+    Each visit pushes the expiry ``PERMANENT_SESSION_LIFETIME`` ahead, writing
+    it at most once per ``SESSION_TOUCH_INTERVAL`` seconds; the data itself is
+    only written when it changed. Empty sessions are never stored, so browsing
+    without a cart or a login costs no writes and sets no cookie.
+    """
+
+    salt = 'server-session'
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac', digest_method=hashlib.sha256)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie or not app.secret_key:
+            return ServerSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return ServerSession()
+        record = self.store.load(sid)
+        if record is None:
+            return ServerSession()
+        data, expires_at = record
+        return ServerSession(loads(data), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+            return
+
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+        if session.rotate and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            self.store.save(session.sid, dumps(session), expires_at)
+        elif session.modified:
+            self.store.save(session.sid, dumps(session), expires_at)
+        elif session.expires_at is None or \
+                expires_at - session.expires_at > timedelta(seconds=app.config['SESSION_TOUCH_INTERVAL']):
+            self.store.touch(session.sid, expires_at)
+        else:
+            return
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode(), expires=expires_at,
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+def init_sessions(app):
+    """Serve ``flask.session`` from ``SESSION_BACKEND`` instead of the signed cookie."""
+    store = load_store(app)
+    app.session_interface = ServerSideSessionInterface(store)
+    app.extensions['session_store'] = store
+
+
+def purge_expired(app):
+    """Delete expired sessions, and the carts in them; returns how many."""
+    with app.app_context():
+        return app.extensions['session_store'].purge()
+
+
+def start_purger(app, interval):
+    """Run ``purge_expired`` every ``interval`` seconds in a daemon thread of this process."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                purged = purge_expired(app)
+                if purged:
+                    app.logger.info('Session purger deleted %d expired sessions', purged)
+            except Exception:
+                app.logger.exception('Session purge failed')
+
+    thread = threading.Thread(target=run, name='session-purger', daemon=True)
+    thread.start()
+    return thread
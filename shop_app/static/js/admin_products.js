@@ -0,0 +1,144 @@
+// Admin product table: virtual scrolling over /admin/products/data?format=ndjson.
+// Only the rows on screen are in the DOM, and only the last few blocks of rows in memory.
+(function () {
+    'use strict';
+
+    var root = document.getElementById('product-table');
+    var template = document.getElementById('product-row');
+    if (!root || !template || !window.fetch || !window.TextDecoder) {
+        return; // the server-rendered page with its Next link keeps working
+    }
+
+    var ROW_HEIGHT = 64;   // px, fixed by the .virtual CSS so offsets map to rows
+    var BLOCK_SIZE = 100;  // rows per request
+    var MAX_BLOCKS = 20;   // blocks kept in memory, least recently loaded dropped first
+    var OVERSCAN = 10;     // rows rendered above and below the visible ones
+
+    var total = parseInt(root.dataset.total, 10) || 0;
+    var tbody = root.querySelector('tbody');
+    var columns = template.content.querySelectorAll('td').length;
+    var blocks = new Map();
+    var pending = new Set();
+    var scheduled = false;
+
+    function fetchBlock(number) {
+        if (blocks.has(number) || pending.has(number)) {
+            return;
+        }
+        pending.add(number);
+        var params = new URLSearchParams(root.dataset.query);
+        params.set('format', 'ndjson');
+        params.set('offset', number * BLOCK_SIZE);
+        params.set('limit', BLOCK_SIZE);
+        var rows = [];
+        var buffer = '';
+        var decoder = new TextDecoder();
+        fetch(root.dataset.url + '?' + params.toString(), {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            var reader = response.body.getReader();
+            // Parse the lines as they arrive instead of waiting for the whole response
+            function pump() {
+                return reader.read().then(function (chunk) {
+                    buffer += decoder.decode(chunk.value || new Uint8Array(), {stream: !chunk.done});
+                    var lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.forEach(function (line) {
+                        if (line) {
+                            rows.push(JSON.parse(line));
+                        }
+                    });
+                    return chunk.done ? rows : pump();
+                });
+            }
+            return pump();
+        }).catch(function (error) {
+            console.error('Could not load products', error);
+        }).then(function () {
+            // Kept even when the request failed, so a broken block is not requested on every frame
+            blocks.set(number, rows);
+            while (blocks.size > MAX_BLOCKS) {
+                blocks.delete(blocks.keys().next().value);
+            }
+            pending.delete(number);
+            schedule();
+        });
+    }
+
+    function spacer(height) {
+        var row = document.createElement('tr');
+        row.style.height = height + 'px';
+        return row;
+    }
+
+    function productRow(product) {
+        var row = template.content.firstElementChild.cloneNode(true);
+        row.querySelectorAll('[data-field]').forEach(function (cell) {
+            var field = cell.dataset.field;
+            var value = product[field];
+            if (field === 'image_url') {
+                if (value) {
+                    var img = document.createElement('img');
+                    img.src = value;
+                    img.alt = product.name;
+                    img.loading = 'lazy';
+                    cell.appendChild(img);
+                } else {
+                    cell.textContent = 'No image';
+                }
+            } else {
+                cell.textContent = field === 'price' ? '$' + Number(value).toFixed(2) : value;
+            }
+        });
+        row.querySelectorAll('a, form').forEach(function (el) {
+            var attr = el.tagName === 'A' ? 'href' : 'action';
+            el.setAttribute(attr, el.getAttribute(attr).replace('/0/', '/' + product.id + '/'));
+        });
+        return row;
+    }
+
+    function placeholderRow() {
+        var row = document.createElement('tr');
+        var cell = document.createElement('td');
+        cell.colSpan = columns;
+        cell.textContent = 'Loading…';
+        row.appendChild(cell);
+        return row;
+    }
+
+    function render() {
+        scheduled = false;
+        var first = Math.floor(root.scrollTop / ROW_HEIGHT);
+        var start = Math.max(0, first - OVERSCAN);
+        var end = Math.min(total, first + Math.ceil(root.clientHeight / ROW_HEIGHT) + OVERSCAN);
+        var fragment = document.createDocumentFragment();
+        fragment.appendChild(spacer(start * ROW_HEIGHT));
+        for (var i = start; i < end; i++) {
+            var block = blocks.get(Math.floor(i / BLOCK_SIZE));
+            var product = block && block[i % BLOCK_SIZE];
+            if (!block) {
+                fetchBlock(Math.floor(i / BLOCK_SIZE));
+            }
+            fragment.appendChild(product ? productRow(product) : placeholderRow());
+        }
+        fragment.appendChild(spacer((total - end) * ROW_HEIGHT));
+        tbody.replaceChildren(fragment);
+    }
+
+    function schedule() {
+        if (!scheduled) {
+            scheduled = true;
+            window.requestAnimationFrame(render);
+        }
+    }
+
+    root.classList.add('virtual');
+    var pager = document.getElementById('table-pager');
+    if (pager) {
+        pager.hidden = true;
+    }
+    root.addEventListener('scroll', schedule);
+    window.addEventListener('resize', schedule);
+    schedule();
+})();
@@ -0,0 +1,199 @@
+# Static snapshot of the storefront (product pages, listing pages, sitemap.xml, products.json) for a CDN or GitHub Pages
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from xml.sax.saxutils import escape
+
+from flask import url_for
+
+from extensions import db
+from models import Product
+
+MANIFEST = '.export-manifest.json'
+SITEMAP_MAX_URLS = 50000  # per file, the sitemaps.org limit
+BATCH_SIZE = 200  # product pages per unit of work handed to a render process
+LISTING_BATCH_SIZE = 20  # listing pages (of SHOP_PAGE_SIZE products each) per unit of work
+
+_worker_app = None
+
+
+def _write(path, data):
+    # Write then rename, so a CDN sync or web server never sees half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def product_path(product_id):
+    return os.path.join('products', str(product_id), 'index.html')
+
+
+def listing_path(number):
+    return 'index.html' if number == 1 else os.path.join('products', 'page', str(number), 'index.html')
+
+
+def listing_url(base_url, number):
+    return f'{base_url}/' if number == 1 else f'{base_url}/products/page/{number}/'
+
+
+def _stamp(updated_at):
+    return updated_at.isoformat() if updated_at else ''
+
+
+def _init_worker(config):
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config)
+
+
+def _render(app, out_dir, base_url, job):
+    """Render one batch of pages: ``('products', [id, ...])`` or ``('listing', [(number, [id, ...], has_next), ...])``."""
+    import routes
+    kind, items = job
+    with app.test_request_context('/', base_url=base_url):
+        if kind == 'products':
+            for product in Product.query.filter(Product.id.in_(items)):
+                _write(os.path.join(out_dir, product_path(product.id)), routes.render_product_page(product).encode())
+        else:
+            ids = [product_id for _, page_ids, _ in items for product_id in page_ids]
+            products = {p.id: p for p in Product.query.filter(Product.id.in_(ids))}
+            for number, page_ids, has_next in items:
+                html = routes.render_product_list(
+                    [products[i] for i in page_ids if i in products],
+                    prev_url=listing_url(base_url, number - 1) if number > 1 else None,
+                    next_url=listing_url(base_url, number + 1) if has_next else None)
+                _write(os.path.join(out_dir, listing_path(number)), html.encode())
+        db.session.remove()
+    return len(items)
+
+
+def _render_in_worker(out_dir, base_url, job):
+    return _render(_worker_app, out_dir, base_url, job)
+
+
+def _copy_static(app, out_dir):
+    # Only files that are new or changed since the last copy
+    target_root = os.path.join(out_dir, app.static_url_path.strip('/'))
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, os.path.relpath(source, app.static_folder))
+            stat = os.stat(source)
+            if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime \
+                    and os.stat(target).st_size == stat.st_size:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+
+
+def _write_sitemaps(out_dir, base_url, urls):
+    chunks = [urls[i:i + SITEMAP_MAX_URLS] for i in range(0, len(urls), SITEMAP_MAX_URLS)] or [[]]
+    names = ['sitemap.xml'] if len(chunks) == 1 else [f'sitemap-{n}.xml' for n in range(1, len(chunks) + 1)]
+    for name, chunk in zip(names, chunks):
+        entries = ''.join(f'<url><loc>{escape(loc)}</loc>{f"<lastmod>{lastmod}</lastmod>" if lastmod else ""}</url>\n'
+                          for loc, lastmod in chunk)
+        _write(os.path.join(out_dir, name), (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f'{entries}</urlset>\n').encode())
+    if len(names) > 1:
+        entries = ''.join(f'<sitemap><loc>{escape(base_url)}/{name}</loc></sitemap>\n' for name in names)
+        _write(os.path.join(out_dir, 'sitemap.xml'), (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f'{entries}</sitemapindex>\n').encode())
+
+
+def export_static(app, out_dir, base_url, workers=None, full=False):
+    """Write the storefront to ``out_dir`` as static files served from ``base_url``; returns counts of the work done.
+
+    Only pages whose products changed since the last export are rendered again:
+    product pages by their ``updated_at``, listing pages by the products they
+    show. ``full`` renders everything, which is needed after changing templates.
+    Renders are spread over ``workers`` processes, each with its own app and
+    database connections; ``workers=1`` renders in this process (required with
+    an in-memory database). Links to search, checkout and the admin still need
+    the app behind the CDN.
+    """
+    base_url = base_url.rstrip('/')
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('base_url') != base_url:
+            manifest = {}
+    old_products = manifest.get('products', {})
+    old_listing = manifest.get('listing', {})
+
+    rows = db.session.execute(
+        db.select(Product.id, Product.name, Product.stock, Product.updated_at).order_by(Product.name, Product.id)
+    ).all()
+    products = {str(row.id): _stamp(row.updated_at) for row in rows}
+    stale = [int(pid) for pid, stamp in products.items()
+             if old_products.get(pid) != stamp or not os.path.exists(os.path.join(out_dir, product_path(pid)))]
+
+    # Listing pages hold the in-stock products in storefront order; a page is stale when
+    # the products on it, or whether a next page exists, changed
+    per_page = app.config['SHOP_PAGE_SIZE']
+    in_stock = [row for row in rows if (row.stock or 0) > 0]
+    pages = [in_stock[i:i + per_page] for i in range(0, len(in_stock), per_page)] or [[]]
+    listing, stale_pages = {}, []
+    for number, page in enumerate(pages, start=1):
+        has_next = number < len(pages)
+        signature = hashlib.sha1(json.dumps(
+            [[row.id, products[str(row.id)]] for row in page] + [has_next]).encode()).hexdigest()
+        listing[str(number)] = signature
+        if old_listing.get(str(number)) != signature \
+                or not os.path.exists(os.path.join(out_dir, listing_path(number))):
+            stale_pages.append((number, [row.id for row in page], has_next))
+
+    jobs = [('products', stale[i:i + BATCH_SIZE]) for i in range(0, len(stale), BATCH_SIZE)]
+    jobs += [('listing', stale_pages[i:i + LISTING_BATCH_SIZE]) for i in range(0, len(stale_pages), LISTING_BATCH_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        config = {key: app.config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'SHOP_PAGE_SIZE', 'TESTING')}
+        config.update(PAGE_CACHE_ENABLED=False, RESERVATION_SWEEP_INTERVAL=0)
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker,
+                                 initargs=(config,)) as pool:
+            list(pool.map(partial(_render_in_worker, out_dir, base_url), jobs))
+    else:
+        for job in jobs:
+            _render(app, out_dir, base_url, job)
+
+    # Pages of products that were deleted, and listing pages past the new last one
+    deleted = [pid for pid in old_products if pid not in products]
+    for pid in deleted:
+        shutil.rmtree(os.path.join(out_dir, 'products', pid), ignore_errors=True)
+    for number in old_listing:
+        if number not in listing:
+            shutil.rmtree(os.path.join(out_dir, os.path.dirname(listing_path(int(number)))), ignore_errors=True)
+    if stale_pages and stale_pages[0][0] == 1:  # /products is the first listing page too
+        with open(os.path.join(out_dir, 'index.html'), 'rb') as f:
+            _write(os.path.join(out_dir, 'products', 'index.html'), f.read())
+
+    with app.test_request_context('/', base_url=base_url):
+        product_urls = {row.id: url_for('shop.view_product', product_id=row.id, _external=True) for row in rows}
+    urls = [(listing_url(base_url, number), None) for number in range(1, len(pages) + 1)]
+    urls += [(product_urls[row.id], row.updated_at.date().isoformat() if row.updated_at else None) for row in rows]
+    _write_sitemaps(out_dir, base_url, urls)
+
+    feed = []
+    for product in Product.query.order_by(Product.id).yield_per(1000):
+        feed.append({
+            'id': product.id, 'name': product.name, 'description': product.description, 'price': product.price,
+            'stock': product.stock, 'image_url': product.image_url, 'category_id': product.category_id,
+            'subcategory_id': product.subcategory_id, 'brand_id': product.brand_id,
+            'url': product_urls[product.id], 'updated_at': _stamp(product.updated_at),
+        })
+    _write(os.path.join(out_dir, 'products.json'), app.json.dumps({'products': feed}).encode())
+
+    _copy_static(app, out_dir)
+    _write(manifest_path, json.dumps({'base_url': base_url, 'products': products, 'listing': listing}).encode())
+    return {'products': len(stale), 'listing_pages': len(stale_pages), 'deleted': len(deleted),
+            'unchanged': len(products) - len(stale) + len(pages) - len(stale_pages)}
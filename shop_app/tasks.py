@@ -0,0 +1,227 @@
+# Background tasks: a queue in the task table, run by `flask worker` processes (no broker needed)
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Task
+
+ACTIVE = ('queued', 'running')
+FINISHED = ('done', 'failed')
+
+HANDLERS = {}  # task name -> fn(app, **payload)
+
+
+class PermanentError(Exception):
+    """Raised by a handler for failures a retry cannot fix; the task fails without further attempts."""
+
+
+def handler(name):
+    """Register ``fn(app, **payload)`` as the handler of task ``name``.
+
+    Its return value, which must be JSON-serialisable, is stored as the task result.
+    Handlers can run more than once (retries, a worker dying mid-task), so they
+    must be safe to repeat.
+    """
+    def decorator(fn):
+        HANDLERS[name] = fn
+        return fn
+    return decorator
+
+
+def _active(key):
+    return db.session.scalar(select(Task).where(Task.idempotency_key == key, Task.status.in_(ACTIVE)))
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """Add a task to the current session and return it.
+
+    Nothing is committed: the task is written with the caller's transaction, so a
+    worker never sees a task for a change that was rolled back. With an
+    idempotency ``key``, a queued or running task with the same key is returned
+    instead of adding a second one. Two transactions racing to add the same key
+    are stopped by a unique index: the second one fails with ``IntegrityError``.
+    """
+    if name not in HANDLERS:
+        raise LookupError(f'Unknown task "{name}".')
+    if key is not None:
+        existing = _active(key)
+        if existing is not None:
+            return existing
+    task = Task(name=name, payload=payload or {}, idempotency_key=key,
+                run_at=datetime.utcnow() + timedelta(seconds=delay),
+                max_attempts=max_attempts or current_app.config['TASK_MAX_ATTEMPTS'])
+    db.session.add(task)
+    return task
+
+
+LEASE_EXPIRED = 'Lease expired: the worker died or ran past TASK_LEASE.'
+
+
+def _abandoned(now):
+    # Running under a lease that expired because its worker died (or the handler outlived the lease)
+    return and_(Task.status == 'running', Task.locked_until < now)
+
+
+def _due(now):
+    # Queued and due, or abandoned with attempts left
+    return or_(and_(Task.status == 'queued', Task.run_at <= now),
+               and_(_abandoned(now), Task.attempts < Task.max_attempts))
+
+
+def _fail_exhausted(now):
+    """Fail abandoned tasks that have used all their attempts, rather than reclaiming them.
+
+    A task that crashes its worker never reaches ``run_task``'s error handling,
+    so without this it would be reclaimed and crash a worker forever.
+    """
+    failed = db.session.execute(
+        update(Task).where(_abandoned(now), Task.attempts >= Task.max_attempts)
+        .values(status='failed', locked_by=None, locked_until=None, finished_at=now, last_error=LEASE_EXPIRED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if failed:
+        current_app.logger.error('%d tasks failed for good after their leases expired on every attempt', failed)
+
+
+def claim(worker_id, lease):
+    """Lock the next due task for ``worker_id`` for ``lease`` seconds and return it, or ``None``.
+
+    The claim is a conditional UPDATE on the row picked by the SELECT: when two
+    workers pick the same row only one of them updates it, and the other tries
+    the next one.
+    """
+    for _ in range(5):
+        now = datetime.utcnow()
+        _fail_exhausted(now)
+        task_id = db.session.scalar(select(Task.id).where(_due(now)).order_by(Task.run_at, Task.id).limit(1))
+        if task_id is None:
+            db.session.commit()  # end the read transaction so the WAL can be checkpointed
+            return None
+        claimed = db.session.execute(
+            update(Task).where(Task.id == task_id, _due(now))
+            .values(status='running', locked_by=worker_id, locked_until=now + timedelta(seconds=lease),
+                    attempts=Task.attempts + 1, started_at=now,
+                    last_error=case((Task.status == 'running', LEASE_EXPIRED), else_=Task.last_error))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Task, task_id)
+    return None
+
+
+def backoff(attempts, base, cap):
+    """Seconds before attempt ``attempts + 1``: exponential from ``base``, capped, with jitter so retries spread out."""
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _finish(task_id, worker_id, **values):
+    # Only while we still hold the lease: after it expired the task may belong to another worker
+    db.session.execute(
+        update(Task).where(Task.id == task_id, Task.locked_by == worker_id, Task.status == 'running')
+        .values(locked_by=None, locked_until=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def run_task(app, task, worker_id):
+    """Run one claimed task and record the outcome: done, queued again with backoff, or failed."""
+    task_id, name, payload, attempts, max_attempts = task.id, task.name, task.payload, task.attempts, task.max_attempts
+    started = time.perf_counter()
+    try:
+        fn = HANDLERS.get(name)
+        if fn is None:
+            raise PermanentError(f'No handler registered for task "{name}".')
+        result = fn(app, **payload)
+    except Exception as e:
+        db.session.rollback()
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        now = datetime.utcnow()
+        if attempts < max_attempts and not isinstance(e, PermanentError):
+            delay = backoff(attempts, app.config['TASK_BACKOFF'], app.config['TASK_BACKOFF_MAX'])
+            app.logger.warning('Task %s (%s) failed, attempt %d of %d; retrying in %.0fs: %s',
+                               task_id, name, attempts, max_attempts, delay, error)
+            _finish(task_id, worker_id, status='queued', last_error=error, run_at=now + timedelta(seconds=delay))
+        else:
+            app.logger.exception('Task %s (%s) failed for good after %d attempts', task_id, name, attempts)
+            _finish(task_id, worker_id, status='failed', last_error=error, finished_at=now)
+        return False
+    _finish(task_id, worker_id, status='done', result=result, finished_at=datetime.utcnow())
+    app.logger.info('Task %s (%s) done in %.2fs', task_id, name, time.perf_counter() - started)
+    return True
+
+
+def purge(older_than):
+    """Delete finished tasks that finished more than ``older_than`` seconds ago; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    deleted = db.session.execute(
+        delete(Task).where(Task.status.in_(FINISHED), Task.finished_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def work(app, burst=False, stop=None, worker_id=None):
+    """Claim and run tasks until ``stop`` is set; with ``burst``, until none is due. Returns the number run.
+
+    Between tasks the worker sleeps ``TASK_POLL_INTERVAL`` seconds when the queue
+    is empty. Run several workers (processes) for parallelism.
+    """
+    stop = stop or threading.Event()
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    ran, purged_at = 0, 0.0
+    with app.app_context():
+        while not stop.is_set():
+            if time.monotonic() - purged_at > 3600:
+                purge(app.config['TASK_RETENTION'])
+                purged_at = time.monotonic()
+            task = claim(worker_id, app.config['TASK_LEASE'])
+            if task is None:
+                if burst:
+                    break
+                stop.wait(app.config['TASK_POLL_INTERVAL'])
+                continue
+            run_task(app, task, worker_id)
+            db.session.remove()
+            ran += 1
+    return ran
+
+
+def retry(task_id):
+    """Queue a failed task again with a fresh set of attempts; ``False`` if it is not failed
+    or another task with its idempotency key is already pending."""
+    try:
+        retried = db.session.execute(
+            update(Task).where(Task.id == task_id, Task.status == 'failed')
+            .values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return bool(retried)
+
+
+def latest(name):
+    """The most recent task called ``name``, or ``None``."""
+    return db.session.scalar(select(Task).where(Task.name == name).order_by(Task.id.desc()).limit(1))
+
+
+def status_counts():
+    """``{'queued': n, 'running': n, 'done': n, 'failed': n}``."""
+    counts = dict.fromkeys(ACTIVE + FINISHED, 0)
+    counts.update(db.session.execute(select(Task.status, func.count()).group_by(Task.status)).all())
+    return counts
@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product
+import api
+from support import AppTestCase
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_fields(self):
+        self.assertEqual(api.parse_fields('price, name,price'), ('id', 'price', 'name'))
+        self.assertEqual(api.parse_fields(['stock']), ('id', 'stock'))
+        self.assertEqual(api.parse_fields(None), api.PRODUCT_FIELDS)
+        for raw in (5, {'name': 1}, [1], ['name', None], 'name,secret'):
+            with self.assertRaises(api.ApiError, msg=raw):
+                api.parse_fields(raw)
+
+    def test_ids_and_limit(self):
+        self.assertEqual(api.parse_ids('3, 1,3,,2', 10), [3, 1, 2])
+        self.assertEqual(api.parse_ids([5, '6', 5], 10), [5, 6])
+        for raw in (7, [1.5], [True], ['x'], [[1]], list(range(11))):
+            with self.assertRaises(api.ApiError, msg=raw):
+                api.parse_ids(raw, 10)
+        self.assertEqual(api.parse_limit('20'), 20)
+        self.assertIsNone(api.parse_limit(''))
+        for raw in ('-1', 'ten', [5], 2.5):
+            with self.assertRaises(api.ApiError, msg=raw):
+                api.parse_limit(raw)
+
+
+class TestBatchApi(AppTestCase):
+    admin = True
+    config = {'API_BATCH_SIZE': 2, 'API_MAX_IDS': 5}
+
+    def setUp(self):
+        super().setUp()
+        for name, price, stock in (('Cable', '3.50', 10), ('Camera', '120.00', 0), ('Case', '15.00', 4),
+                                   ('Desk', '80.00', 1), ('Lamp', '22.25', 0)):
+            self.add_product(name=name, price=Decimal(price), stock=stock)
+
+    def get(self, query=''):
+        response = self.client.get(f'/admin/api/products{query}')
+        return response.status_code, response.get_json()
+
+    def test_ids_keep_request_order_and_report_missing(self):
+        status, data = self.get('?ids=4,99,1,2,4&fields=name,price')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['products'], [{'id': 4, 'name': 'Desk', 'price': 80.0},
+                                             {'id': 1, 'name': 'Cable', 'price': 3.5},
+                                             {'id': 2, 'name': 'Camera', 'price': 120.0}])
+        self.assertEqual(data['missing'], [99])
+
+    def test_filters(self):
+        names = lambda query: [p['name'] for p in self.get(query)[1]['products']]
+        self.assertEqual(names('?in_stock=1'), ['Cable', 'Case', 'Desk'])
+        self.assertEqual(names('?min_price=15&max_price=80'), ['Case', 'Desk', 'Lamp'])
+        self.assertEqual(names('?min_stock=1&max_stock=4'), ['Case', 'Desk'])
+        self.assertEqual(names('?name=Ca'), ['Cable', 'Camera', 'Case'])
+        self.assertEqual(names('?name=Ca&limit=2'), ['Cable', 'Camera'])
+        self.assertEqual(names('?q=camera'), ['Camera'])
+        self.assertEqual(names('?name=%25'), [])  # LIKE wildcards are matched literally
+        self.assertEqual(self.get('?min_price=cheap')[0], 400)
+
+    def test_post_body(self):
+        response = self.client.post('/admin/api/products', json={'ids': [5, 3], 'fields': ['stock']})
+        self.assertEqual(response.get_json(), {'products': [{'id': 5, 'stock': 0}, {'id': 3, 'stock': 4}],
+                                               'missing': []})
+        response = self.client.post('/admin/api/products', json={'in_stock': True, 'limit': 1, 'fields': 'name'})
+        self.assertEqual(response.get_json()['products'], [{'id': 1, 'name': 'Cable'}])
+
+    def test_bad_requests_are_400(self):
+        for body in ({'fields': 5}, {'fields': [1]}, {'ids': 'x'}, {'ids': list(range(1, 7))}, {'limit': [1]}, [1, 2]):
+            response = self.client.post('/admin/api/products', json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', response.get_json())
+        self.assertEqual(self.client.post('/admin/api/products', data='ids=1').status_code, 400)
+
+    def test_response_is_streamed_in_batches(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        db.event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/admin/api/products?fields=name')
+            self.assertTrue(response.is_streamed)
+            data = json.loads(response.get_data(as_text=True))
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual([p['id'] for p in data['products']], [1, 2, 3, 4, 5])
+        # Keyset batches of API_BATCH_SIZE: 2 + 2 + 1 rows
+        self.assertEqual(len([s for s in statements if 'FROM product' in s]), 3)
+
+    def test_stream_json_chunks(self):
+        rows = db.session.execute(db.select(Product.id, Product.name).order_by(Product.id)).all()
+        chunks = list(api.stream_json(iter(rows), [9], rows_per_chunk=2))
+        self.assertGreater(len(chunks), 2)
+        data = json.loads(''.join(chunks))
+        self.assertEqual((data['products'][4], data['missing']), ({'id': 5, 'name': 'Lamp'}, [9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
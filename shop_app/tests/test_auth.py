@@ -0,0 +1,153 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import User
+from ratelimit import SQLiteSlidingWindowLimiter, SlidingWindowLimiter
+import auth
+from support import AppTestCase
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+
+    def test_window_slides_and_memory_is_bounded(self):
+        clock = Clock()
+        limiter = SlidingWindowLimiter(limit=2, window=60, max_keys=3, clock=clock)
+        limiter.hit('a')
+        clock.now += 30
+        limiter.hit('a')
+        self.assertEqual(limiter.retry_after('a'), 30)
+        clock.now += 30  # the first hit leaves the window
+        self.assertEqual(limiter.retry_after('a'), 0)
+
+        for key in 'bcde':
+            limiter.hit(key)
+        self.assertEqual(list(limiter._hits), ['c', 'd', 'e'])
+        self.assertTrue(all(len(hits) <= 2 for hits in limiter._hits.values()))
+
+    def test_sqlite_limiter_is_shared_between_instances(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            clock = Clock()
+            path = os.path.join(tmp, 'limits.db')
+            first = SQLiteSlidingWindowLimiter(2, 60, path, clock=clock)
+            second = SQLiteSlidingWindowLimiter(2, 60, path, clock=clock)
+            first.hit('ip:1')
+            second.hit('ip:1')
+            self.assertEqual(first.retry_after('ip:1'), 60)
+            second.reset('ip:1')
+            self.assertEqual(first.retry_after('ip:1'), 0)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_acquire_is_atomic_under_concurrency(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for limiter in (SlidingWindowLimiter(3, 60),
+                            SQLiteSlidingWindowLimiter(3, 60, os.path.join(tmp, 'limits.db'))):
+                start = threading.Barrier(20)
+
+                def attempt():
+                    start.wait()
+                    return limiter.acquire('user:boss')
+
+                with ThreadPoolExecutor(20) as pool:
+                    waits = list(pool.map(lambda _: attempt(), range(20)))
+                self.assertEqual(waits.count(0), 3, type(limiter).__name__)
+                limiter.release('user:boss')
+                self.assertEqual(limiter.acquire('user:boss'), 0)
+                self.assertGreater(limiter.acquire('user:boss'), 0)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestAdminLogin(AppTestCase):
+    config = {'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', 'LOGIN_LIMIT_PER_USER': (3, 300)}
+
+    def setUp(self):
+        super().setUp()
+        self.runner = self.app.test_cli_runner()
+        result = self.runner.invoke(args=['create-admin', 'boss', '--password', 's3cret'])
+        self.assertIn('created', result.output)
+
+    def login(self, password, username='boss'):
+        return self.client.post('/admin/login', data={'username': username, 'password': password})
+
+    def test_login_with_hashed_password(self):
+        user = User.query.one()
+        self.assertTrue(user.password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertEqual(self.login('admin123').status_code, 401)
+        self.assertEqual(self.login('s3cret', username='nobody').status_code, 401)
+        response = self.login('s3cret')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get('/admin/products').status_code, 200)
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        self.assertEqual(self.login('s3cret').status_code, 302)
+        db.session.expire_all()
+        self.assertTrue(User.query.one().password_hash.startswith('pbkdf2:sha256:2000$'))
+
+    def test_login_flood_is_refused_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('wrong').status_code, 401)
+        with mock.patch.object(auth, '_run', side_effect=AssertionError('hashed')):
+            response = self.login('s3cret')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+        # Other accounts are still reachable from this address
+        self.assertEqual(self.login('x', username='other').status_code, 401)
+
+    def test_attempts_count_before_hashing(self):
+        limiters = self.app.extensions['login_limiters']
+        counted = []
+        real_run = auth._run
+
+        def run(app, fn, *args):
+            counted.append(len(limiters['user']._hits['user:boss']))
+            return real_run(app, fn, *args)
+
+        with mock.patch.object(auth, '_run', run):
+            self.assertEqual(self.login('wrong').status_code, 401)
+            self.assertEqual(self.login('s3cret').status_code, 302)
+        self.assertEqual(counted, [1, 2])
+        # The successful attempt is given back and clears the user's failures
+        self.assertNotIn('user:boss', limiters['user']._hits)
+        self.assertEqual(len(limiters['ip']._hits['ip:127.0.0.1']), 1)
+
+    def test_busy_hashing_pool_is_a_503(self):
+        self.app.config['PASSWORD_HASH_TIMEOUT'] = 0.05
+        release = threading.Event()
+        busy = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(busy.shutdown)
+        self.addCleanup(release.set)
+        busy.submit(release.wait)  # the only worker is taken, so the login's hash waits in the queue
+        hashed = []
+        with mock.patch.object(auth, '_pool', return_value=busy), \
+                mock.patch.object(auth, 'check_password_hash', side_effect=lambda *args: hashed.append(args)):
+            response = self.login('s3cret')
+            release.set()
+            busy.shutdown(wait=True)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(hashed, [])  # cancelled rather than hashed for nobody
+        self.assertEqual(len(self.app.extensions['login_limiters']['user']._hits['user:boss']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
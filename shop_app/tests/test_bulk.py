@@ -0,0 +1,175 @@
+import io
+import json
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Product
+import bulk
+from support import AppTestCase
+
+
+def rows(text, fmt='csv'):
+    return bulk.iter_rows(io.BytesIO(text.encode()), fmt)
+
+
+class TestIterRows(unittest.TestCase):
+
+    def test_csv_line_numbers(self):
+        # A BOM (as Excel writes it) is skipped; a quoted newline makes the row end a line later
+        parsed = list(rows('\ufeffname,price,description\nA,1,"two\nlines"\nB,2,\n'))
+        self.assertEqual([(line, row['name']) for line, row in parsed], [(3, 'A'), (4, 'B')])
+        self.assertEqual(parsed[0][1]['description'], 'two\nlines')
+
+    def test_ndjson_errors_keep_their_line(self):
+        parsed = list(rows('{"name": "A", "price": 1}\n\nnot json\n[1, 2]\n{"name": "B", "price": 2}\n', 'ndjson'))
+        self.assertEqual([line for line, _ in parsed], [1, 3, 4, 5])
+        self.assertIsInstance(parsed[1][1], bulk.ProductValidationError)
+        self.assertEqual(str(parsed[2][1]), 'Each line must be a JSON object.')
+        self.assertEqual(parsed[3][1]['name'], 'B')
+        with self.assertRaises(ValueError):
+            list(rows('', 'xml'))
+
+    def test_lines_that_are_not_utf8_are_row_errors(self):
+        for fmt, data in (('csv', b'name,price\nA,1\n\xff\xfeB,2\nC,3\n'),
+                          ('ndjson', b'{"name": "A"}\n{"name": "\xe9"}\n{"name": "C"}\n')):
+            parsed = list(bulk.iter_rows(io.BytesIO(data), fmt))
+            self.assertEqual(len(parsed), 3, fmt)
+            self.assertEqual(str(parsed[1][1]), bulk.NOT_UTF8_MESSAGE, fmt)
+            self.assertEqual(parsed[2][1]['name'], 'C', fmt)
+
+    def test_guess_format(self):
+        self.assertEqual(bulk.guess_format('Products.JSONL'), 'ndjson')
+        self.assertEqual(bulk.guess_format('products.csv', default='ndjson'), 'csv')
+        self.assertEqual(bulk.guess_format(None, default='ndjson'), 'ndjson')
+
+
+class TestImport(AppTestCase):
+
+    def commits_during(self, fn):
+        commits = []
+        listener = lambda session: commits.append(1)
+        event.listen(db.session, 'after_commit', listener)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.session, 'after_commit', listener)
+        return result, len(commits)
+
+    def test_one_transaction_per_chunk(self):
+        text = 'name,price,stock\n' + ''.join(f'P{i},{i},1\n' for i in range(1, 6))
+        report, commits = self.commits_during(lambda: bulk.import_products(rows(text), chunk_size=2))
+        self.assertEqual((report.inserted, report.updated, report.error_count), (5, 0, 0))
+        self.assertEqual(commits, 3)
+        self.assertEqual(Product.query.count(), 5)
+
+    def test_last_row_for_an_id_wins(self):
+        product_id = self.add_product(name='Old', price=1, stock=1)
+        text = (f'id,name,price,stock\n{product_id},First,2,2\n{product_id},Second,3,3\n'
+                f'{product_id},Third,4,4\n77,New,5,5\n77,Newer,6,6\n')
+        report = bulk.import_products(rows(text), chunk_size=2)  # the repeats span chunks too
+        self.assertEqual((report.inserted, report.error_count), (1, 0))
+        db.session.expire_all()
+        product = db.session.get(Product, product_id)
+        self.assertEqual((product.name, product.price, product.stock), ('Third', Decimal('4.00'), 4))
+        self.assertGreater(product.version, 1)
+        self.assertEqual(db.session.get(Product, 77).name, 'Newer')
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        text = ('{"name": "Good", "price": "1.50"}\n{"price": 1}\n{"name": "X", "price": "abc"}\n'
+                '{"id": "seven", "name": "Y", "price": 1}\n{"name": "Z", "price": 1, "cost_currency": "dollars"}\n'
+                '{"name": "Also good", "price": 2, "stock": "3"}\n')
+        report = bulk.import_products(rows(text, 'ndjson'))
+        self.assertEqual((report.inserted, report.error_count), (2, 4))
+        self.assertEqual([error['line'] for error in report.to_dict()['errors']], [2, 3, 4, 5])
+        self.assertEqual(report.errors[0][1], 'Name and Price are required fields.')
+        self.assertEqual(sorted(p.name for p in Product.query), ['Also good', 'Good'])
+
+    def test_out_of_range_integers_are_row_errors(self):
+        text = ('id,name,price,stock,category_id\n' + f'{2 ** 64},A,1,1,\n' + '0,B,1,1,\n'
+                + f',C,1,{10 ** 30},\n' + f',D,1,1,{2 ** 63}\n' + ',E,1,1,\n')
+        report = bulk.import_products(rows(text))
+        self.assertEqual((report.inserted, [line for line, _ in report.errors]), (1, [2, 3, 4, 5]))
+        self.assertEqual(report.errors[2][1], 'Stock is out of range.')
+
+    def test_reported_errors_are_capped(self):
+        text = 'name,price\n' + ',1\n' * 5
+        with mock.patch.object(bulk, 'MAX_REPORTED_ERRORS', 3):
+            report = bulk.import_products(rows(text))
+        self.assertEqual((report.error_count, len(report.errors)), (5, 3))
+
+    def test_a_failed_chunk_is_rolled_back_and_reported(self):
+        db.session.execute(db.text("CREATE TRIGGER refuse_boom BEFORE INSERT ON product WHEN new.name = 'Boom' "
+                                   "BEGIN SELECT RAISE(ABORT, 'no booms'); END"))
+        db.session.commit()
+        text = 'name,price\nA,1\nB,1\nC,1\nBoom,1\nE,1\n'
+        report = bulk.import_products(rows(text), chunk_size=2)
+        self.assertEqual((report.inserted, report.error_count), (3, 2))
+        self.assertEqual(report.errors, [(4, 'Chunk rolled back: no booms'), (5, 'Chunk rolled back: no booms')])
+        self.assertEqual(sorted(p.name for p in Product.query), ['A', 'B', 'E'])
+
+    def test_admin_upload(self):
+        self.login()
+        response = self.client.post('/admin/products/import', data={
+            'file': (io.BytesIO(b'{"name": "Mug", "price": 5}\n{"name": ""}\n'), 'products.ndjson')},
+            headers={'Accept': 'application/json'})
+        self.assertEqual(response.get_json(), {
+            'inserted': 1, 'updated': 0, 'error_count': 1,
+            'errors': [{'line': 2, 'message': 'Name and Price are required fields.'}]})
+        self.assertEqual(self.client.post('/admin/products/import', data={
+            'file': (io.BytesIO(b''), 'products.xml'), 'format': 'xml'}).status_code, 400)
+        response = self.client.post('/admin/products/import', data={
+            'file': (io.BytesIO('name,price\nCafé,1\n'.encode('latin-1')), 'products.csv')},
+            headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['errors'], [{'line': 2, 'message': bulk.NOT_UTF8_MESSAGE}])
+
+
+class TestExport(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_product(name='Cámara, "pro"', description='two\nlines', price=Decimal('1234.56'), stock=3,
+                         cost_price=Decimal('300.10'), cost_currency='PEN', margin=0.25)
+        self.add_product(name='Plain', price=Decimal('0.99'), stock=0)
+        self.add_product(name='Third', price=Decimal('10.00'), stock=7, image_url='http://example.com/3.jpg')
+
+    def export(self, fmt):
+        return ''.join(bulk.export_products(fmt, batch_size=2))
+
+    def test_batches(self):
+        self.assertEqual(len(list(bulk.export_products('csv', batch_size=2))), 3)  # header + 2 batches
+        lines = self.export('ndjson').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [1, 2, 3])
+        self.assertEqual(set(json.loads(lines[0])), set(bulk.EXPORT_FIELDS))
+
+    def test_round_trips(self):
+        for fmt in bulk.FORMATS:
+            exported = self.export(fmt)
+            db.session.execute(db.delete(Product))
+            db.session.commit()
+            report = bulk.import_products(rows(exported, fmt))
+            self.assertEqual((report.inserted, report.error_count), (3, 0), fmt)
+            self.assertEqual(self.export(fmt), exported, fmt)
+        product = db.session.get(Product, 1)
+        self.assertEqual((product.name, product.description, product.price, product.cost_price),
+                         ('Cámara, "pro"', 'two\nlines', Decimal('1234.56'), Decimal('300.10')))
+
+    def test_admin_download(self):
+        self.login()
+        response = self.client.get('/admin/products/export?format=ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('filename=products.ndjson', response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(as_text=True), self.export('ndjson'))
+        self.assertEqual(self.client.get('/admin/products/export?format=xml').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
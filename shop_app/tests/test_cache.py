@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, flash
+
+from cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache.max_entries = 3
+
+    def test_lru_eviction_and_counters(self):
+        """The least recently used entry is evicted first and every lookup is counted."""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key.encode(), 'text/html')
+        self.assertIsNotNone(self.cache.get('a'))  # 'a' becomes most recent
+        self.cache.set('d', b'd', 'text/html')      # evicts 'b'
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+        self.assertEqual(stats['entries'], 3)
+
+    def test_ttl_expiry(self):
+        self.cache.ttl = 0.01
+        self.cache.set('a', b'a', 'text/html')
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_invalidate_product_only_touches_its_page_and_listings(self):
+        self.cache.max_entries = 10
+        for key in ('product:1', 'product:2', 'listing:/?', 'listing:/products?after=x'):
+            self.cache.set(key, b'x', 'text/html')
+        self.cache.invalidate_product(1)
+        self.assertIsNone(self.cache.get('product:1'))
+        self.assertIsNone(self.cache.get('listing:/?'))
+        self.assertIsNone(self.cache.get('listing:/products?after=x'))
+        self.assertIsNotNone(self.cache.get('product:2'))
+
+
+class TestCachedView(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SECRET_KEY'] = 'test'
+        self.cache = ResponseCache(self.app)
+        self.renders = 0
+
+        @self.app.route('/page')
+        @self.cache.cached(lambda: 'page')
+        def page():
+            self.renders += 1
+            return 'hello'
+
+        @self.app.route('/flash')
+        def set_flash():
+            flash('saved')
+            return 'ok'
+
+        self.client = self.app.test_client()
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/page')
+        second = self.client.get('/page')
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(second.data, b'hello')
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/page').headers['ETag']
+        response = self.client.get('/page', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_pending_flash_bypasses_cache(self):
+        self.client.get('/page')
+        self.client.get('/flash')
+        self.client.get('/page')
+        self.assertEqual(self.renders, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
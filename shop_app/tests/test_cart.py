@@ -0,0 +1,165 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, update
+
+from extensions import db
+from models import Product, WebSession
+import session_store
+from support import AppTestCase
+
+
+class CartTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([Product(name=f'Part {i}', price=Decimal('1.25') * i, stock=5) for i in range(1, 121)])
+        db.session.commit()
+
+    def add(self, product_id, quantity=1):
+        return self.client.post('/cart/items', json={'product_id': product_id, 'quantity': quantity})
+
+    def cart(self):
+        return self.client.get('/cart?format=json').get_json()
+
+
+class TestCart(CartTestCase):
+
+    def test_cart_lines_and_totals(self):
+        self.assertEqual(self.add(2, 3).status_code, 201)
+        self.add(1)
+        self.add(2, 1)
+        cart = self.cart()
+        self.assertEqual([(i['product_id'], i['quantity']) for i in cart['items']], [(2, 4), (1, 1)])
+        self.assertEqual((cart['units'], cart['total']), (5, 11.25))
+        self.assertEqual(self.add(999).status_code, 404)
+        self.assertEqual(self.add(1, -2).status_code, 400)
+
+        self.client.post('/cart/items/2', data={'quantity': '2'})
+        self.client.post('/cart/items/1', data={'quantity': '0'})
+        self.assertEqual([(i['quantity'], i['available']) for i in self.cart()['items']], [(2, True)])
+        self.client.post('/cart/items/2', json={'quantity': 500})  # capped at CART_MAX_QUANTITY
+        self.assertEqual([(i['quantity'], i['available']) for i in self.cart()['items']], [(99, False)])
+
+        db.session.delete(db.session.get(Product, 2))
+        db.session.commit()
+        self.assertEqual(self.cart(), {'items': [], 'units': 0, 'total': 0})
+
+    def test_html_flow(self):
+        response = self.client.post('/cart/items', data={'product_id': '3', 'quantity': '2'})
+        self.assertEqual(response.status_code, 302)
+        page = self.client.get('/cart').data
+        self.assertIn(b'Part 3', page)
+        self.assertIn(b'$7.50', page)
+        self.client.post('/cart/clear')
+        self.assertIn(b'Your cart is empty', self.client.get('/cart').data)
+
+    def test_setting_a_quantity_cannot_bypass_add(self):
+        self.assertEqual(self.client.post('/cart/items/999', data={'quantity': '3'}).status_code, 404)
+        with self.client.session_transaction() as session:
+            self.assertNotIn('cart', session)
+
+        self.assertEqual(self.client.post('/cart/items/4', data={'quantity': '3'}).status_code, 302)  # a new line
+        for product_id in range(5, 104):
+            self.add(product_id)
+        response = self.client.post('/cart/items/110', json={'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 100', response.get_json()['error'])
+        self.assertEqual(self.client.post('/cart/items/110', data={'quantity': '1'}).status_code, 302)
+        with self.client.session_transaction() as session:
+            self.assertEqual(len(session['cart']), 100)
+            self.assertNotIn(110, dict(session['cart']))
+        self.assertEqual(self.client.post('/cart/items/4', json={'quantity': 5}).status_code, 200)
+
+    def test_json_bodies_must_be_objects(self):
+        for body in ([1], 'x', 3):
+            self.assertEqual(self.client.post('/cart/items', json=body).status_code, 400, body)
+            self.assertEqual(self.client.post('/cart/items/1', json=body).status_code, 400, body)
+        self.assertEqual(self.client.post('/cart/items', json={'product_id': 1}).status_code, 201)
+
+    def test_ids_past_64_bits_are_unknown_products(self):
+        for product_id in (2 ** 63, 2 ** 64):
+            self.assertEqual(self.client.post('/cart/items', json={'product_id': product_id}).status_code, 404)
+            self.assertEqual(self.client.post(f'/cart/items/{product_id}', json={'quantity': 1}).status_code, 404)
+
+    def test_totals_take_one_query_however_long_the_cart(self):
+        for product_id in range(1, 101):
+            self.add(product_id)
+        self.assertEqual(self.add(101).status_code, 400)  # CART_MAX_LINES
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            cart = self.cart()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(cart['items']), 100)
+        self.assertEqual(cart['total'], sum(1.25 * i for i in range(1, 101)))
+        self.assertEqual(len([s for s in statements if 'FROM product' in s]), 1)
+
+
+class TestServerSessions(CartTestCase):
+
+    def test_cookie_holds_only_a_signed_id(self):
+        self.assertIsNone(self.client.get('/cart').headers.get('Set-Cookie'))  # empty sessions are not stored
+        for product_id in range(1, 101):
+            self.add(product_id)
+        cookie = self.client.get_cookie('session').value
+        self.assertLess(len(cookie), 100)
+        row = db.session.get(WebSession, cookie.split('.')[0])
+        self.assertEqual(row.data[:1], b'z')  # large carts are compressed
+        self.assertEqual(len(session_store.loads(row.data)['cart']), 100)
+
+        self.client.set_cookie('session', cookie[:-2] + 'xx')
+        self.assertEqual(self.cart()['items'], [])
+
+    def test_sliding_expiry_and_purge(self):
+        self.add(1)
+        sid = self.client.get_cookie('session').value.split('.')[0]
+        expires_at = db.session.get(WebSession, sid).expires_at
+        self.assertIsNone(self.client.get('/cart').headers.get('Set-Cookie'))  # too soon to push the expiry
+
+        db.session.execute(update(WebSession).values(expires_at=expires_at - timedelta(hours=2)))
+        db.session.commit()
+        self.assertIn('session=', self.client.get('/cart').headers['Set-Cookie'])
+        db.session.expire_all()
+        self.assertGreaterEqual(db.session.get(WebSession, sid).expires_at, expires_at)
+
+        db.session.execute(update(WebSession).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        self.assertEqual(self.cart()['items'], [])
+        self.assertEqual(self.app.test_cli_runner().invoke(args=['purge-sessions']).output,
+                         '1 expired sessions deleted.\n')
+        self.assertEqual(WebSession.query.count(), 0)
+
+    def test_session_gets_a_new_id_when_cleared(self):
+        self.add(1)
+        before = self.client.get_cookie('session').value
+        with self.client.session_transaction() as session:
+            session.clear()
+            session['admin_logged_in'] = True
+        self.assertNotEqual(self.client.get_cookie('session').value, before)
+        self.assertEqual(WebSession.query.count(), 1)
+
+
+class TestFileSessionStore(CartTestCase):
+
+    def app_config(self):
+        return {'SESSION_BACKEND': 'file', 'SESSION_FILE': os.path.join(self.make_tmp(), 'sessions.db')}
+
+    def test_carts_live_in_the_file(self):
+        self.add(4, 2)
+        self.assertEqual(self.cart()['total'], 10)
+        self.assertEqual(WebSession.query.count(), 0)
+        store = self.app.extensions['session_store']
+        self.assertEqual(store.purge(now=datetime.utcnow() + timedelta(days=15)), 1)
+        self.assertEqual(self.cart()['items'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from extensions import db
+import database
+from support import AppTestCase
+
+
+class TestSettings(unittest.TestCase):
+
+    def test_database_uri(self):
+        self.assertEqual(database.database_uri({}), 'sqlite:///shop.db')
+        self.assertEqual(database.database_uri({'DATABASE_URL': 'sqlite:////srv/shop.db'}), 'sqlite:////srv/shop.db')
+        self.assertEqual(database.database_uri({'DATABASE_URL': 'postgres://u:p@db/shop'}), 'postgresql://u:p@db/shop')
+        self.assertEqual(database.database_uri({'DATABASE_URL': 'postgresql://db/shop'}), 'postgresql://db/shop')
+
+    def test_engine_options(self):
+        self.assertEqual(database.engine_options('sqlite:///shop.db', {}), {'pool_size': 10, 'max_overflow': 20})
+        for uri in ('sqlite:///:memory:', 'sqlite://', 'sqlite:///'):
+            self.assertEqual(database.engine_options(uri, {}), {}, uri)
+        self.assertEqual(database.engine_options('postgresql://db/shop', {'DB_POOL_SIZE': '3', 'DB_POOL_RECYCLE': '60'}), {
+            'pool_size': 3, 'max_overflow': 20, 'pool_timeout': 30, 'pool_recycle': 60, 'pool_pre_ping': True})
+        environ = {'DB_POOL_SIZE': '4', 'SQLALCHEMY_ENGINE_OPTIONS': '{"pool_size": 8, "echo": true}'}
+        self.assertEqual(database.engine_options('sqlite:///shop.db', environ),
+                         {'pool_size': 8, 'max_overflow': 20, 'echo': True})
+        for environ in ({'DB_POOL_SIZE': 'many'}, {'SQLALCHEMY_ENGINE_OPTIONS': '[1]'},
+                        {'SQLALCHEMY_ENGINE_OPTIONS': '{bad'}):
+            with self.assertRaises(ValueError, msg=environ):
+                database.engine_options('sqlite:///shop.db', environ)
+
+    def test_sqlite_pragmas(self):
+        self.assertEqual(database.sqlite_pragmas({}), database.DEFAULT_SQLITE_PRAGMAS)
+        pragmas = database.sqlite_pragmas({'SQLITE_PRAGMAS': '{"mmap_size": null, "cache_size": -2000, "temp_store": "MEMORY"}'})
+        self.assertNotIn('mmap_size', pragmas)
+        self.assertEqual((pragmas['cache_size'], pragmas['temp_store'], pragmas['journal_mode']), (-2000, 'MEMORY', 'WAL'))
+        self.assertEqual(database.sqlite_pragmas({'SQLITE_PRAGMAS': 'null'}), {})
+        for raw in ('{"journal_mode": "WAL; DROP TABLE product"}', '{"bad name": 1}', '[1]', 'WAL'):
+            with self.assertRaises(ValueError, msg=raw):
+                database.sqlite_pragmas({'SQLITE_PRAGMAS': raw})
+
+    def test_include_object_skips_the_fts_tables(self):
+        self.assertFalse(database.include_object(None, 'product_fts_data', 'table', True, None))
+        self.assertTrue(database.include_object(None, 'product', 'table', True, None))
+        self.assertTrue(database.include_object(None, 'product_fts_idx', 'index', True, None))
+
+
+class FileDatabaseTestCase(AppTestCase):
+    pragmas = database.sqlite_pragmas({})
+
+    def app_config(self):
+        return {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.make_tmp()}/shop.db', 'SQLITE_PRAGMAS': self.pragmas}
+
+    def pragma(self, name):
+        with db.engine.connect() as connection:
+            return connection.execute(text(f'PRAGMA {name}')).scalar()
+
+
+class TestConnectionPragmas(FileDatabaseTestCase):
+    pragmas = database.sqlite_pragmas({'SQLITE_PRAGMAS': '{"cache_size": -1024}'})
+
+    def test_new_connections_get_the_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('cache_size'), -1024)
+        self.assertEqual(db.engine.pool.size(), 10)
+        # Every pooled connection is set up, not only the first one
+        with db.engine.connect() as first, db.engine.connect() as second:
+            self.assertEqual([c.execute(text('PRAGMA foreign_keys')).scalar() for c in (first, second)], [1, 1])
+
+
+class TestWithoutPragmas(FileDatabaseTestCase):
+    pragmas = database.sqlite_pragmas({'SQLITE_PRAGMAS': 'null'})
+
+    def test_connections_keep_the_sqlite_defaults(self):
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
+        self.assertEqual(self.pragma('foreign_keys'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Brand, Category, Product, ProductFacet, Subcategory
+import bulk
+import facets
+import inventory
+from support import AppTestCase
+
+
+class FacetTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.laptops = Category(name='Laptops')
+        self.phones = Category(name='Phones')
+        self.gaming = Subcategory(name='Gaming', category=self.laptops)
+        self.acme = Brand(name='Acme')
+        self.zeta = Brand(name='Zeta')
+        db.session.add_all([self.laptops, self.phones, self.gaming, self.acme, self.zeta])
+        db.session.commit()
+
+    def add(self, **fields):
+        product = Product(**{'name': 'P', 'price': 1.0, 'stock': 1, **fields})
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def facet_rows(self):
+        return sorted((f.category_id, f.subcategory_id, f.brand_id, f.product_count)
+                      for f in ProductFacet.query.all() if f.product_count)
+
+    def assert_counts_match_rebuild(self):
+        maintained = self.facet_rows()
+        db.session.expire_all()
+        with db.engine.begin() as connection:
+            facets.rebuild_facets(connection)
+        self.assertEqual(maintained, self.facet_rows())
+        return maintained
+
+
+class TestFacetMaintenance(FacetTestCase):
+
+    def test_triggers_follow_every_write_path(self):
+        """Admin edits, bulk import and reservations keep product_facet equal to a full recount."""
+        laptop = self.add(category_id=self.laptops.id, subcategory_id=self.gaming.id, brand_id=self.acme.id, stock=2)
+        phone = self.add(category_id=self.phones.id, brand_id=self.zeta.id)
+        self.add(stock=0, category_id=self.phones.id)
+        self.assertEqual(self.assert_counts_match_rebuild(), [
+            (self.laptops.id, self.gaming.id, self.acme.id, 1), (self.phones.id, 0, self.zeta.id, 1)])
+
+        phone.brand_id = self.acme.id
+        db.session.commit()
+        inventory.reserve([(laptop.id, 2)], ttl=60)  # stock 2 -> 0: the laptop leaves the counts
+        self.assertEqual(self.assert_counts_match_rebuild(), [(self.phones.id, 0, self.acme.id, 1)])
+
+        rows = bulk.iter_rows(io.BytesIO(f'name,price,stock,category_id,brand_id\nA,1,5,{self.laptops.id},{self.zeta.id}\n'
+                                         f'B,1,0,{self.laptops.id},\n'.encode()), 'csv')
+        self.assertEqual(bulk.import_products(rows).inserted, 2)
+        db.session.delete(db.session.get(Product, phone.id))
+        db.session.commit()
+        self.assertEqual(self.assert_counts_match_rebuild(), [(self.laptops.id, 0, self.zeta.id, 1)])
+
+    def test_bulk_import_reports_unknown_taxonomy_per_row(self):
+        """A row naming a missing category is reported on its own line; the rest of the chunk imports."""
+        rows = bulk.iter_rows(io.BytesIO(
+            f'name,price,category_id,subcategory_id,brand_id\n'
+            f'A,1,{self.laptops.id},,{self.acme.id}\n'
+            f'B,1,999,,\n'
+            f'C,1,,{self.gaming.id},\n'
+            f'D,1,{self.phones.id},{self.gaming.id},\n'
+            f'E,1,,,999\n'.encode()), 'csv')
+        report = bulk.import_products(rows)
+        self.assertEqual((report.inserted, report.error_count), (2, 3))
+        self.assertEqual(report.to_dict()['errors'], [
+            {'line': 3, 'message': 'Unknown category 999.'},
+            {'line': 5, 'message': 'The subcategory does not belong to the chosen category.'},
+            {'line': 6, 'message': 'Unknown brand 999.'}])
+        self.assertEqual(sorted((p.name, p.category_id) for p in Product.query), [('A', self.laptops.id), ('C', self.laptops.id)])
+
+    def test_counts_exclude_their_own_facet(self):
+        """Choosing a brand narrows the category counts but still lists the other brands."""
+        self.add(category_id=self.laptops.id, brand_id=self.acme.id)
+        self.add(category_id=self.laptops.id, brand_id=self.zeta.id)
+        self.add(category_id=self.phones.id, brand_id=self.zeta.id)
+        counts = facets.facet_counts({'category': [], 'subcategory': [], 'brand': [self.acme.id]})
+        self.assertEqual([(v['name'], v['count']) for v in counts['category']], [('Laptops', 1)])
+        self.assertEqual([(v['name'], v['count'], v['selected']) for v in counts['brand']],
+                         [('Acme', 1, True), ('Zeta', 2, False)])
+        self.assertEqual(counts['subcategory'], [])
+
+
+class TestFacetRoutes(FacetTestCase):
+
+    def login(self):
+        with self.client.session_transaction() as session:
+            session['admin_logged_in'] = True
+
+    def test_filter_api_returns_products_and_facets(self):
+        laptop = self.add(name='Laptop', category_id=self.laptops.id, brand_id=self.acme.id)
+        self.add(name='Phone', category_id=self.phones.id, brand_id=self.acme.id)
+        response = self.client.get(f'/api/products?category={self.laptops.id}&brand={self.acme.id},{self.zeta.id}')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([p['id'] for p in data['products']], [laptop.id])
+        self.assertEqual(data['selection']['brand'], [self.acme.id, self.zeta.id])
+        self.assertEqual({v['name']: v['count'] for v in data['facets']['category']}, {'Laptops': 1, 'Phones': 1})
+        self.assertEqual(self.client.get('/api/products?brand=acme').status_code, 400)
+
+    def test_listing_links_keep_the_filters(self):
+        for i in range(3):
+            self.add(name=f'Laptop {i}', category_id=self.laptops.id)
+        self.add(name='Phone', category_id=self.phones.id)
+        response = self.client.get(f'/products?category={self.laptops.id}&per_page=2')
+        self.assertIn(b'Laptops (3)', response.data)
+        self.assertNotIn(b'>Phone<', response.data)
+        self.assertIn(f'category={self.laptops.id}'.encode(), response.data.split(b'rel="next"')[0].rsplit(b'href=', 1)[1])
+
+    def test_admin_form_checks_the_taxonomy(self):
+        """A subcategory fills in its category; one from another category is rejected."""
+        self.login()
+        form = {'name': 'Gamer', 'price': '10', 'stock': '1', 'category_id': '', 'subcategory_id': str(self.gaming.id)}
+        self.assertEqual(self.client.post('/admin/products', data=form).status_code, 302)
+        self.assertEqual(Product.query.filter_by(name='Gamer').one().category_id, self.laptops.id)
+        form.update(name='Wrong', category_id=str(self.phones.id))
+        self.assertEqual(self.client.post('/admin/products', data=form).status_code, 400)
+
+    def test_deleting_a_category_detaches_its_products(self):
+        self.login()
+        product = self.add(category_id=self.laptops.id, subcategory_id=self.gaming.id)
+        gaming_id = self.gaming.id
+        response = self.client.post(f'/admin/taxonomy/category/{self.laptops.id}/delete')
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual((product.category_id, product.subcategory_id), (None, None))
+        self.assertIsNone(db.session.get(Subcategory, gaming_id))
+        self.assertEqual(self.assert_counts_match_rebuild(), [(0, 0, 0, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+from models import Product, ProductHistory
+from support import AppTestCase
+
+
+class TestProductHistory(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login('boss')
+        product = Product(name='Mug', price=5, stock=3)
+        db.session.add(product)
+        db.session.commit()
+        self.product_id = product.id
+
+    def edit(self, version, **fields):
+        data = {'name': 'Mug', 'price': '5', 'stock': '3', 'version': str(version), **fields}
+        return self.client.post(f'/admin/products/{self.product_id}/edit', data=data)
+
+    def history(self, **params):
+        return self.client.get(f'/admin/products/{self.product_id}/history', query_string=dict(params, format='json')).get_json()
+
+    def test_edits_are_recorded_as_diffs(self):
+        self.assertEqual(self.edit(1, name='Big Mug', price='6.50').status_code, 302)
+        entries = self.history()['history']
+        self.assertEqual([(e['action'], e['version']) for e in entries], [('update', 2), ('create', 1)])
+        self.assertEqual(entries[0]['changes'], {'name': ['Mug', 'Big Mug'], 'price': [5.0, 6.5]})
+        self.assertEqual(entries[0]['changed_by'], 'boss')
+        self.assertIsNone(entries[1]['changed_by'])
+
+    def test_stale_edit_is_rejected(self):
+        self.assertEqual(self.edit(1, name='First').status_code, 302)
+        response = self.edit(1, name='Second')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(b'Someone else saved this product', response.data)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, self.product_id).name, 'First')
+        self.assertEqual(ProductHistory.query.count(), 2)
+
+    def test_concurrent_write_between_read_and_update_is_detected(self):
+        product = db.session.get(Product, self.product_id)
+        db.session.execute(db.update(Product).values(version=Product.version + 1)
+                           .execution_options(synchronize_session=False))  # another writer
+        product.name = 'Mine'
+        with self.assertRaises(StaleDataError):
+            db.session.commit()
+        db.session.rollback()
+        self.assertEqual(ProductHistory.query.count(), 1)
+
+    def test_history_pages_newest_first_and_outlives_the_product(self):
+        for version in range(1, 5):
+            self.edit(version, stock=str(10 + version))
+        page = self.history(limit=2)
+        self.assertEqual([e['version'] for e in page['history']], [5, 4])
+        page = self.history(limit=2, before=page['next_before'])
+        self.assertEqual([e['version'] for e in page['history']], [3, 2])
+        page = self.history(limit=2, before=page['next_before'])
+        self.assertEqual(([e['version'] for e in page['history']], page['next_before']), ([1], None))
+
+        self.client.post(f'/admin/products/{self.product_id}/delete')
+        self.assertEqual(self.history(limit=1)['history'][0]['action'], 'delete')
+        response = self.client.get(f'/admin/products/{self.product_id}/history')
+        self.assertIn(b'This product has been deleted.', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
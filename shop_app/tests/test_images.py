@@ -0,0 +1,162 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from models import Product
+import images
+from support import AppTestCase
+
+
+def png(width, height, mode='RGB'):
+    Image, _ = images._pillow()
+    data = io.BytesIO()
+    Image.new(mode, (width, height)).save(data, 'PNG')
+    return data.getvalue()
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'file.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, True)
+
+    def test_replaces_the_file(self):
+        images._atomic_write(self.path, lambda f: f.write(b'old'))
+        images._atomic_write(self.path, lambda f: f.write(b'new'))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual(os.listdir(self.tmp), ['file.bin'])
+
+    def test_failed_write_keeps_the_old_file_and_no_temporary(self):
+        images._atomic_write(self.path, lambda f: f.write(b'old'))
+
+        def fail(f):
+            f.write(b'partial')
+            raise OSError('disk full')
+
+        with self.assertRaises(OSError):
+            images._atomic_write(self.path, fail)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+        self.assertEqual(os.listdir(self.tmp), ['file.bin'])
+
+
+@unittest.skipIf(images._pillow() is None, 'Pillow is not installed')
+class TestBuildVariants(unittest.TestCase):
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.static, True)
+
+    def test_widths_are_capped_by_the_source(self):
+        data = png(800, 400)
+        key, widths = images.build_variants(data, self.static)
+        self.assertEqual(key, images.content_key(data))
+        self.assertEqual(widths, [320, 640, 800])
+        Image, _ = images._pillow()
+        for width in widths:
+            for ext, fmt, _ in images.VARIANT_FORMATS:
+                with Image.open(os.path.join(self.static, images.variant_filename(key, width, ext))) as variant:
+                    self.assertEqual(variant.format, fmt)
+                    self.assertEqual(variant.size, (width, width // 2))
+
+    def test_small_images_are_not_upscaled(self):
+        _, widths = images.build_variants(png(100, 50), self.static)
+        self.assertEqual(widths, [100])
+
+    def test_same_content_is_written_once(self):
+        data = png(400, 300, 'RGBA')
+        key, _ = images.build_variants(data, self.static)
+        path = os.path.join(self.static, images.variant_filename(key, 320, 'jpg'))
+        written = os.stat(path).st_mtime_ns
+        self.assertEqual(images.build_variants(data, self.static)[0], key)
+        self.assertEqual(os.stat(path).st_mtime_ns, written)
+        self.assertEqual(len(os.listdir(os.path.join(self.static, images.IMAGE_SUBDIR))), 4)
+
+
+class TestImageSources(AppTestCase):
+
+    def app_config(self):
+        self.source_dir = self.make_tmp()
+        return {'IMAGE_SOURCE_DIR': self.source_dir, 'IMAGE_MAX_BYTES': 64 * 1024}
+
+    def write_source(self, name, data):
+        path = os.path.join(self.source_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    @unittest.skipIf(images._pillow() is None, 'Pillow is not installed')
+    def test_paths_inside_the_source_dir(self):
+        data = png(10, 10)
+        path = self.write_source('shop/mug.png', data)
+        self.assertEqual(images.read_source(self.app, path='shop/mug.png'), data)
+        self.assertEqual(images.read_source(self.app, path=path), data)
+        self.assertEqual(images.read_source(self.app, path=f'file://{path}'), data)
+
+    def test_paths_outside_the_source_dir_are_refused(self):
+        outside = os.path.join(self.make_tmp(), 'secret.png')
+        with open(outside, 'wb') as f:
+            f.write(b'secret')
+        os.symlink(outside, os.path.join(self.source_dir, 'link.png'))
+        for path in (outside, f'file://{outside}', '../secret.png', 'link.png', 'missing.png', ''):
+            self.assertIsNone(images.read_source(self.app, path=path), path)
+
+    def test_no_source_dir_reads_nothing(self):
+        self.write_source('mug.png', b'data')
+        self.app.config['IMAGE_SOURCE_DIR'] = None
+        self.assertIsNone(images.read_source(self.app, path='mug.png'))
+
+    def test_oversized_and_invalid_uploads(self):
+        big = FileStorage(io.BytesIO(b'x' * (64 * 1024 + 1)), filename='big.png')
+        with self.assertRaisesRegex(images.ImageError, 'larger than'):
+            images.read_source(self.app, upload=big)
+        if images._pillow() is not None:
+            with self.assertRaisesRegex(images.ImageError, 'not a supported image'):
+                images.read_source(self.app, upload=FileStorage(io.BytesIO(b'text'), filename='a.png'))
+
+    @unittest.skipIf(images._pillow() is None, 'Pillow is not installed')
+    def test_form_with_local_path_or_remote_url(self):
+        data = png(10, 10)
+        self.write_source('mug.png', data)
+        product = Product(name='Mug', price=5, image_url='mug.png', image_key='old', image_widths='320')
+        self.assertEqual(images.prepare_form_image(self.app, product, MultiDict(), {'image_url': 'mug.png'}), data)
+        self.assertEqual(product.image_url, '')
+        self.assertEqual(product.image_key, 'old')  # kept until the worker has built the new variants
+
+        product.image_url = 'http://example.com/a.jpg'
+        self.assertIsNone(images.prepare_form_image(self.app, product, MultiDict(), {'image_url': product.image_url},
+                                                    previous_url='http://example.com/a.jpg'))
+        self.assertEqual(product.image_key, 'old')
+        self.assertIsNone(images.prepare_form_image(self.app, product, MultiDict(), {'image_url': product.image_url},
+                                                    previous_url=''))
+        self.assertIsNone(product.image_key)
+        self.assertIsNone(product.image_widths)
+
+    def test_variants_are_cached_for_a_year(self):
+        self.app.static_folder = self.make_tmp()
+        os.makedirs(os.path.join(self.app.static_folder, images.IMAGE_SUBDIR))
+        with open(os.path.join(self.app.static_folder, images.variant_filename('k', 320, 'jpg')), 'wb') as f:
+            f.write(b'jpg')
+        response = self.client.get(f'/static/{images.variant_filename("k", 320, "jpg")}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, images.FAR_FUTURE)
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
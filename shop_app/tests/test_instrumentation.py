@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from extensions import db
+from instrumentation import Histogram, Metrics
+from support import TEST_CONFIG, AppTestCase
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(0.1, 2), (1.0, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 3.65)
+
+
+class TestPrometheusOutput(unittest.TestCase):
+
+    def test_request_series(self):
+        metrics = Metrics()
+        metrics.observe_request('shop.list_products', 'GET', 200, 0.02, 3, 0.004, over_threshold=False)
+        metrics.observe_request('shop.list_products', 'GET', 200, 0.2, 40, 0.1, over_threshold=True)
+        text = metrics.render_prometheus(extra_gauges=[('shop_page_cache_hits', 'Hits.', 7)])
+        self.assertIn('shop_request_duration_seconds_bucket{endpoint="shop.list_products",method="GET",le="0.025"} 1', text)
+        self.assertIn('shop_request_duration_seconds_count{endpoint="shop.list_products",method="GET"} 2', text)
+        self.assertIn('shop_responses_total{endpoint="shop.list_products",status="200"} 2', text)
+        self.assertIn('shop_n_plus_one_requests_total{endpoint="shop.list_products"} 1', text)
+        self.assertIn('shop_page_cache_hits 7', text)
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.observe_template('odd"name', 0.001)
+        self.assertIn('template="odd\\"name"', metrics.render_prometheus())
+
+
+class TestMetricsEndpoint(AppTestCase):
+    config = {'INSTRUMENTATION_ENABLED': True}
+    admin = True
+
+    def test_series_belong_to_their_app(self):
+        self.assertIn('Server-Timing', self.client.get('/products').headers)
+        text = self.client.get('/admin/metrics').get_data(as_text=True)
+        self.assertIn('shop_responses_total{endpoint="shop.list_products",status="200"} 1', text)
+
+        other = create_app(dict(TEST_CONFIG, INSTRUMENTATION_ENABLED=True))
+        self.assertIsNot(other.extensions['metrics'], self.app.extensions['metrics'])
+        self.assertEqual(other.extensions['metrics'].responses, {})
+
+    def test_failed_statements_are_timed_and_leave_nothing_behind(self):
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            timing = g._timing
+            with db.engine.connect() as connection:
+                for _ in range(3):
+                    with self.assertRaises(OperationalError):
+                        connection.execute(text('SELECT * FROM no_such_table'))
+                    connection.rollback()
+                connection.execute(text('SELECT 1'))
+                self.assertNotIn('_query_start', connection.info)
+        self.assertEqual(timing['queries'], 4)
+        self.assertGreater(timing['sql'], 0)
+
+    def test_disabled_app_has_no_metrics(self):
+        plain = create_app(TEST_CONFIG)
+        with plain.app_context():
+            db.create_all()
+        client = plain.test_client()
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        self.assertEqual(client.get('/admin/metrics').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
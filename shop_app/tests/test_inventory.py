@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product, StockReservation
+import inventory
+from support import AppTestCase
+
+
+class InventoryTestCase(AppTestCase):
+
+    def stock(self, product_id):
+        db.session.expire_all()
+        return db.session.get(Product, product_id).stock
+
+
+class TestReserve(InventoryTestCase):
+
+    def test_reserve_holds_stock_until_the_ttl(self):
+        product_id = self.add_product(stock=5)
+        before = datetime.utcnow()
+        token, expires_at = inventory.reserve({product_id: 2}, ttl=60)
+        self.assertEqual(self.stock(product_id), 3)
+        self.assertAlmostEqual((expires_at - before).total_seconds(), 60, delta=5)
+        line = StockReservation.query.filter_by(token=token).one()
+        self.assertEqual((line.quantity, line.status, line.expires_at), (2, 'held', expires_at))
+
+    def test_lines_are_merged_and_all_or_nothing(self):
+        first, second = self.add_product(stock=5), self.add_product(stock=1)
+        inventory.reserve([(first, 1), (first, 2)])
+        self.assertEqual(self.stock(first), 2)
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.reserve([(first, 1), (second, 2)])
+        self.assertEqual((raised.exception.product_id, raised.exception.requested), (second, 2))
+        self.assertEqual((self.stock(first), self.stock(second)), (2, 1))
+        for lines in ([], [(first, 0)], [(first, -1)]):
+            with self.assertRaises(ValueError):
+                inventory.reserve(lines)
+
+    def test_unknown_product_is_not_reported_as_sold_out(self):
+        product_id = self.add_product(stock=5)
+        with self.assertRaises(inventory.ProductNotFound):
+            inventory.reserve([(product_id, 1), (999, 1)])
+        self.assertEqual(self.stock(product_id), 5)
+        response = self.client.post('/reservations', json={'lines': [{'product_id': 999, 'quantity': 1}]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['product_id'], 999)
+        response = self.client.post('/reservations', json={'lines': [{'product_id': product_id, 'quantity': 9}]})
+        self.assertEqual(response.status_code, 409)
+
+    def test_out_of_range_integers_are_a_400(self):
+        product_id = self.add_product(stock=5)
+        for line in ({'product_id': 2 ** 64, 'quantity': 1}, {'product_id': 0, 'quantity': 1},
+                     {'product_id': product_id, 'quantity': 2 ** 64}, {'product_id': str(10 ** 30), 'quantity': '1'}):
+            response = self.client.post('/reservations', json={'lines': [line]})
+            self.assertEqual(response.status_code, 400, line)
+        with self.assertRaises(ValueError):
+            inventory.reserve([(product_id, 2 ** 62), (product_id, 2 ** 62)])  # in range alone, not merged
+        self.assertEqual(self.stock(product_id), 5)
+
+
+class TestRelease(InventoryTestCase):
+
+    def test_release_returns_stock_once(self):
+        product_id = self.add_product(stock=3)
+        token, _ = inventory.reserve({product_id: 2})
+        inventory.release(token)
+        self.assertEqual(self.stock(product_id), 3)
+        with self.assertRaises(inventory.ReservationNotFound):
+            inventory.release(token)
+        self.assertEqual(self.stock(product_id), 3)
+        self.assertEqual(self.client.post(f'/reservations/{token}/release').status_code, 404)
+
+    def test_confirmed_reservations_cannot_be_released(self):
+        product_id = self.add_product(stock=3)
+        token, _ = inventory.reserve({product_id: 1})
+        self.assertEqual(inventory.confirm(token), [(product_id, 1)])
+        with self.assertRaises(inventory.ReservationNotFound):
+            inventory.release(token)
+        self.assertEqual(self.stock(product_id), 2)
+
+    def test_sweep_returns_only_expired_stock(self):
+        product_id = self.add_product(stock=10)
+        expired = [inventory.reserve({product_id: 1}, ttl=1)[0] for _ in range(3)]
+        live, _ = inventory.reserve({product_id: 2}, ttl=600)
+        later = datetime.utcnow() + timedelta(seconds=5)
+        self.assertEqual(inventory.sweep_expired(now=later, batch_size=2), 3)
+        self.assertEqual(self.stock(product_id), 8)
+        self.assertEqual(inventory.sweep_expired(now=later), 0)
+        with self.assertRaises(inventory.ReservationNotFound):
+            inventory.confirm(expired[0])
+        with self.assertRaises(inventory.ReservationNotFound):
+            inventory.release(expired[1])
+        self.assertEqual(inventory.confirm(live), [(product_id, 2)])
+        self.assertEqual(self.stock(product_id), 8)
+
+
+class TestContention(InventoryTestCase):
+    """Threads on their own connections to a file database, as web workers would be."""
+
+    def app_config(self):
+        return {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.make_tmp()}/shop.db'}
+
+    def test_concurrent_orders_never_oversell(self):
+        product_id = self.add_product(stock=7)
+        start = threading.Barrier(20)
+
+        def order():
+            with self.app.app_context():
+                start.wait()
+                try:
+                    inventory.reserve({product_id: 1})
+                    return True
+                except inventory.InsufficientStock:
+                    return False
+                finally:
+                    db.session.remove()
+
+        with ThreadPoolExecutor(20) as pool:
+            results = list(pool.map(lambda _: order(), range(20)))
+        self.assertEqual(results.count(True), 7)
+        self.assertEqual(self.stock(product_id), 0)
+        self.assertEqual(StockReservation.query.count(), 7)
+
+    def test_concurrent_release_and_sweep_restock_once(self):
+        product_id = self.add_product(stock=10)
+        tokens = [inventory.reserve({product_id: 1}, ttl=1)[0] for _ in range(10)]
+        later = datetime.utcnow() + timedelta(seconds=5)
+        start = threading.Barrier(11)
+
+        def release(token):
+            with self.app.app_context():
+                start.wait()
+                try:
+                    inventory.release(token)
+                except inventory.ReservationNotFound:
+                    pass
+                finally:
+                    db.session.remove()
+
+        def sweep():
+            with self.app.app_context():
+                start.wait()
+                try:
+                    return inventory.sweep_expired(now=later)
+                finally:
+                    db.session.remove()
+
+        with ThreadPoolExecutor(11) as pool:
+            swept = pool.submit(sweep)
+            list(pool.map(release, tokens))
+        self.assertLessEqual(swept.result(), 10)
+        self.assertEqual(self.stock(product_id), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
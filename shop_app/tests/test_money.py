@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product
+from money import as_money, cents, json_default, to_decimal
+from support import AppTestCase
+
+
+class TestToDecimal(unittest.TestCase):
+
+    def test_amounts_are_quantized_half_up(self):
+        self.assertEqual(to_decimal('19.9'), Decimal('19.90'))
+        self.assertEqual(to_decimal(19.9), Decimal('19.90'))  # not 19.899999...
+        self.assertEqual(to_decimal('0.005'), Decimal('0.01'))
+        self.assertEqual(to_decimal(3), Decimal('3.00'))
+
+    def test_garbage_is_a_value_error(self):
+        for value in ('abc', None, 'NaN', 'Infinity'):
+            with self.assertRaises(ValueError):
+                to_decimal(value)
+
+
+class TestMoneyColumn(AppTestCase):
+
+
+    def test_stored_as_cents_and_summed_exactly_in_sql(self):
+        """0.10 added ten times is exactly 1.00, and range filters bind cents."""
+        db.session.add_all([Product(name=f'P{i}', price='0.10', stock=3) for i in range(10)])
+        db.session.commit()
+        self.assertEqual(db.session.scalar(db.text('SELECT price_cents FROM product LIMIT 1')), 10)
+        self.assertEqual(db.session.scalar(db.select(db.func.sum(Product.price))), Decimal('1.00'))
+        stock_value = db.session.scalar(db.select(as_money(db.func.sum(cents(Product.price) * Product.stock))))
+        self.assertEqual(stock_value, Decimal('3.00'))
+        self.assertEqual(Product.query.filter(Product.price >= Decimal('0.1')).count(), 10)
+        self.assertEqual(Product.query.filter(Product.price > 0.1).count(), 0)
+
+    def test_json_amounts_are_numbers(self):
+        self.assertEqual(self.app.json.dumps({'price': Decimal('19.90')}), '{"price": 19.9}')
+        self.assertEqual(json.dumps({'price': Decimal('0.10')}, default=json_default), '{"price": 0.1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
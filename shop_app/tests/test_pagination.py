@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_keyset
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'item'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50))
+
+
+class TestCursorEncoding(unittest.TestCase):
+
+    def test_round_trip(self):
+        """A cursor decodes back to the values it was built from, accents included."""
+        token = encode_cursor(('Café molido', 42))
+        self.assertEqual(decode_cursor(token, 2), ['Café molido', 42])
+
+    def test_garbage_is_rejected(self):
+        """Tampered or wrongly-sized cursors raise InvalidCursor instead of a 500."""
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor!!', 2)
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(encode_cursor(('only-one',)), 2)
+
+
+class TestKeysetPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        # Duplicate names force the id tie-breaker to matter
+        self.session.add_all([Item(id=i, name=f'item-{i // 2:02d}') for i in range(1, 12)])
+        self.session.commit()
+        self.columns = (Item.name, Item.id)
+        self.key = lambda item: (item.name, item.id)
+
+    def tearDown(self):
+        self.session.close()
+
+    def page(self, **kwargs):
+        return paginate_keyset(self.session.query(Item), self.columns, self.key, per_page=4, **kwargs)
+
+    def test_walk_forward_and_back(self):
+        """Following next cursors visits every row once; prev returns the same pages."""
+        seen, pages = [], []
+        page = self.page()
+        self.assertFalse(page.has_prev)
+        while True:
+            pages.append([i.id for i in page.items])
+            seen.extend(pages[-1])
+            if not page.has_next:
+                break
+            page = self.page(after=decode_cursor(page.next_cursor, 2))
+        expected = [i.id for i in self.session.query(Item).order_by(Item.name, Item.id)]
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        back = self.page(before=decode_cursor(page.prev_cursor, 2))
+        self.assertEqual([i.id for i in back.items], pages[-2])
+        self.assertTrue(back.has_next)
+
+    def test_empty_table(self):
+        self.session.query(Item).delete()
+        page = self.page()
+        self.assertEqual(page.items, [])
+        self.assertFalse(page.has_next)
+        self.assertFalse(page.has_prev)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+from models import Product
+import fx
+import pricing
+from support import AppTestCase
+
+
+class FailingProvider:
+    def __init__(self, app):
+        pass
+
+    def fetch(self):
+        raise fx.FxError('offline')
+
+
+class UnreachableProvider:
+    def __init__(self, app):
+        pass
+
+    def fetch(self):
+        raise AssertionError('the provider was asked')
+
+
+class SlowProvider:
+    started = threading.Event()
+    answer = threading.Event()
+
+    def __init__(self, app):
+        pass
+
+    def fetch(self):
+        self.started.set()
+        self.answer.wait(5)
+        return {'USD': 3.9}
+
+
+class TestReprice(AppTestCase):
+
+    def add(self, **fields):
+        product = Product(**{'name': 'P', 'price': 1.0, 'stock': 1, **fields})
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+    def test_prices_follow_cost_rate_igv_and_margin(self):
+        """cost × rate × 1.18 × (1 + margin), rounded up to whole soles or to the cent."""
+        usd = self.add(cost_price=100.0, cost_currency='USD', margin=45.0)
+        pen = self.add(cost_price=100.0, cost_currency='PEN')  # default margin
+        self.assertEqual(pricing.reprice({'USD': 3.75}, default_margin=30), 2)
+        self.assertEqual(db.session.get(Product, usd).price, 642.0)  # 641.625 rounded up
+        self.assertEqual(db.session.get(Product, pen).price, 154.0)  # 153.4 rounded up
+        pricing.reprice({'USD': 3.75}, default_margin=30, rounding='cent')
+        self.assertEqual(db.session.get(Product, usd).price, Decimal('641.63'))
+
+    def test_unmanaged_products_keep_their_price(self):
+        """No cost price, or a currency without a rate: the manual price stays; unchanged rows are not rewritten."""
+        manual = self.add(price=9.99)
+        euro = self.add(price=5.0, cost_price=10.0, cost_currency='EUR')
+        same = self.add(price=154.0, cost_price=100.0, cost_currency='PEN')
+        self.assertEqual(pricing.reprice({'USD': 3.75}, default_margin=30), 0)
+        self.assertEqual([db.session.get(Product, pid).price for pid in (manual, euro, same)], [Decimal('9.99'), Decimal('5.00'), Decimal('154.00')])
+
+
+class TestRates(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_file = os.path.join(tempfile.mkdtemp(), 'fx.json')
+
+    def make_app(self, provider, **config):
+        return create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'FX_PROVIDER': provider,
+                           'FX_CACHE_FILE': self.cache_file, **config})
+
+    def test_provider_failure_falls_back_to_the_cached_rates(self):
+        """A provider answer is saved; when the provider later fails, that saved answer is used."""
+        rates = fx.get_rates(self.make_app('static', FX_STATIC_RATES={'USD': 3.71}), refresh=True)
+        self.assertEqual((rates.rates['USD'], rates.source), (3.71, 'static'))
+        rates = fx.get_rates(self.make_app(f'{__name__}:FailingProvider'), refresh=True)
+        self.assertEqual((rates.rates['USD'], rates.source), (3.71, 'cache'))
+
+    def test_a_slow_provider_does_not_block_readers(self):
+        fx._write_cache(self.cache_file, fx.Rates({'USD': 3.7}, 'static', None))
+        app = self.make_app(f'{__name__}:SlowProvider')
+        fetching = threading.Thread(target=fx.get_rates, args=(app,), kwargs={'refresh': True})
+        fetching.start()
+        try:
+            self.assertTrue(SlowProvider.started.wait(5))
+            self.assertEqual(fx.cached_rates(app).rates['USD'], 3.7)
+        finally:
+            SlowProvider.answer.set()
+            fetching.join()
+        self.assertEqual(fx.cached_rates(app).rates['USD'], 3.9)
+
+    def test_fallback_rates_without_cache(self):
+        rates = fx.get_rates(self.make_app(f'{__name__}:FailingProvider', FX_FALLBACK_RATES={'USD': 3.8}), refresh=True)
+        self.assertEqual((rates.rates, rates.source), ({'PEN': 1.0, 'USD': 3.8}, 'fallback'))
+
+
+class TestCachedRates(AppTestCase):
+    admin = True
+
+    def app_config(self):
+        self.cache_file = os.path.join(self.make_tmp(), 'fx.json')
+        return {'FX_PROVIDER': f'{__name__}:UnreachableProvider', 'FX_CACHE_FILE': self.cache_file}
+
+    def test_pricing_page_and_cached_cli_never_ask_the_provider(self):
+        self.assertIn(b'No exchange rates fetched yet', self.client.get('/admin/pricing').data)
+        result = self.app.test_cli_runner().invoke(args=['reprice', '--cached-rates'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('No cached exchange rates', result.output)
+
+        fx._write_cache(self.cache_file, fx.Rates({'USD': 3.6}, 'static', '2026-01-01T00:00:00+00:00'))
+        self.assertIn(b'<td>3.6</td>', self.client.get('/admin/pricing').data)
+        product_id = self.add_product(cost_price=10, cost_currency='USD')
+        result = self.app.test_cli_runner().invoke(args=['reprice', '--cached-rates'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Rates (cache): PEN=1.0, USD=3.6', result.output)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, product_id).price, 62)  # 10 × 3.6 × 1.18 × 1.45 = 61.6
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product
+from support import AppTestCase
+
+
+class TestAdminProductTable(AppTestCase):
+    config = {'ADMIN_PAGE_SIZE': 2}
+    admin = True
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([
+            Product(name='Camera', price=250, stock=1, description='Digital camera'),
+            Product(name='Mouse', price=15, stock=9),
+            Product(name='Keyboard', price=40, stock=0, description='Mechanical'),
+            Product(name='Lens', price=250, stock=3, description='For any camera'),
+            Product(name='Cable', price=5, stock=50),
+        ])
+        db.session.commit()
+
+    def data(self, **params):
+        response = self.client.get('/admin/products/data', query_string=params)
+        return response.status_code, response.get_json()
+
+    def test_pages_follow_the_sort_with_keyset_cursors(self):
+        status, page = self.data(sort='-price', limit=2)
+        self.assertEqual(status, 200)
+        self.assertEqual([p['name'] for p in page['products']], ['Lens', 'Camera'])  # ties broken by id, descending
+        self.assertEqual(page['total'], 5)
+        names = [p['name'] for p in page['products']]
+        while page['next_cursor']:
+            _, page = self.data(sort='-price', limit=2, after=page['next_cursor'])
+            self.assertIsNone(page['total'])
+            names += [p['name'] for p in page['products']]
+        self.assertEqual(names, ['Lens', 'Camera', 'Keyboard', 'Mouse', 'Cable'])
+
+        _, page = self.data(sort='stock', offset=3, limit=5, fields='name')
+        self.assertEqual(page['products'], [{'id': 2, 'name': 'Mouse'}, {'id': 5, 'name': 'Cable'}])
+
+    def test_search_and_filters(self):
+        _, page = self.data(q='camera', sort='name')
+        self.assertEqual([p['name'] for p in page['products']], ['Camera', 'Lens'])
+        _, page = self.data(q='camera', in_stock='1', max_price='100')
+        self.assertEqual(page['total'], 0)
+        self.assertEqual(self.data(sort='colour')[0], 400)
+        self.assertEqual(self.data(after='garbage')[0], 400)
+
+    def test_ndjson_streams_every_matching_row(self):
+        self.app.config['API_BATCH_SIZE'] = 2
+        response = self.client.get('/admin/products/data?format=ndjson&sort=-stock&fields=stock')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual([row['stock'] for row in rows], [50, 9, 3, 1, 0])
+        response = self.client.get('/admin/products/data?format=ndjson&sort=-stock&offset=1&limit=3')
+        self.assertEqual([json.loads(line)['name'] for line in response.data.decode().splitlines()],
+                         ['Mouse', 'Lens', 'Camera'])
+
+    def test_admin_page_renders_only_the_first_page(self):
+        response = self.client.get('/admin/products?sort=name')
+        self.assertIn(b'Cable', response.data)
+        self.assertIn(b'Camera', response.data)
+        self.assertNotIn(b'<td>Mouse</td>', response.data)
+        self.assertIn(b'rel="next"', response.data)
+        self.assertIn(b'admin_products.js', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Order, Product, ProductSalesDaily, SalesDaily
+import orders
+import reporting
+from support import AppTestCase
+
+
+class TestSalesReporting(AppTestCase):
+    admin = True
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([Product(name='Mug', price=Decimal('4.50'), stock=10),
+                            Product(name='Tea', price=Decimal('2.25'), stock=10)])
+        db.session.commit()
+
+    def checkout(self, *lines, email='a@example.com'):
+        response = self.client.post('/reservations', json={
+            'lines': [{'product_id': pid, 'quantity': qty} for pid, qty in lines]})
+        token = response.get_json()['token']
+        response = self.client.post(f'/reservations/{token}/confirm', json={'email': email})
+        self.assertEqual(response.status_code, 200)
+        return db.session.get(Order, response.get_json()['order_id'])
+
+    def rollups(self):
+        return (sorted((r.day, r.status, r.orders, r.units, r.revenue) for r in SalesDaily.query),
+                sorted((r.day, r.product_id, r.status, r.units, r.revenue) for r in ProductSalesDaily.query))
+
+    def test_orders_update_the_rollups_as_they_change(self):
+        first = self.checkout((1, 2), (2, 1))
+        self.assertEqual(first.total, Decimal('11.25'))
+        self.assertEqual([(line.product_name, line.quantity) for line in first.lines], [('Mug', 2), ('Tea', 1)])
+        second = self.checkout((1, 1))
+        self.assertEqual(self.client.post(f'/reservations/{first.token}/confirm').status_code, 404)
+
+        # Pending orders are not sales yet
+        report = reporting.dashboard(days=7)
+        self.assertEqual((report['orders'], report['revenue']), (0, Decimal('0.00')))
+        self.assertEqual(report['by_status']['pending']['orders'], 2)
+        self.assertEqual(len(report['daily']), 7)
+
+        orders.set_status(first, 'paid')
+        orders.set_status(second, 'paid')
+        orders.set_status(second, 'refunded')
+        report = reporting.dashboard(days=7)
+        self.assertEqual((report['orders'], report['units'], report['revenue']), (1, 3, Decimal('11.25')))
+        self.assertEqual(report['daily'][-1]['revenue'], Decimal('11.25'))
+        self.assertEqual(set(report['by_status']), {'paid', 'refunded'})
+        self.assertEqual([(p['name'], p['units'], p['revenue']) for p in report['top_products']],
+                         [('Mug', 2, Decimal('9.00')), ('Tea', 1, Decimal('2.25'))])
+
+        # The incremental rollups match a full recount
+        incremental = self.rollups()
+        reporting.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_stale_status_change_is_rejected(self):
+        order = self.checkout((1, 1))
+        db.session.execute(db.update(Order).values(status='cancelled').execution_options(synchronize_session=False))  # another admin, behind our back
+        with self.assertRaises(orders.OrderConflict):
+            orders.set_status(order, 'paid')
+        with self.assertRaises(ValueError):
+            orders.set_status(order, 'lost')
+
+    def test_reports_and_orders_pages(self):
+        order = self.checkout((2, 4))
+        db.session.execute(db.update(Order).values(created_at=datetime.utcnow() - timedelta(days=40)))
+        db.session.commit()
+        reporting.rebuild()
+        response = self.client.post(f'/admin/orders/{order.id}/status', data={'status': 'delivered'})
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(self.client.get('/admin/reports?format=json').get_json()['orders'], 0)
+        data = self.client.get('/admin/reports?days=90', headers={'Accept': 'application/json'}).get_json()
+        self.assertEqual((data['orders'], data['revenue']), (1, 9.0))
+        self.assertIn(b'Tea', self.client.get('/admin/reports?days=90').data)
+        self.assertIn(b'4 &times; Tea', self.client.get('/admin/orders').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+from models import Product
+import inventory
+from repository import ProductRepository, ProductSnapshot, mark_changed, product_repository
+from support import TEST_CONFIG, AppTestCase
+
+
+class TestProductRepository(AppTestCase):
+
+    def app_config(self):
+        return {'PRODUCT_CACHE_DB': os.path.join(self.make_tmp(), 'products.db'), 'PRODUCT_CACHE_SYNC_INTERVAL': 0}
+
+    def setUp(self):
+        super().setUp()
+        product = Product(name='Lamp', price=Decimal('19.90'), stock=4)
+        db.session.add(product)
+        db.session.commit()
+        self.product_id = product.id
+
+    def test_snapshots_are_cached_and_read_only(self):
+        hits = product_repository.stats()['hits']
+        first = product_repository.get(self.product_id)
+        self.assertIs(product_repository.get(self.product_id), first)
+        self.assertEqual(product_repository.stats()['hits'], hits + 1)
+        self.assertEqual((first.name, first.price, first.version), ('Lamp', Decimal('19.90'), 1))
+        with self.assertRaises(AttributeError):
+            first.name = 'Other'
+        self.assertEqual(ProductSnapshot.from_json(first.to_json()).updated_at, first.updated_at)
+        self.assertIsNone(product_repository.get(999))
+        self.assertEqual(self.client.get('/products/999').status_code, 404)
+        self.assertIsNone(product_repository.get(2 ** 64))
+        self.assertEqual(self.client.get(f'/products/{2 ** 64}').status_code, 404)
+        self.assertEqual(self.client.post(f'/cart/items/{2 ** 64}', data={'quantity': '1'}).status_code, 404)
+
+    def test_commits_invalidate_rollbacks_do_not(self):
+        self.assertIn(b'Lamp', self.client.get(f'/products/{self.product_id}').data)
+        db.session.get(Product, self.product_id).name = 'Desk lamp'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(product_repository.get(self.product_id).name, 'Lamp')
+
+        db.session.get(Product, self.product_id).name = 'Desk lamp'
+        db.session.commit()
+        self.assertEqual(product_repository.get(self.product_id).version, 2)
+        self.assertIn(b'Desk lamp', self.client.get(f'/products/{self.product_id}').data)
+
+        # Set-based writes are picked up through mark_changed
+        inventory.reserve({self.product_id: 3})
+        self.assertEqual(product_repository.get(self.product_id).stock, 1)
+        self.assertIn(b'1 available', self.client.get(f'/products/{self.product_id}').data)
+
+    def test_other_workers_see_changes_through_the_shared_store(self):
+        worker = ProductRepository(self.app)  # another process's repository on the same store
+        product_repository.get(self.product_id)  # fills the shared store
+        self.assertEqual(worker.get(self.product_id).name, 'Lamp')
+        self.assertEqual(worker.stats()['misses'], 1)
+
+        product = db.session.get(Product, self.product_id)
+        product.name = 'Floor lamp'
+        db.session.commit()
+        self.assertEqual(worker.get(self.product_id).name, 'Floor lamp')
+
+        # A read that raced an invalidation is not written back to the shared store
+        seen = worker.store.last_seq()
+        stale = product_repository.get(self.product_id)
+        mark_changed([self.product_id])
+        db.session.commit()
+        worker.store.set(stale, seen)
+        self.assertIsNone(worker.store.get(self.product_id, max_age=60))
+
+    def test_each_app_has_its_own_repository(self):
+        other = create_app(dict(TEST_CONFIG, PRODUCT_CACHE_MAX_ENTRIES=5))
+        repository = self.app.extensions['product_repository']
+        self.assertIsNot(other.extensions['product_repository'], repository)
+        self.assertEqual(other.extensions['product_repository'].max_entries, 5)
+        self.assertIsNone(other.extensions['product_repository'].store)
+        self.assertIsNotNone(repository.store)
+        self.assertEqual(product_repository.get(self.product_id).name, 'Lamp')
+        self.assertEqual(other.extensions['product_repository'].stats()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
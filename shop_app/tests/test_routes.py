@@ -1,206 +1,254 @@
+import os
+import subprocess
+import sys
 import unittest
-import json
-# To run these tests, you would typically need to:
-# 1. Ensure FLASK_APP is set correctly (e.g., to your main app file like app.py or shop_app.app)
-# 2. Have your Flask app (named 'app' in this example) and 'db' (SQLAlchemy instance) importable.
-# from shop_app.app import app, db  # Assuming your Flask app instance is named 'app'
-# from shop_app.models import Product
-
-# For now, as we can't run them, these are illustrative.
-# If running, you'd set up an app context and a test client.
-# Example:
-# class BaseTestCase(unittest.TestCase):
-#     def setUp(self):
-#         app.config['TESTING'] = True
-#         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:' # Use in-memory DB for tests
-#         app.config['WTF_CSRF_ENABLED'] = False # Disable CSRF for forms in tests
-#         self.app = app.test_client()
-#         with app.app_context():
-#             db.create_all()
-#
-#     def tearDown(self):
-#         with app.app_context():
-#             db.session.remove()
-#             db.drop_all()
-
-class TestAdminRoutes(unittest.TestCase): # Replace unittest.TestCase with BaseTestCase if using above setup
-
-    # Note: In a real testing environment, self.app would be app.test_client()
-    # and db operations would interact with a test database.
+from decimal import Decimal
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+from models import Product
+from search import search_products
+from support import TEST_CONFIG, AppTestCase
+
+
+class TestAdminRoutes(AppTestCase):
+    admin = True
+
+    def test_login_required(self):
+        """Anonymous requests to the admin are redirected to the login page."""
+        with self.client.session_transaction() as session:
+            session.clear()
+        response = self.client.get('/admin/products')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/admin/login', response.headers['Location'])
 
     def test_create_product_success(self):
-        """
-        Test creating a new product successfully via the admin route.
-        Expected outcome: 200 OK (or redirect 302), product in database.
-        Preconditions: Admin authentication (if any), valid product data.
-        """
-        # Example:
-        # with app.app_context(): # Needed for db operations
-        #     product_data = {
-        #         'name': 'Test Coffee Mug',
-        #         'description': 'A nice mug for testing.',
-        #         'price': '12.99',
-        #         'stock': '50',
-        #         'image_url': 'http://example.com/mug.jpg'
-        #     }
-        #     response = self.app.post('/admin/products', data=product_data, follow_redirects=True)
-        #     self.assertEqual(response.status_code, 200) # Assuming redirect to product list
-        #     self.assertIn(b'Product "Test Coffee Mug" created successfully!', response.data)
-        #
-        #     # Verify in database
-        #     product = Product.query.filter_by(name='Test Coffee Mug').first()
-        #     self.assertIsNotNone(product)
-        #     self.assertEqual(product.price, 12.99)
-        pass
+        """Creating a product redirects to the admin list and stores it."""
+        product_data = {
+            'name': 'Test Coffee Mug',
+            'description': 'A nice mug for testing.',
+            'price': '12.99',
+            'stock': '50',
+            'image_url': 'http://example.com/mug.jpg',
+        }
+        response = self.client.post('/admin/products', data=product_data, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Product &#34;Test Coffee Mug&#34; created successfully!', response.data)
+
+        product = Product.query.filter_by(name='Test Coffee Mug').first()
+        self.assertIsNotNone(product)
+        self.assertEqual(product.price, Decimal('12.99'))
+        self.assertEqual(product.stock, 50)
 
     def test_create_product_missing_data(self):
-        """
-        Test creating a product with missing required data (e.g., no name).
-        Expected outcome: 400 Bad Request, error message.
-        Preconditions: Admin authentication (if any).
-        """
-        # Example:
-        # product_data = {'description': 'Only description provided', 'price': '9.99'}
-        # response = self.app.post('/admin/products', data=product_data, follow_redirects=True)
-        # self.assertEqual(response.status_code, 400) # Or 200 if it re-renders form with error
-        # self.assertIn(b'Name and Price are required fields.', response.data)
-        pass
+        """A product without a name is rejected with 400 and the form is shown again."""
+        response = self.client.post('/admin/products', data={'description': 'Only description provided', 'price': '9.99'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Name and Price are required fields.', response.data)
+        self.assertEqual(Product.query.count(), 0)
 
     def test_get_admin_products_list(self):
-        """
-        Test fetching the list of products from the admin panel.
-        Expected outcome: 200 OK, displays product list.
-        Preconditions: Admin authentication (if any), some products may exist.
-        """
-        # Example:
-        # response = self.app.get('/admin/products')
-        # self.assertEqual(response.status_code, 200)
-        # self.assertIn(b'Manage Products', response.data) # Check for page title or key text
-        pass
+        """The admin product list renders every product."""
+        self.add_product(name='Listed Product')
+        response = self.client.get('/admin/products')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Manage Products', response.data)
+        self.assertIn(b'Listed Product', response.data)
 
     def test_update_product_success(self):
-        """
-        Test updating an existing product successfully.
-        Expected outcome: 200 OK (or redirect 302), product details updated in DB.
-        Preconditions: Product exists, admin authentication, valid update data.
-        """
-        # Example:
-        # with app.app_context():
-        #     # First, create a product to update
-        #     p = Product(name='Original Name', price=10.0, stock=10)
-        #     db.session.add(p)
-        #     db.session.commit()
-        #     product_id = p.id
-        #
-        #     update_data = {'name': 'Updated Name', 'price': '15.50', 'stock': '5'}
-        #     response = self.app.post(f'/admin/products/{product_id}/edit', data=update_data, follow_redirects=True)
-        #     self.assertEqual(response.status_code, 200)
-        #     self.assertIn(b'Product "Updated Name" updated successfully!', response.data)
-        #
-        #     updated_product = Product.query.get(product_id)
-        #     self.assertEqual(updated_product.name, 'Updated Name')
-        #     self.assertEqual(updated_product.price, 15.50)
-        pass
+        """Editing a product saves the new values."""
+        product_id = self.add_product(name='Original Name', stock=10)
+        update_data = {'name': 'Updated Name', 'price': '15.50', 'stock': '5'}
+        response = self.client.post(f'/admin/products/{product_id}/edit', data=update_data, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Product &#34;Updated Name&#34; updated successfully!', response.data)
+
+        updated_product = db.session.get(Product, product_id)
+        self.assertEqual(updated_product.name, 'Updated Name')
+        self.assertEqual(updated_product.price, Decimal('15.50'))
+        self.assertEqual(updated_product.stock, 5)
+
+    def test_new_remote_image_replaces_the_variants(self):
+        """A different remote image URL drops the variants built from the old image; resaving the same one keeps them."""
+        product_id = self.add_product(image_url='http://example.com/old.jpg', image_key='abc', image_widths='320,640')
+        form = {'name': 'Mug', 'price': '5', 'stock': '1', 'image_url': 'http://example.com/old.jpg'}
+        self.assertEqual(self.client.post(f'/admin/products/{product_id}/edit', data=form).status_code, 302)
+        self.assertEqual(db.session.get(Product, product_id).image_key, 'abc')
+
+        form['image_url'] = 'https://cdn.example.com/new.jpg'
+        self.assertEqual(self.client.post(f'/admin/products/{product_id}/edit', data=form).status_code, 302)
+        db.session.expire_all()
+        product = db.session.get(Product, product_id)
+        self.assertEqual(product.image_url, 'https://cdn.example.com/new.jpg')
+        self.assertIsNone(product.image_key)
+        self.assertIsNone(product.image_widths)
+        self.assertIn(b'src="https://cdn.example.com/new.jpg"', self.client.get(f'/products/{product_id}').data)
 
     def test_update_nonexistent_product(self):
-        """
-        Test attempting to update a non-existent product.
-        Expected outcome: 404 Not Found.
-        Preconditions: Admin authentication.
-        """
-        # Example:
-        # update_data = {'name': 'Trying to update', 'price': '10.00'}
-        # response = self.app.post('/admin/products/9999/edit', data=update_data, follow_redirects=True)
-        # self.assertEqual(response.status_code, 404)
-        pass
+        """Editing a missing product is a 404."""
+        response = self.client.post('/admin/products/9999/edit', data={'name': 'Trying to update', 'price': '10.00'})
+        self.assertEqual(response.status_code, 404)
 
     def test_delete_product_success(self):
-        """
-        Test deleting an existing product.
-        Expected outcome: 200 OK (or redirect 302), product removed from DB.
-        Preconditions: Product exists, admin authentication.
-        """
-        # Example:
-        # with app.app_context():
-        #     p = Product(name='To Be Deleted', price=5.0, stock=1)
-        #     db.session.add(p)
-        #     db.session.commit()
-        #     product_id = p.id
-        #
-        #     response = self.app.post(f'/admin/products/{product_id}/delete', follow_redirects=True)
-        #     self.assertEqual(response.status_code, 200)
-        #     self.assertIn(b'Product "To Be Deleted" deleted successfully!', response.data)
-        #
-        #     deleted_product = Product.query.get(product_id)
-        #     self.assertIsNone(deleted_product)
-        pass
+        """Deleting a product removes it from the database."""
+        product_id = self.add_product(name='To Be Deleted')
+        response = self.client.post(f'/admin/products/{product_id}/delete', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Product &#34;To Be Deleted&#34; deleted successfully!', response.data)
+        self.assertIsNone(db.session.get(Product, product_id))
 
     def test_delete_nonexistent_product(self):
-        """
-        Test attempting to delete a non-existent product.
-        Expected outcome: 404 Not Found.
-        Preconditions: Admin authentication.
-        """
-        # Example:
-        # response = self.app.post('/admin/products/9999/delete', follow_redirects=True)
-        # self.assertEqual(response.status_code, 404)
-        pass
+        """Deleting a missing product is a 404."""
+        response = self.client.post('/admin/products/9999/delete')
+        self.assertEqual(response.status_code, 404)
 
 
-class TestShopRoutes(unittest.TestCase): # Replace unittest.TestCase with BaseTestCase if using above setup
+class TestShopRoutes(AppTestCase):
 
     def test_get_shop_product_list(self):
-        """
-        Test fetching the product list for the shop frontend.
-        Expected outcome: 200 OK, displays products.
-        Preconditions: Some products exist, some may be out of stock.
-        """
-        # Example:
-        # with app.app_context():
-        #     # Add a product in stock and one out of stock
-        #     Product.query.delete() # Clear existing products for cleaner test
-        #     p1 = Product(name='Available Product', price=20.0, stock=5)
-        #     p2 = Product(name='Sold Out Product', price=25.0, stock=0)
-        #     db.session.add_all([p1, p2])
-        #     db.session.commit()
-        #
-        # response = self.app.get('/products')
-        # self.assertEqual(response.status_code, 200)
-        # self.assertIn(b'Available Product', response.data)
-        # self.assertNotIn(b'Sold Out Product', response.data) # Assuming out-of-stock are not shown based on current route logic
-        pass
+        """The storefront lists products in stock and hides sold-out ones."""
+        self.add_product(name='Available Product', price=20.0, stock=5)
+        self.add_product(name='Sold Out Product', price=25.0, stock=0)
+        response = self.client.get('/products')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Available Product', response.data)
+        self.assertNotIn(b'Sold Out Product', response.data)
+
+    def test_listing_cache_is_invalidated_by_admin_writes(self):
+        """A cached listing reflects a product created afterwards in the admin."""
+        self.assertNotIn(b'Fresh Product', self.client.get('/products').data)
+        self.login()
+        self.client.post('/admin/products', data={'name': 'Fresh Product', 'price': '3', 'stock': '2'})
+        self.assertIn(b'Fresh Product', self.client.get('/products').data)
 
     def test_get_single_product_detail_success(self):
-        """
-        Test fetching a single product's details page.
-        Expected outcome: 200 OK, displays product information.
-        Preconditions: Product exists.
-        """
-        # Example:
-        # with app.app_context():
-        #     p = Product(name='Detailed Product', description='Details here', price=30.0, stock=3)
-        #     db.session.add(p)
-        #     db.session.commit()
-        #     product_id = p.id
-        #
-        # response = self.app.get(f'/products/{product_id}')
-        # self.assertEqual(response.status_code, 200)
-        # self.assertIn(b'Detailed Product', response.data)
-        # self.assertIn(b'Details here', response.data)
-        pass
+        """A product page shows the product's details."""
+        product_id = self.add_product(name='Detailed Product', description='Details here', price=30.0, stock=3)
+        response = self.client.get(f'/products/{product_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Detailed Product', response.data)
+        self.assertIn(b'Details here', response.data)
 
     def test_get_single_product_detail_nonexistent(self):
-        """
-        Test fetching a non-existent product's details page.
-        Expected outcome: 404 Not Found.
-        Preconditions: None specific, just an invalid ID.
-        """
-        # Example:
-        # response = self.app.get('/products/8888')
-        # self.assertEqual(response.status_code, 404)
-        pass
-
-# This allows running tests directly using `python shop_app/tests/test_routes.py`
-# However, it would require the Flask app and db to be properly set up and importable.
-# if __name__ == '__main__':
-#     unittest.main()
+        """A missing product page is a 404."""
+        response = self.client.get('/products/8888')
+        self.assertEqual(response.status_code, 404)
+
+    def test_search(self):
+        """Search matches word prefixes, ignoring accents."""
+        self.add_product(name='Cámara réflex', stock=2)
+        self.add_product(name='Teclado mecánico', stock=2)
+        response = self.client.get('/search?q=camar')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cámara réflex'.encode(), response.data)
+        self.assertNotIn(b'Teclado', response.data)
+
+
+class TestSearch(AppTestCase):
+    config = {'SEARCH_PAGE_SIZE': 2, 'SEARCH_MAX_PAGE': 3}
+
+    def names(self, text):
+        return [product.name for product in search_products(text, limit=10)]
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.add_product(name='Cámara réflex', stock=2)
+        self.add_product(name='Cámara compacta', stock=2)
+        self.add_product(name='Camaras de seguridad', stock=0)
+        self.assertEqual(sorted(self.names('cam')), ['Cámara compacta', 'Cámara réflex'])
+        self.assertEqual(self.names('CAMARA ref'), ['Cámara réflex'])
+        self.assertEqual(self.names('mara'), [])  # prefixes only, not substrings
+        self.assertEqual(self.names('réflex OR compacta'), [])  # operators are plain words
+        self.assertEqual(sorted(self.names('"cam*" :(')), ['Cámara compacta', 'Cámara réflex'])  # punctuation is inert
+        self.assertEqual(self.names('  ¿? '), [])
+        self.assertEqual(self.client.get('/search?q=%22%28').status_code, 200)
+
+    def test_name_hits_rank_above_description_hits(self):
+        self.add_product(name='Funda', description='Para el mouse inalámbrico', stock=1)
+        self.add_product(name='Mouse inalámbrico', stock=1)
+        self.assertEqual(self.names('mouse'), ['Mouse inalámbrico', 'Funda'])
+
+    def test_index_follows_updates_and_deletes(self):
+        product_id = self.add_product(name='Teclado mecánico', description='Switches azules', stock=3)
+        product = db.session.get(Product, product_id)
+        product.name = 'Teclado de membrana'
+        product.description = 'Silencioso'
+        db.session.commit()
+        self.assertEqual(self.names('mecánico'), [])
+        self.assertEqual(self.names('azules'), [])
+        self.assertEqual(self.names('membrana silencioso'), ['Teclado de membrana'])
+
+        product.stock = 0  # not indexed, but sold-out products are left out
+        db.session.commit()
+        self.assertEqual(self.names('membrana'), [])
+        product.stock = 1
+        db.session.commit()
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(self.names('membrana'), [])
+        self.assertEqual(db.session.execute(text('SELECT count(*) FROM product_fts')).scalar(), 0)
+
+    def test_pagination_edges(self):
+        for i in range(5):
+            self.add_product(name=f'Cable {i}', stock=1)
+        pages = {}
+        for page in ('1', '2', '3'):
+            response = self.client.get(f'/search?q=cable&page={page}')
+            self.assertEqual(response.status_code, 200)
+            pages[page] = [i for i in range(5) if f'Cable {i}'.encode() in response.data]
+            pages[page, 'next'] = b'rel="next"' in response.data
+        self.assertEqual([pages['1'], pages['2'], pages['3']], [[0, 1], [2, 3], [4]])
+        self.assertEqual([pages['1', 'next'], pages['2', 'next'], pages['3', 'next']], [True, True, False])
+
+        for page in ('0', '-4', 'x', ''):
+            self.assertIn(b'Cable 0', self.client.get(f'/search?q=cable&page={page}').data, page)
+        for page in ('4', str(2 ** 63), str(2 ** 70)):
+            self.assertEqual(self.client.get(f'/search?q=cable&page={page}').status_code, 400, page)
+
+    def test_no_next_link_past_the_last_allowed_page(self):
+        for i in range(8):
+            self.add_product(name=f'Cable {i}', stock=1)
+        response = self.client.get('/search?q=cable&page=3')
+        self.assertIn(b'Cable 5', response.data)
+        self.assertNotIn(b'rel="next"', response.data)
+
+
+class TestAppFactory(unittest.TestCase):
+
+    def test_apps_are_isolated(self):
+        """Each app gets its own configuration, page cache, metrics and in-memory database."""
+        first = create_app(dict(TEST_CONFIG, SHOP_PAGE_SIZE=5, PAGE_CACHE_MAX_ENTRIES=5, INSTRUMENTATION_ENABLED=True))
+        second = create_app(TEST_CONFIG)
+        self.assertEqual(first.config['SHOP_PAGE_SIZE'], 5)
+        self.assertEqual(second.config['SHOP_PAGE_SIZE'], 24)
+        self.assertEqual(first.extensions['page_cache'].max_entries, 5)
+        self.assertEqual(second.extensions['page_cache'].max_entries, 512)
+        self.assertIn('metrics', first.extensions)
+        self.assertNotIn('metrics', second.extensions)
+        with first.app_context():
+            db.create_all()
+            db.session.add(Product(name='Only in first', price=1.0, stock=1))
+            db.session.commit()
+        with second.app_context():
+            db.create_all()
+            self.assertEqual(Product.query.count(), 0)
+        with first.app_context():
+            self.assertEqual(Product.query.count(), 1)
+            db.drop_all()
+        with second.app_context():
+            db.drop_all()
+
+    def test_startup_defers_heavy_imports(self):
+        """Building the app outside the flask CLI loads neither Flask-Migrate/Alembic nor Pillow."""
+        probe = ("import sys; from app import create_app; create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'}); "
+                 "print(sorted(m for m in ('flask_migrate', 'alembic', 'PIL') if m in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
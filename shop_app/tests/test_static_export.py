@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product
+import static_export
+from support import AppTestCase
+
+
+class TestStaticExport(AppTestCase):
+
+    def app_config(self):
+        self.tmp = self.make_tmp()
+        self.out = os.path.join(self.tmp, 'site')
+        return {'SHOP_PAGE_SIZE': 1, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(self.tmp, "shop.db")}'}
+
+    def setUp(self):
+        super().setUp()
+        self.app.static_folder = os.path.join(self.tmp, 'static')
+        os.makedirs(os.path.join(self.app.static_folder, 'css'))
+        with open(os.path.join(self.app.static_folder, 'css', 'shop.css'), 'w') as f:
+            f.write('body {}')
+        db.session.add_all([Product(name='Mug', price=5, stock=2), Product(name='Tea', price=2, stock=1),
+                            Product(name='Gone', price=1, stock=0)])
+        db.session.commit()
+
+    def export(self, workers=1):
+        return static_export.export_static(self.app, self.out, 'https://example.com/shop/', workers=workers)
+
+    def read(self, *path):
+        with open(os.path.join(self.out, *path)) as f:
+            return f.read()
+
+    def test_export_renders_pages_sitemap_and_feed(self):
+        self.assertEqual(self.export(), {'products': 3, 'listing_pages': 2, 'deleted': 0, 'unchanged': 0})
+        self.assertIn('Out of Stock', self.read('products', '3', 'index.html'))
+        first = self.read('index.html')
+        self.assertIn('Mug', first)
+        self.assertIn('href="/shop/products/1"', first)
+        self.assertIn('href="https://example.com/shop/products/page/2/"', first)
+        self.assertIn('Tea', self.read('products', 'page', '2', 'index.html'))
+        self.assertEqual(self.read('products', 'index.html'), first)
+        self.assertIn('<loc>https://example.com/shop/products/2</loc>', self.read('sitemap.xml'))
+        feed = json.loads(self.read('products.json'))['products']
+        self.assertEqual([(p['id'], p['price']) for p in feed], [(1, 5.0), (2, 2.0), (3, 1.0)])
+        self.assertEqual(self.read('static', 'css', 'shop.css'), 'body {}')
+
+    def test_only_changed_products_are_rendered_again(self):
+        self.export()
+        self.assertEqual(self.export()['unchanged'], 5)
+
+        db.session.get(Product, 2).price = 3
+        db.session.commit()
+        self.assertEqual(self.export(), {'products': 1, 'listing_pages': 1, 'deleted': 0, 'unchanged': 3})
+        self.assertIn('$3.00', self.read('products', 'page', '2', 'index.html'))
+
+        db.session.delete(db.session.get(Product, 2))
+        db.session.commit()
+        report = self.export()
+        self.assertEqual((report['deleted'], report['listing_pages']), (1, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.out, 'products', '2')))
+        self.assertFalse(os.path.exists(os.path.join(self.out, 'products', 'page', '2')))
+
+    def test_pages_are_rendered_in_a_process_pool(self):
+        self.app.config['SHOP_PAGE_SIZE'] = 24
+        static_export.BATCH_SIZE, batch_size = 1, static_export.BATCH_SIZE
+        try:
+            self.assertEqual(self.export(workers=2)['products'], 3)
+        finally:
+            static_export.BATCH_SIZE = batch_size
+        self.assertIn('Tea', self.read('products', '2', 'index.html'))
+        self.assertIn('Tea', self.read('index.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import io
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Product, Task
+import images
+import tasks
+from support import AppTestCase
+
+calls = []
+
+
+@tasks.handler('test_flaky')
+def flaky(app, fail_times=0):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError(f'boom {len(calls)}')
+    return {'calls': len(calls)}
+
+
+class TestTaskQueue(AppTestCase):
+
+    config = {'TASK_MAX_ATTEMPTS': 3, 'TASK_BACKOFF': 10}
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def make_due(self):
+        db.session.execute(db.update(Task).values(run_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+    def test_idempotency_key_dedupes_pending_tasks(self):
+        first = tasks.enqueue('test_flaky', key='k')
+        self.assertIs(tasks.enqueue('test_flaky', key='k'), first)
+        db.session.commit()
+        self.assertEqual(tasks.work(self.app, burst=True), 1)
+        # Once the first one is done, the key is free again
+        self.assertIsNot(tasks.enqueue('test_flaky', key='k'), first)
+        db.session.commit()
+        self.assertEqual(Task.query.count(), 2)
+
+    def test_task_rolls_back_with_the_callers_transaction(self):
+        tasks.enqueue('test_flaky')
+        db.session.rollback()
+        self.assertEqual(Task.query.count(), 0)
+        with self.assertRaises(LookupError):
+            tasks.enqueue('no_such_task')
+
+    def test_failures_are_retried_with_backoff(self):
+        """A failing task goes back to the queue later; it succeeds on the next attempt."""
+        task = tasks.enqueue('test_flaky', {'fail_times': 1})
+        db.session.commit()
+        task_id = task.id
+        tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        self.assertEqual((task.status, task.attempts), ('queued', 1))
+        self.assertIn('boom 1', task.last_error)
+        self.assertGreater(task.run_at, datetime.utcnow() + timedelta(seconds=4))
+        self.assertEqual(tasks.work(self.app, burst=True), 0)  # not due yet
+
+        self.make_due()
+        tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        self.assertEqual((task.status, task.attempts, task.result), ('done', 2, {'calls': 2}))
+
+    def test_exhausted_tasks_fail_and_can_be_retried(self):
+        task = tasks.enqueue('test_flaky', {'fail_times': 3})
+        db.session.commit()
+        task_id = task.id
+        for _ in range(3):
+            self.make_due()
+            tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        self.assertEqual((task.status, task.attempts), ('failed', 3))
+        self.assertEqual(tasks.status_counts()['failed'], 1)
+
+        self.assertTrue(tasks.retry(task_id))
+        tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        self.assertEqual(task.status, 'done')
+        self.assertFalse(tasks.retry(task_id))
+
+    def test_expired_lease_is_claimed_again(self):
+        """A task left running by a dead worker is picked up once its lease runs out."""
+        task = tasks.enqueue('test_flaky')
+        db.session.commit()
+        task_id = task.id
+        self.assertEqual(tasks.claim('dead-worker', lease=60).id, task_id)
+        self.assertIsNone(tasks.claim('other', lease=60))
+        db.session.execute(db.update(Task).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        self.assertEqual(tasks.work(self.app, burst=True), 1)
+        db.session.expire_all()
+        self.assertEqual((task.status, task.attempts, task.locked_by), ('done', 2, None))
+
+    def test_task_that_keeps_killing_its_worker_fails_after_max_attempts(self):
+        """Each attempt's lease expires (the worker died): the task is reclaimed until its attempts run out."""
+        task = tasks.enqueue('test_flaky')  # TASK_MAX_ATTEMPTS = 3
+        db.session.commit()
+        task_id = task.id
+        expire = lambda: (db.session.execute(db.update(Task).where(Task.status == 'running')
+                                             .values(locked_until=datetime.utcnow() - timedelta(seconds=1))),
+                          db.session.commit())
+        for attempt in range(1, 4):
+            task = tasks.claim(f'worker-{attempt}', lease=60)
+            self.assertEqual((task.id, task.attempts), (task_id, attempt))
+            self.assertEqual(task.last_error, tasks.LEASE_EXPIRED if attempt > 1 else None)
+            expire()
+        self.assertIsNone(tasks.claim('worker-4', lease=60))
+        db.session.expire_all()
+        task = db.session.get(Task, task_id)
+        self.assertEqual((task.status, task.attempts, task.locked_by, task.last_error),
+                         ('failed', 3, None, tasks.LEASE_EXPIRED))
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(calls, [])
+
+
+class TestQueuedAdminWork(AppTestCase):
+
+    admin = True
+
+    def app_config(self):
+        self.tmp = self.make_tmp()
+        return {'FX_PROVIDER': 'static', 'FX_STATIC_RATES': {'USD': 3.75}, 'FX_CACHE_FILE': os.path.join(self.tmp, 'fx.json')}
+
+    def setUp(self):
+        super().setUp()
+        self.app.instance_path = os.path.join(self.tmp, 'instance')
+        self.app.static_folder = os.path.join(self.tmp, 'static')
+
+    def test_reprice_is_queued_once_and_run_by_the_worker(self):
+        db.session.add(Product(name='P', price=1, stock=1, cost_price=100, cost_currency='PEN'))
+        db.session.commit()
+        for _ in range(2):
+            self.assertEqual(self.client.post('/admin/pricing/reprice').status_code, 302)
+        self.assertEqual(Task.query.filter_by(name='reprice', status='queued').count(), 1)
+        self.assertEqual(db.session.get(Product, 1).price, 1)
+        self.assertIn(b'No exchange rates fetched yet', self.client.get('/admin/pricing').data)
+
+        tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, 1).price, 172)  # 100 × 1.18 × 1.45 = 171.1, rounded up
+        page = self.client.get('/admin/pricing').data
+        self.assertIn(b'1 products repriced', page)
+        self.assertIn(b'<td>3.75</td>', page)
+        self.assertEqual(self.client.get('/admin/tasks').status_code, 200)
+
+    @unittest.skipIf(images._pillow() is None, 'Pillow is not installed')
+    def test_uploaded_image_is_processed_by_the_worker(self):
+        Image, _ = images._pillow()
+        upload = io.BytesIO()
+        Image.new('RGB', (400, 300), 'red').save(upload, 'PNG')
+        upload.seek(0)
+        response = self.client.post('/admin/products', data={
+            'name': 'Mug', 'price': '5', 'stock': '1', 'image_file': (upload, 'mug.png')},
+            content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+        task = Task.query.one()
+        self.assertEqual(task.name, 'product_image')
+        self.assertIsNone(db.session.get(Product, 1).image_key)
+        self.assertEqual(self.client.get('/products/1').status_code, 200)  # cached before the variants exist
+
+        tasks.work(self.app, burst=True)
+        db.session.expire_all()
+        product = db.session.get(Product, 1)
+        self.assertEqual(product.image_variant_widths, [320, 400])
+        self.assertEqual(product.version, 2)
+        self.assertIn(product.image_key.encode(), self.client.get('/products/1').data)
+        self.assertEqual(os.listdir(os.path.join(self.app.instance_path, images.SPOOL_SUBDIR)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validators import ProductValidationError, parse_product_data
+
+
+class TestParseProductData(unittest.TestCase):
+
+    def test_form_strings_are_converted(self):
+        values = parse_product_data({'name': 'Mouse', 'price': '19.90', 'stock': '', 'image_url': None})
+        self.assertEqual(values, {'name': 'Mouse', 'description': '', 'price': Decimal('19.90'), 'stock': 0, 'image_url': ''})
+
+    def test_json_numbers_are_accepted(self):
+        """NDJSON rows carry real numbers; a price of 0 is present, not missing."""
+        values = parse_product_data({'name': 'Gift', 'price': 0, 'stock': 3})
+        self.assertEqual((values['price'], values['stock']), (Decimal('0.00'), 3))
+
+    def test_missing_and_malformed_values(self):
+        with self.assertRaisesRegex(ProductValidationError, 'required'):
+            parse_product_data({'price': '1'})
+        with self.assertRaisesRegex(ProductValidationError, 'valid numbers'):
+            parse_product_data({'name': 'Mouse', 'price': 'abc'})
+        with self.assertRaisesRegex(ProductValidationError, 'valid numbers'):
+            parse_product_data({'name': 'Mouse', 'price': '1', 'stock': '2.5'})
+
+    def test_pricing_fields_are_optional(self):
+        """Repricing columns are returned only when given; blanks clear the cost and restore the IGV default."""
+        values = parse_product_data({'name': 'Mouse', 'price': '1', 'cost_price': '', 'cost_currency': 'pen',
+                                     'margin': '40', 'igv_rate': ''})
+        self.assertEqual((values['cost_price'], values['cost_currency'], values['margin'], values['igv_rate']),
+                         (None, 'PEN', 40.0, 18.0))
+        with self.assertRaisesRegex(ProductValidationError, 'three-letter'):
+            parse_product_data({'name': 'Mouse', 'price': '1', 'cost_currency': 'dollars'})
+
+
+if __name__ == '__main__':
+    unittest.main()
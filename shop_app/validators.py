@@ -0,0 +1,91 @@
+# Validation shared by the admin form, bulk import and the JSON APIs
+import re
+
+from models import DEFAULT_IGV_RATE
+from money import to_decimal
+
+_CURRENCY = re.compile(r'^[A-Z]{3}$')
+
+MAX_INTEGER = 2 ** 63 - 1  # the largest integer SQLite stores; bigger ones fail with OverflowError
+
+
+class ProductValidationError(ValueError):
+    pass
+
+
+def _missing(value):
+    return value is None or value == ''
+
+
+def parse_product_data(data):
+    """Validate a product mapping (form, CSV row or JSON object) and return clean column values.
+
+    Raises ``ProductValidationError`` with the same messages the admin form flashes.
+    """
+    if _missing(data.get('name')) or _missing(data.get('price')):
+        raise ProductValidationError('Name and Price are required fields.')
+    try:
+        price = to_decimal(data['price'])
+        stock = int(data.get('stock', 0) or 0)
+    except (TypeError, ValueError):
+        raise ProductValidationError('Invalid price or stock format. Please enter valid numbers.')
+    if abs(stock) > MAX_INTEGER:
+        raise ProductValidationError('Stock is out of range.')
+    return {
+        'name': data['name'],
+        'description': data.get('description', '') or '',
+        'price': price,
+        'stock': stock,
+        'image_url': data.get('image_url', '') or '',
+        **parse_pricing_data(data),
+        **parse_taxonomy_data(data),
+    }
+
+
+def parse_pricing_data(data):
+    """Validate the optional repricing inputs (``cost_price``, ``cost_currency``, ``margin``, ``igv_rate``).
+
+    Only keys present in ``data`` are returned, so an import without them leaves
+    them untouched. An empty cost price stops repricing the product, an empty
+    margin falls back to the default one and an empty IGV rate means 18%.
+    """
+    values = {}
+    try:
+        if 'cost_price' in data:
+            values['cost_price'] = None if _missing(data['cost_price']) else to_decimal(data['cost_price'])
+        for field in ('margin', 'igv_rate'):
+            if field in data:
+                values[field] = None if _missing(data[field]) else float(data[field])
+    except (TypeError, ValueError):
+        raise ProductValidationError('Cost price, margin and IGV must be numbers.')
+    if values.get('cost_price') is not None and values['cost_price'] < 0:
+        raise ProductValidationError('Cost price cannot be negative.')
+    if 'igv_rate' in values and values['igv_rate'] is None:
+        values['igv_rate'] = DEFAULT_IGV_RATE
+    if 'cost_currency' in data:
+        currency = str(data['cost_currency'] or 'USD').strip().upper()
+        if not _CURRENCY.match(currency):
+            raise ProductValidationError('Currency must be a three-letter code such as USD or PEN.')
+        values['cost_currency'] = currency
+    return values
+
+
+TAXONOMY_FIELDS = ('category_id', 'subcategory_id', 'brand_id')
+
+
+def parse_taxonomy_data(data):
+    """Validate the optional ``category_id``, ``subcategory_id`` and ``brand_id``; empty means none.
+
+    Like the pricing inputs, only keys present in ``data`` are returned.
+    Whether the ids exist is checked against the database in ``facets.check_taxonomy``.
+    """
+    values = {}
+    for field in TAXONOMY_FIELDS:
+        if field in data:
+            try:
+                values[field] = None if _missing(data[field]) else int(data[field])
+            except (TypeError, ValueError):
+                raise ProductValidationError('Category, subcategory and brand must be chosen from the lists.')
+            if values[field] is not None and not 0 < values[field] <= MAX_INTEGER:
+                raise ProductValidationError('Category, subcategory and brand must be chosen from the lists.')
+    return values